@@ -7,22 +7,39 @@ import uuid
 import uvicorn
 import os
 
-from core.memory import get_session, update_session, clear_session, add_message
+from core.memory import load_session, clear_session, append_message, save_conversation, save_summary, history_writer, SESSIONS, start_session_sweeper, stop_session_sweeper
 from core.neuro_engine import neuro_engine
 from core.retriever import retriever
-from core.signals import extract_signals
-from core.database import init_db, get_db_connection
+from core.context_compression import context_compressor
+from core.partitions import route
+from core.turn_context import build_turn_context
+from core.resources import run_cpu, shared
+from core.streaming import sse_event
+from core.rolling_memory import rolling_memory
+from core.summary_jobs import SummaryJobQueue, SummaryJobStore
+from core.llm_client import llm_client, Deadline
+from core.database import ainit_db, close_pool
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     try:
-        init_db()
+        await ainit_db()
         print("Database initialized successfully")
     except Exception as e:
         print(f"DB Init failed: {e}")
+    await history_writer.start()
+    await summary_jobs.start()
+    start_session_sweeper()
     yield
-    # Shutdown (if needed)
+    # Shutdown: persist evicted sessions and flush queued history writes
+    # before the pool goes away
+    await rolling_memory.stop()
+    await summary_jobs.stop()
+    await stop_session_sweeper()
+    await history_writer.stop()
+    await llm_client.aclose()
+    close_pool()
 
 app = FastAPI(title="Attrangi Backend", version="2.0", lifespan=lifespan)
 
@@ -35,16 +52,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Session ids are UUIDs (v2_chat_history.id); anything else is rejected with a 422
+# before it can reach a write-behind batch shared with other sessions
 class ChatRequest(BaseModel):
-    session_id: str
+    session_id: uuid.UUID
     message: str
 
 class SummaryRequest(BaseModel):
-    session_id: str
+    session_id: uuid.UUID
 
 import asyncio
 import logging
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
 # Configure logger
 logging.basicConfig(level=logging.INFO)
@@ -54,71 +73,154 @@ logger = logging.getLogger(__name__)
 import os
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
-def use_rag(msg):
-    """Simple heuristic to skip RAG for conversational messages."""
+# 25 seconds timeout to beat Cloudflare's limit
+CHAT_TIMEOUT_SECONDS = 25.0
+
+def use_rag(msg_lower):
+    """Simple heuristic to skip RAG for conversational messages (expects lowered text)."""
     keywords = ["explain", "what is", "how does", "define", "document", "help me understand"]
-    return any(k in msg.lower() for k in keywords)
+    return any(k in msg_lower for k in keywords)
 
-async def process_chat(session_id: str, user_message: str):
-    # 1. Get Session
-    session = get_session(session_id)
-    
-    # 2. Extract Signals (modifies session['signals'] in place with decay)
-    extract_signals(user_message, session, model=neuro_engine.embedding_model)
-    
-    current_signals = session.get("signals", {})
-    
-    # Update stage based on signals
-    signal_score = sum(current_signals.values())
-    if signal_score >= 5:
-        stage = "synthesis"
-    elif signal_score >= 2:
-        stage = "exploration"
-    else:
-        stage = "opening"
+def prepare_turn(user_message: str, session_signals=None):
+    """Blocking part of a turn: embed the message once, retrieve and compress context."""
+    turn = build_turn_context(user_message, neuro_engine.embedding_model)
     
-    update_session(session_id, {"signals": current_signals, "stage": stage})
-    session = get_session(session_id)  # Refresh session with updated stage
-    
-    # 3. Retrieve Context
     # Optimization: Skip RAG for short messages OR messages not asking for info
     # User's logic: if len(split) < 6 OR not use_rag(msg) --> skip
-    if len(user_message.split()) < 6 or not use_rag(user_message):
+    if len(turn.tokens) < 6 or not use_rag(turn.text_lower):
         context_chunks = []
     else:
-        context_chunks = retriever.retrieve(user_message)
+        # Search only the partitions matching the question's topic or the session's dominant signals
+        domains = route(turn.text_lower, session_signals)
+        hits = retriever.search(user_message, embedding=turn.embedding, domains=domains)
+        # Only the query-relevant sentences of each chunk reach the prompt
+        context_chunks = context_compressor.compress(hits, turn.embedding)
+    return turn, context_chunks
+
+async def process_chat(session_id: str, user_message: str, deadline: Deadline):
+    # 1. Get Session (rehydrated from the DB on a local miss)
+    session = await load_session(session_id)
     
-    # 4. Update Memory (User message -> DB)
-    add_message(session_id, "user", user_message)
+    # 2-3. Turn Context + Retrieval, on the model executor (CPU-bound).
+    # The message is embedded once for signals, mode and retrieval;
+    # signal extraction and stage updates happen once, inside the engine.
+    turn, context_chunks = await run_cpu(prepare_turn, user_message, dict(session.get("signals", {})))
+    
+    # 4. Update Memory (persisted together with the reply below)
+    append_message(session_id, "user", user_message)
 
-    # 5. Generate Response
-    bot_response = neuro_engine.generate_response(
+    # 5. Generate Response (awaits the LLM without blocking other sessions)
+    bot_response = await neuro_engine.agenerate_response(
         message=user_message,
         context=context_chunks,
-        session_state=session
+        session_state=session,
+        turn=turn,
+        deadline=deadline
     )
     
     # Handle response logic
     reply = bot_response.get("reply") if isinstance(bot_response, dict) else bot_response.reply
     expression = bot_response.get("expression") if isinstance(bot_response, dict) else bot_response.expression
     
-    add_message(session_id, "assistant", reply)
+    append_message(session_id, "assistant", reply)
+    
+    # Queued for the write-behind flush; both messages go out in the same batch
+    await save_conversation(session_id)
+    # Every few turns, fold the new messages into the rolling memory (background)
+    rolling_memory.schedule(session_id, session)
     
     return {
         "reply": reply,
         "expression": expression
     }
 
+# Saves of streamed turns, held so they finish even if the stream is torn down
+_stream_saves = set()
+
+async def save_turn(session_id: str, session: dict):
+    await save_conversation(session_id)
+    rolling_memory.schedule(session_id, session)
+
+async def stream_chat(session_id: str, user_message: str):
+    """
+    SSE body for /chat/stream: `token` events as they arrive, then one `expression` event.
+
+    The token stream is bounded by the turn's Deadline (checked per chunk by
+    the LLM client), not by a timeout held across the yields below. The
+    reply, or whatever part of it was produced, is saved even when the
+    client disconnects or the stream fails.
+    """
+    deadline = Deadline(CHAT_TIMEOUT_SECONDS)
+    try:
+        # No yields inside: the timeout only covers session load and retrieval
+        async with asyncio.timeout(deadline.remaining()):
+            session = await load_session(session_id)
+            turn, context_chunks = await run_cpu(prepare_turn, user_message, dict(session.get("signals", {})))
+    except TimeoutError:
+        logger.error("Streaming request timed out")
+        yield sse_event("error", {"error": "Response timed out. Please try again."})
+        return
+    except Exception:
+        logger.exception("Chat stream failed")
+        yield sse_event("error", {"error": "Internal server error. Please retry."})
+        return
+
+    append_message(session_id, "user", user_message)
+    tokens, result, saved = [], None, False
+    try:
+        async for event, data in neuro_engine.astream_response(
+            message=user_message,
+            context=context_chunks,
+            session_state=session,
+            turn=turn,
+            deadline=deadline
+        ):
+            if event == "token":
+                tokens.append(data)
+                yield sse_event("token", {"text": data})
+            else:
+                result = data
+
+        # Persist once the stream has completed, as in the non-streaming path
+        append_message(session_id, "assistant", result["reply"])
+        saved = True
+        await save_turn(session_id, session)
+
+        # Final event: the parsed expression (plus the full reply for convenience)
+        yield sse_event("expression", {"expression": result["expression"], "reply": result["reply"]})
+    except Exception:
+        logger.exception("Chat stream failed")
+        yield sse_event("error", {"error": "Internal server error. Please retry."})
+    finally:
+        if not saved:
+            # Cut short (disconnect, cancellation, error): keep what the user saw
+            reply = "".join(tokens).strip()
+            if reply:
+                append_message(session_id, "assistant", reply)
+            task = asyncio.create_task(save_turn(session_id, session))
+            _stream_saves.add(task)
+            task.add_done_callback(_stream_saves.discard)
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    return StreamingResponse(
+        stream_chat(str(request.session_id), request.message),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.post("/chat")
 async def chat_endpoint(request: ChatRequest):
-    session_id = request.session_id
+    session_id = str(request.session_id)
     user_message = request.message
+    # LLM attempts and retries are fitted into what is left of this budget
+    deadline = Deadline(CHAT_TIMEOUT_SECONDS)
     
     try:
         # Wrap the processing in a timeout block
         return await asyncio.wait_for(
-            process_chat(session_id, user_message),
-            timeout=25.0 # 25 seconds timeout to beat Cloudflare's limit
+            process_chat(session_id, user_message, deadline),
+            timeout=CHAT_TIMEOUT_SECONDS
         )
     except asyncio.TimeoutError:
         logger.error("Request timed out")
@@ -133,38 +235,80 @@ async def chat_endpoint(request: ChatRequest):
             content={"error": "Internal server error. Please retry."}
         )
 
-@app.post("/summary")
+async def run_summary_job(session_id: str, conversation: list):
+    """Summary job body: generate the report and persist it to v2_chat_history."""
+    summary_text = await neuro_engine.agenerate_summary(conversation, raise_errors=True)
+    await save_summary(session_id, summary_text)
+    return summary_text
+
+summary_jobs = SummaryJobQueue(run_summary_job, store=SummaryJobStore())
+
+# Longest a status request may wait for a job to finish (long polling)
+SUMMARY_MAX_WAIT_SECONDS = 25.0
+
+@app.post("/summary", status_code=202)
 async def summary_endpoint(request: SummaryRequest):
-    session_id = request.session_id
-    session = get_session(session_id)
+    session_id = str(request.session_id)
+    # Rehydrates from the persisted message log after a restart or on another worker
+    session = await load_session(session_id)
     
     conversation = session.get("conversation", [])
     if not conversation:
         return {"status": "No conversation to summarize"}
         
-    # Generate Summary
-    summary_text = neuro_engine.generate_summary(conversation)
-    
-    # SAVE to DB
+    # Queue the report; repeated requests for the same conversation share one job
+    version = (session.get("history_start", 0), len(conversation))
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Update summary in the single table
-        cur.execute("UPDATE v2_chat_history SET summary = %s WHERE id = %s", (summary_text, session_id))
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        
-        return {"status": "success", "summary": summary_text}
-        
-    except Exception as e:
-        print(f"DB Error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        job, _ = await summary_jobs.submit(session_id, version, conversation)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return job.to_dict()
+
+@app.get("/summary/{job_id}")
+async def summary_status_endpoint(job_id: uuid.UUID, wait: float = 0.0):
+    """Job status; with ?wait=N, holds the request up to N seconds for the job to finish."""
+    job = await summary_jobs.get(str(job_id))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown summary job")
+    if wait > 0:
+        await summary_jobs.wait(job, min(wait, SUMMARY_MAX_WAIT_SECONDS))
+    return job.to_dict()
+
+@app.get("/summary/{job_id}/events")
+async def summary_events_endpoint(job_id: uuid.UUID):
+    """SSE: a `status` event now, `ping`s while running, then one `done` or `error` event."""
+    job = await summary_jobs.get(str(job_id))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown summary job")
+
+    async def events():
+        yield sse_event("status", job.to_dict())
+        while not job.done.is_set():
+            await summary_jobs.wait(job, 10.0)
+            if not job.done.is_set():
+                yield sse_event("ping", {"status": job.status})
+        yield sse_event("done" if job.status == "done" else "error", job.to_dict())
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return {
+        "sessions": SESSIONS.metrics(),
+        "history_writer": history_writer.metrics(),
+        "embedding_service": shared.embedder.metrics(),
+        "retriever": retriever.metrics(),
+        "context_compression": context_compressor.metrics(),
+        "prompt": neuro_engine.prompt_builder.metrics(),
+        "rolling_memory": rolling_memory.metrics(),
+        "summary": neuro_engine.report_summarizer.metrics(),
+        "summary_jobs": summary_jobs.metrics(),
+        "llm": llm_client.metrics(),
+        "router": neuro_engine.router.metrics(),
+    }
 
 class ResetRequest(BaseModel):
-    session_id: str
+    session_id: uuid.UUID
 
 @app.post("/reset")
 async def reset_endpoint(request: ResetRequest = Body(...)): 
@@ -178,8 +322,8 @@ async def reset_endpoint(request: ResetRequest = Body(...)):
     # Using ChatRequest or customized model. Let's assume input matches request for session_id.
     # If the user meant global reset, that's dangerous. Let's assume session-specific.
     
-    session_id = request.session_id
-    clear_session(session_id)
+    session_id = str(request.session_id)
+    await clear_session(session_id)
     return {"status": "cleared"}
 
 if __name__ == "__main__":
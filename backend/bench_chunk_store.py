@@ -0,0 +1,82 @@
+"""
+Startup time / RSS of the memory-mapped chunk store vs the legacy JSON store.
+
+    python bench_chunk_store.py --scale 1 10 50
+
+Builds both formats from vector_store/mental_health.chunks, replicated
+`scale` times to simulate a larger corpus, then opens each in a fresh
+process and fetches top_k=2 chunks for a batch of random ids.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+import subprocess
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from core.chunk_store import ChunkStore, JsonChunkStore
+
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vector_store", "mental_health.chunks")
+
+def build(workdir, scale):
+    src = ChunkStore(SOURCE)
+    texts = list(src) * scale
+    meta = [src.meta(i) for i in range(len(src))] * scale
+    src.close()
+    json_path = os.path.join(workdir, f"store_x{scale}.json")
+    chunks_path = os.path.join(workdir, f"store_x{scale}.chunks")
+    with open(json_path, "w") as f:
+        json.dump({"texts": texts, "meta": meta}, f)
+    ChunkStore.write(chunks_path, texts, meta)
+    return {"json": json_path, "mmap": chunks_path}
+
+def measure(kind, path, queries):
+    """Runs inside a fresh process."""
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    store = ChunkStore(path) if kind == "mmap" else JsonChunkStore(path)
+    open_ms = (time.perf_counter() - start) * 1000
+
+    rng = random.Random(0)
+    t = time.perf_counter()
+    for _ in range(queries):
+        store.get([rng.randrange(len(store)), rng.randrange(len(store))])
+    fetch_us = (time.perf_counter() - t) / queries * 1e6
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "kind": kind,
+        "chunks": len(store),
+        "file_mb": round(os.path.getsize(path) / 1e6, 2),
+        "open_ms": round(open_ms, 2),
+        "fetch_us": round(fetch_us, 2),
+        "rss_delta_mb": round((rss_after - rss_before) / 1024, 1),  # KiB on Linux
+    }))
+
+def main(scales, queries):
+    with tempfile.TemporaryDirectory() as workdir:
+        for scale in scales:
+            paths = build(workdir, scale)
+            for kind, path in paths.items():
+                out = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--measure", kind, path, "--queries", str(queries)],
+                    capture_output=True, text=True, check=True,
+                )
+                r = json.loads(out.stdout.strip().splitlines()[-1])
+                print(f"  x{scale:<3} {r['kind']:<4} chunks={r['chunks']:<6} file={r['file_mb']:7.2f}MB  "
+                      f"open={r['open_ms']:8.2f}ms  fetch={r['fetch_us']:6.2f}us  rss_delta={r['rss_delta_mb']:7.1f}MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", nargs="+", type=int, default=[1, 10])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--measure", nargs=2, metavar=("KIND", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        measure(args.measure[0], args.measure[1], args.queries)
+    else:
+        main(args.scale, args.queries)
@@ -0,0 +1,140 @@
+"""
+Parity harness + latency/RSS benchmark for the embedding inference backends.
+
+    python bench_embedding_backends.py                 # parity int8 vs fp32, then latency/RSS per backend
+    python bench_embedding_backends.py --backends fp32 int8 --repeat 50
+
+Parity compares, on a fixed message set, the int8 embeddings against fp32:
+cosine between the two vectors, prototype score drift, signal hits,
+response-mode decisions and top-k retrieval ids. Latency and peak RSS are
+measured in a fresh subprocess per backend so the numbers don't mix.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from core.resources import load_embedding_model, EMBEDDING_BACKENDS
+from core import signals
+
+MESSAGES = [
+    "hi",
+    "ok",
+    "thank you",
+    "idk",
+    "I have been so overwhelmed with work lately",
+    "why does this keep happening to me, just answer",
+    "I can't sleep and I wake up at 3am every night",
+    "honestly I'm not sure what I'm feeling, maybe confused",
+    "I feel empty and nothing seems to matter anymore",
+    "I'm worried about my exams and keep panicking",
+    "I'm so angry at my brother I could scream, I just want someone to listen",
+    "what is generalized anxiety disorder and how does it differ from stress",
+    "explain the difference between ADHD and just being distracted",
+    "I've been exhausted all the time, no energy even after sleeping",
+    "I am going to hurt him if he says that again",
+    "I don't really know why I'm telling you this but I feel lonely",
+]
+
+def encode(model, texts):
+    return np.asarray(model.encode(texts, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False))
+
+def decisions(embeddings, model):
+    bank = signals.PrototypeBank(signals.SIGNAL_PROTOTYPES, signals.RESPONSE_MODE_PROTOTYPES, signals.THRESHOLDS)
+    scores = bank.classify(embeddings, model)
+    return scores, bank.best_modes(scores)
+
+def parity(candidate="int8", k=2):
+    reference_model = load_embedding_model("fp32")
+    candidate_model = load_embedding_model(candidate)
+    ref = encode(reference_model, MESSAGES)
+    cand = encode(candidate_model, MESSAGES)
+
+    cosines = np.sum(ref * cand, axis=1)
+    ref_scores, ref_modes = decisions(ref, reference_model)
+    cand_scores, cand_modes = decisions(cand, candidate_model)
+    score_drift = np.abs(np.concatenate([ref_scores.signal_scores - cand_scores.signal_scores,
+                                         ref_scores.mode_scores - cand_scores.mode_scores], axis=1))
+    hit_flips = int(np.sum(ref_scores.signal_hits != cand_scores.signal_hits))
+    mode_flips = sum(a != b for a, b in zip(ref_modes, cand_modes))
+
+    print(f"parity {candidate} vs fp32 on {len(MESSAGES)} messages")
+    print(f"  embedding cosine      min={cosines.min():.4f}  mean={cosines.mean():.4f}")
+    print(f"  prototype score drift max={score_drift.max():.4f}  mean={score_drift.mean():.4f}")
+    print(f"  signal hit flips      {hit_flips}/{ref_scores.signal_hits.size}")
+    print(f"  response mode flips   {mode_flips}/{len(MESSAGES)}")
+    for msg, a, b in zip(MESSAGES, ref_modes, cand_modes):
+        if a != b:
+            print(f"    {msg!r}: fp32={a} {candidate}={b}")
+
+    try:
+        from core.retriever import retriever
+        if retriever.index is not None:
+            _, ref_ids = retriever.index.search(ref.astype("float32"), k)
+            _, cand_ids = retriever.index.search(cand.astype("float32"), k)
+            overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_ids, cand_ids)])
+            print(f"  retrieval top-{k} overlap {overlap:.3f}")
+    except Exception as e:
+        print(f"  retrieval parity skipped: {e}")
+
+def measure(backend, repeat):
+    """Runs inside a fresh process: load time, per-message latency, peak RSS."""
+    start = time.perf_counter()
+    model = load_embedding_model(backend)
+    load_s = time.perf_counter() - start
+    encode(model, MESSAGES)  # warm-up
+
+    single = []
+    for _ in range(repeat):
+        for m in MESSAGES:
+            t = time.perf_counter()
+            encode(model, [m])
+            single.append(time.perf_counter() - t)
+    t = time.perf_counter()
+    for _ in range(repeat):
+        encode(model, MESSAGES)
+    batch_per_msg = (time.perf_counter() - t) / (repeat * len(MESSAGES))
+
+    single_ms = np.array(single) * 1000
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    print(json.dumps({
+        "backend": backend,
+        "load_s": round(load_s, 2),
+        "p50_ms": round(float(np.percentile(single_ms, 50)), 2),
+        "p99_ms": round(float(np.percentile(single_ms, 99)), 2),
+        "batch_ms_per_msg": round(batch_per_msg * 1000, 3),
+        "peak_rss_mb": round(rss_mb, 1),
+    }))
+
+def main(backends, repeat):
+    for backend in backends:
+        if backend != "fp32":
+            parity(backend)
+
+    print("\nlatency / memory (fresh process per backend)")
+    for backend in backends:
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--measure", backend, "--repeat", str(repeat)],
+            capture_output=True, text=True, check=True,
+        )
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"  {r['backend']:<5} load={r['load_s']:5.2f}s  p50={r['p50_ms']:6.2f}ms  p99={r['p99_ms']:6.2f}ms  "
+              f"batch={r['batch_ms_per_msg']:6.3f}ms/msg  peak_rss={r['peak_rss_mb']:7.1f}MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--measure", choices=EMBEDDING_BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        measure(args.measure, args.repeat)
+    else:
+        main(args.backends, args.repeat)
@@ -0,0 +1,106 @@
+"""
+Recall / latency / memory benchmark for the retriever's ANN index families.
+
+    python bench_index.py --scale 1 20 --k 2 5
+
+Corpus: the vectors behind vector_store/mental_health.index, optionally
+replicated `scale` times with small gaussian jitter (re-normalized, like
+MiniLM embeddings) to simulate a larger knowledge base. Queries are held-out
+jittered copies of random corpus vectors. Recall@k is measured against exact
+(flat) search; each family is swept over its runtime knob.
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import faiss
+import numpy as np
+
+from core.vector_index import (INDEX_TYPES, INDEX_FILE, VECTORS_FILE, active_build_dir, build_index,
+                               configure_search, index_bytes)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BUILD_DIR = active_build_dir(os.path.join(BASE_DIR, "vector_store"))
+INDEX_PATH = str(BUILD_DIR / INDEX_FILE)
+VECTORS_PATH = str(BUILD_DIR / VECTORS_FILE)
+
+SWEEPS = {
+    "flat": [None],
+    "ivf": [1, 4, 8, 16, 32],
+    "pq": [1, 4, 8, 16, 32],
+    "hnsw": [16, 32, 64, 128],
+}
+
+def jitter(rng, vectors, sigma):
+    noisy = vectors + rng.normal(0, sigma, vectors.shape).astype("float32")
+    return noisy / np.linalg.norm(noisy, axis=1, keepdims=True)
+
+def load_corpus():
+    if os.path.exists(VECTORS_PATH):
+        return np.load(VECTORS_PATH).astype("float32")
+    index = faiss.read_index(INDEX_PATH)
+    return index.reconstruct_n(0, index.ntotal)
+
+def scaled_corpus(base, scale, rng, sigma=0.02):
+    if scale <= 1:
+        return base
+    return np.concatenate([base] + [jitter(rng, base, sigma) for _ in range(scale - 1)])
+
+def recall(found, truth, k):
+    return float(np.mean([len(set(f[:k]) & set(t[:k])) / k for f, t in zip(found, truth)]))
+
+def timed_search(index, queries, k):
+    latencies = []
+    results = []
+    for q in queries:
+        t = time.perf_counter()
+        _, ids = index.search(q.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - t)
+        results.append(ids[0])
+    ms = np.array(latencies) * 1000
+    return np.array(results), float(np.percentile(ms, 50)), float(np.percentile(ms, 99))
+
+def run(corpus, queries, ks, types):
+    kmax = max(ks)
+    exact = build_index(corpus, "flat")
+    _, truth = exact.search(queries, kmax)
+
+    for kind in types:
+        t = time.perf_counter()
+        index = build_index(corpus, kind)
+        build_s = time.perf_counter() - t
+        mb = index_bytes(index) / 1e6
+        for knob in SWEEPS[kind]:
+            if kind in ("ivf", "pq"):
+                configure_search(index, nprobe=knob)
+                label = f"nprobe={knob}"
+            elif kind == "hnsw":
+                configure_search(index, ef_search=knob)
+                label = f"efSearch={knob}"
+            else:
+                label = "exact"
+            found, p50, p99 = timed_search(index, queries, kmax)
+            recalls = "  ".join(f"R@{k}={recall(found, truth, k):.3f}" for k in ks)
+            print(f"  {kind:<5} {label:<12} {recalls}  p50={p50:6.3f}ms  p99={p99:6.3f}ms  "
+                  f"mem={mb:7.2f}MB  build={build_s:6.2f}s")
+
+def main(scales, ks, n_queries, types):
+    rng = np.random.default_rng(0)
+    base = load_corpus()
+    for scale in scales:
+        corpus = scaled_corpus(base, scale, rng)
+        queries = jitter(rng, corpus[rng.integers(0, len(corpus), n_queries)], 0.05)
+        print(f"\ncorpus x{scale}: {len(corpus)} vectors, dim {corpus.shape[1]}, {n_queries} queries")
+        run(np.ascontiguousarray(corpus), np.ascontiguousarray(queries), ks, types)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", nargs="+", type=int, default=[1, 20])
+    parser.add_argument("--k", nargs="+", type=int, default=[2, 5])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    args = parser.parse_args()
+    main(args.scale, args.k, args.queries, args.types)
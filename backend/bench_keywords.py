@@ -0,0 +1,77 @@
+"""
+Parity check + throughput benchmark for the compiled keyword matcher.
+
+    python bench_keywords.py --messages 20000 --long-words 400
+
+Parity: random messages built from keywords, negations and near-miss words
+(e.g. "stressed", "awake") must give the same per-signal counts as the
+legacy per-keyword re.search + is_negated loop. Exits non-zero on mismatch.
+Throughput: both paths over long messages.
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from core import signals
+
+FILLER = ["i", "am", "really", "so", "the", "a", "today", "work", "and", "feel", "like", "it's", "stressed", "awake", "sadness", "know"]
+
+def legacy_counts(text_lower):
+    counts = {}
+    for signal, keywords in signals.SIGNALS.items():
+        if signal == "violence_intent":
+            continue
+        for kw in keywords:
+            if re.search(rf"\b{kw}\b", text_lower) and not signals.is_negated(text_lower, kw):
+                counts[signal] = counts.get(signal, 0) + 1
+    return counts
+
+def matcher_counts(text_lower):
+    counts = {}
+    for kw, negated in signals.KEYWORD_MATCHER.match(text_lower).items():
+        if negated:
+            continue
+        for signal in signals.KEYWORD_MATCHER.signals_for[kw]:
+            counts[signal] = counts.get(signal, 0) + 1
+    return counts
+
+def random_message(rng, vocab, length):
+    return " ".join(rng.choice(vocab) for _ in range(length)).lower()
+
+def main(n_messages, long_words, seed):
+    rng = random.Random(seed)
+    keywords = [kw for kws in signals.SIGNALS.values() for kw in kws]
+    vocab = keywords + signals.NEGATIONS + FILLER * 3
+
+    mismatches = 0
+    for _ in range(n_messages):
+        text = random_message(rng, vocab, rng.randint(1, 20))
+        if legacy_counts(text) != matcher_counts(text):
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"MISMATCH {text!r}: legacy={legacy_counts(text)} matcher={matcher_counts(text)}")
+    print(f"parity: {n_messages - mismatches}/{n_messages} identical")
+
+    long_messages = [random_message(rng, vocab, long_words) for _ in range(200)]
+    chars = sum(len(m) for m in long_messages)
+    for name, fn in (("legacy", legacy_counts), ("matcher", matcher_counts)):
+        start = time.perf_counter()
+        for m in long_messages:
+            fn(m)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<8} {len(long_messages) / elapsed:9.1f} msg/s  {chars / elapsed / 1e6:6.2f} MB/s  ({long_words} words/msg)")
+
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--long-words", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    sys.exit(main(args.messages, args.long_words, args.seed))
@@ -0,0 +1,115 @@
+"""
+LLM client against the local stub: connection reuse, retries and deadlines.
+
+    python bench_llm_client.py --calls 50 --latency 0.05 --fail-rate 0.2
+
+Starts llm_stub.py in-process and compares a fresh ChatGroq per call (the
+old generate_summary behaviour) with the shared pooled client, then runs
+the pooled client against failing responses and a slow model under a short
+deadline. Reports per-call latency, TCP connections opened on the stub,
+retries and how each deadline-bound call ended.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import threading
+import statistics
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import llm_stub
+from langchain_groq import ChatGroq
+from langchain_core.messages import HumanMessage
+
+from core.llm_client import LLMClient, Deadline
+
+MESSAGES = [HumanMessage(content="I had a rough day at work")]
+
+def start_stub(port, latency, fail_rate):
+    server = llm_stub.make_server(port=port, latency=latency, fail_rate=fail_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def summarize(name, times, connections, extra=""):
+    times = sorted(times)
+    p99 = times[min(len(times) - 1, int(len(times) * 0.99))]
+    print(f"{name:<22} p50={statistics.median(times) * 1000:7.1f}ms p99={p99 * 1000:7.1f}ms "
+          f"connections={connections}{extra}")
+
+async def bench_fresh(base_url, calls):
+    times = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        llm = ChatGroq(model_name="llama-3.3-70b-versatile", api_key="stub", base_url=base_url, max_tokens=350)
+        await llm.ainvoke(MESSAGES)
+        times.append(time.perf_counter() - started)
+    return times
+
+async def bench_pooled(client, calls, model="llama-3.3-70b-versatile", deadline_seconds=None):
+    chat_model = client.model(model, temperature=0.85, max_tokens=350)
+    times, outcomes = [], {}
+    for _ in range(calls):
+        started = time.perf_counter()
+        deadline = Deadline(deadline_seconds) if deadline_seconds else None
+        try:
+            await chat_model.ainvoke(MESSAGES, deadline=deadline)
+            outcome = "ok"
+        except Exception as e:
+            outcome = type(e).__name__
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        times.append(time.perf_counter() - started)
+    return times, outcomes
+
+def stub_connections(server):
+    return server.RequestHandlerClass.state.stats["connections"]
+
+async def main_async(args):
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    server = start_stub(args.port, [str(args.latency)], 0.0)
+    before = stub_connections(server)
+    times = await bench_fresh(base_url, args.calls)
+    summarize("fresh client per call", times, stub_connections(server) - before)
+
+    client = LLMClient(api_key="stub", base_url=base_url)
+    before = stub_connections(server)
+    times, _ = await bench_pooled(client, args.calls)
+    summarize("pooled client", times, stub_connections(server) - before)
+    await client.aclose()
+    server.shutdown()
+    server.server_close()
+
+    server = start_stub(args.port + 1, [str(args.latency)], args.fail_rate)
+    client = LLMClient(api_key="stub", base_url=f"http://127.0.0.1:{args.port + 1}")
+    times, outcomes = await bench_pooled(client, args.calls)
+    stats = client.metrics()
+    summarize(f"pooled, {args.fail_rate:.0%} 503s", times, stub_connections(server),
+              f" retries={stats['retries']} outcomes={outcomes}")
+    await client.aclose()
+    server.shutdown()
+    server.server_close()
+
+    server = start_stub(args.port + 2, [str(args.slow_latency)], 0.0)
+    client = LLMClient(api_key="stub", base_url=f"http://127.0.0.1:{args.port + 2}")
+    times, outcomes = await bench_pooled(client, min(args.calls, 5), deadline_seconds=args.deadline)
+    summarize(f"slow model, {args.deadline:g}s deadline", times, stub_connections(server), f" outcomes={outcomes}")
+    await client.aclose()
+    server.shutdown()
+    server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub response latency (s)")
+    parser.add_argument("--fail-rate", type=float, default=0.2)
+    parser.add_argument("--slow-latency", type=float, default=5.0)
+    parser.add_argument("--deadline", type=float, default=3.0)
+    parser.add_argument("--port", type=int, default=8011)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
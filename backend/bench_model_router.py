@@ -0,0 +1,85 @@
+"""
+Model routing against the local stub: a slow primary, a fast fallback, a fixed deadline.
+
+    python bench_model_router.py --turns 30 --primary-latency 4 --fallback-latency 0.3 --deadline 6
+    python bench_model_router.py --hedge-delay 1.0
+
+Starts llm_stub.py in-process with per-model latencies and sends `turns`
+chat calls through a ModelRouter, each with its own Deadline (the /chat
+budget, scaled down). Compares primary-only (what a 504 would have been)
+with routing, and prints which model answered, how long the turns took and
+the router's decisions.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import threading
+import statistics
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import llm_stub
+from langchain_core.messages import HumanMessage
+
+from core.llm_client import LLMClient, Deadline
+from core.model_router import ModelRouter
+
+PRIMARY = "llama-3.3-70b-versatile"
+FALLBACK = "llama-3.1-8b-instant"
+MESSAGES = [HumanMessage(content="I can't sleep and I keep overthinking everything")]
+
+async def run(router, turns, deadline_seconds):
+    times, answered, failed = [], {}, 0
+    for _ in range(turns):
+        started = time.perf_counter()
+        try:
+            response = await router.ainvoke(MESSAGES, deadline=Deadline(deadline_seconds))
+            model = response.response_metadata.get("model_name", "?")
+            answered[model] = answered.get(model, 0) + 1
+        except Exception:
+            failed += 1
+        times.append(time.perf_counter() - started)
+    return times, answered, failed
+
+def report(name, times, answered, failed):
+    times = sorted(times)
+    print(f"{name:<14} p50={statistics.median(times):5.2f}s max={times[-1]:5.2f}s "
+          f"failed={failed} answered_by={answered}")
+
+async def main_async(args):
+    server = llm_stub.make_server(port=args.port, latency=[f"{PRIMARY}={args.primary_latency}",
+                                                           f"{FALLBACK}={args.fallback_latency}"])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = LLMClient(api_key="stub", base_url=f"http://127.0.0.1:{args.port}")
+    primary = client.model(PRIMARY, temperature=0.85, max_tokens=350)
+    fallback = client.model(FALLBACK, temperature=0.85, max_tokens=350)
+
+    report("primary only", *await run(ModelRouter([primary]), args.turns, args.deadline))
+    router = ModelRouter([primary, fallback], hedge_delay=args.hedge_delay)
+    report("routed", *await run(router, args.turns, args.deadline))
+    metrics = router.metrics()
+    print(f"decisions={metrics['decisions']} fallbacks={metrics['fallbacks']} "
+          f"hedged={metrics['hedged']} hedge_wins={metrics['hedge_wins']}")
+    for name, health in metrics["models"].items():
+        print(f"  {name}: {health}")
+
+    await client.aclose()
+    server.shutdown()
+    server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--primary-latency", type=float, default=4.0)
+    parser.add_argument("--fallback-latency", type=float, default=0.3)
+    parser.add_argument("--deadline", type=float, default=6.0, help="per-turn budget (s)")
+    parser.add_argument("--hedge-delay", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8021)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
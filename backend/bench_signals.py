@@ -0,0 +1,81 @@
+"""
+Microbenchmark: per-message prototype scoring cost (encoding excluded).
+
+    python bench_signals.py --repeat 2000
+
+Compares the legacy loop (one util.cos_sim(...).item() per prototype) with
+the PrototypeBank matrix product, for single messages and for a batch.
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from sentence_transformers import util
+
+from core.resources import shared
+from core import signals
+
+MESSAGES = [
+    "hi",
+    "I have been so overwhelmed with work lately",
+    "why does this keep happening to me, just answer",
+    "I can't sleep and I wake up at 3am every night",
+    "honestly I'm not sure what I'm feeling, maybe confused",
+    "I feel empty and nothing seems to matter anymore",
+    "I'm worried about my exams and keep panicking",
+    "thank you, that actually helped",
+]
+
+def legacy_scores(user_emb, signal_embs, mode_embs):
+    for sig, proto in signal_embs.items():
+        threshold = signals.THRESHOLDS.get(sig, 0.45)
+        _ = util.cos_sim(user_emb, proto).item() > threshold
+    scores = {mode: util.cos_sim(user_emb, proto).item() for mode, proto in mode_embs.items()}
+    return max(scores, key=scores.get)
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+def main(repeat):
+    model = shared.embedding_model
+    signal_embs = {k: model.encode(v, convert_to_tensor=True, show_progress_bar=False)
+                   for k, v in signals.SIGNAL_PROTOTYPES.items()}
+    mode_embs = {k: model.encode(v, convert_to_tensor=True, show_progress_bar=False)
+                 for k, v in signals.RESPONSE_MODE_PROTOTYPES.items()}
+    tensors = [model.encode(m, convert_to_tensor=True, show_progress_bar=False) for m in MESSAGES]
+    arrays = np.stack([t.cpu().numpy() for t in tensors])
+    signals.PROTOTYPES.ensure(model)
+
+    # Parity: same decisions from both paths
+    mismatches = 0
+    for tensor, row in zip(tensors, arrays):
+        legacy_mode = legacy_scores(tensor, signal_embs, mode_embs)
+        scores = signals.PROTOTYPES.classify(row, model)
+        legacy_hits = [util.cos_sim(tensor, p).item() > signals.THRESHOLDS.get(k, 0.45) for k, p in signal_embs.items()]
+        if list(scores.signal_hits[0]) != legacy_hits:
+            mismatches += 1
+        scores_best = signals.PROTOTYPES.mode_names[int(scores.mode_scores[0].argmax())]
+        if scores_best != legacy_mode:
+            mismatches += 1
+    print(f"parity mismatches: {mismatches}")
+
+    n = len(MESSAGES)
+    legacy = timed(lambda: [legacy_scores(t, signal_embs, mode_embs) for t in tensors], repeat) / n
+    single = timed(lambda: [signals.PROTOTYPES.best_modes(signals.PROTOTYPES.classify(r, model)) for r in arrays], repeat) / n
+    batch = timed(lambda: signals.PROTOTYPES.best_modes(signals.PROTOTYPES.classify(arrays, model)), repeat) / n
+
+    print(f"legacy loop      {legacy * 1e6:8.1f} us/message")
+    print(f"matrix (single)  {single * 1e6:8.1f} us/message  ({legacy / single:4.1f}x)")
+    print(f"matrix (batch {n}) {batch * 1e6:8.1f} us/message  ({legacy / batch:4.1f}x)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=2000)
+    main(parser.parse_args().repeat)
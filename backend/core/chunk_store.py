@@ -0,0 +1,142 @@
+import os
+import json
+import mmap
+import struct
+from pathlib import Path
+
+# Layout (little endian):
+#   header   MAGIC, version, count, meta_offset, meta_len, blob_offset
+#   offsets  (count + 1) x u64   byte offsets of each chunk inside the blob
+#   meta_ids count x u32         index into the metadata table
+#   meta     JSON list of the distinct metadata dicts (a handful of sources)
+#   blob     UTF-8 chunk texts, back to back
+MAGIC = b"HACHUNKS"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQQQ")
+HEADER_SIZE = 48  # HEADER.size (40) padded so the u64 table is 8-byte aligned
+
+class ChunkStore:
+    """
+    Read-only, memory-mapped chunk store.
+
+    Opening the file only parses the header and the small metadata table;
+    texts are decoded from the mapping on demand, so startup cost and
+    per-process memory do not grow with the corpus, and the page cache is
+    shared between workers mapping the same file.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self._offsets = self._meta_ids = self._view = None
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, meta_offset, meta_len, blob_offset = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{self.path} is not a v{VERSION} chunk store")
+        self.count = count
+        self._blob_offset = blob_offset
+        self._view = view = memoryview(self._mm)
+        ids_offset = HEADER_SIZE + (count + 1) * 8
+        self._offsets = view[HEADER_SIZE:ids_offset].cast("Q")
+        self._meta_ids = view[ids_offset:ids_offset + count * 4].cast("I")
+        self._meta = json.loads(bytes(self._mm[meta_offset:meta_offset + meta_len]).decode("utf-8"))
+
+    def __len__(self):
+        return self.count
+
+    def text(self, i: int) -> str:
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        start = self._blob_offset + self._offsets[i]
+        end = self._blob_offset + self._offsets[i + 1]
+        return self._mm[start:end].decode("utf-8")
+
+    def meta(self, i: int) -> dict:
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return self._meta[self._meta_ids[i]]
+
+    def get(self, ids):
+        return [self.text(i) for i in ids]
+
+    def __iter__(self):
+        return (self.text(i) for i in range(self.count))
+
+    def close(self):
+        for attr in ("_offsets", "_meta_ids", "_view"):
+            view = getattr(self, attr, None)
+            if view is not None:
+                view.release()
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    @staticmethod
+    def write(path, texts, meta):
+        """Serializes texts and their metadata dicts into the chunk store format."""
+        if len(texts) != len(meta):
+            raise ValueError("texts and meta must have the same length")
+        table, table_ids, meta_ids = [], {}, []
+        for m in meta:
+            key = json.dumps(m, sort_keys=True)
+            if key not in table_ids:
+                table_ids[key] = len(table)
+                table.append(m)
+            meta_ids.append(table_ids[key])
+
+        encoded = [t.encode("utf-8") for t in texts]
+        offsets = [0]
+        for b in encoded:
+            offsets.append(offsets[-1] + len(b))
+        meta_blob = json.dumps(table).encode("utf-8")
+
+        count = len(texts)
+        meta_offset = HEADER_SIZE + (count + 1) * 8 + count * 4
+        blob_offset = meta_offset + len(meta_blob)
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, count, meta_offset, len(meta_blob), blob_offset).ljust(HEADER_SIZE, b"\0"))
+            f.write(struct.pack(f"<{count + 1}Q", *offsets))
+            f.write(struct.pack(f"<{count}I", *meta_ids))
+            f.write(meta_blob)
+            for b in encoded:
+                f.write(b)
+            f.flush()
+            os.fsync(f.fileno())
+
+class JsonChunkStore:
+    """Same interface over the legacy {"texts": [...], "meta": [...]} JSON store."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "r") as f:
+            store = json.load(f)
+        self._texts, self._meta = store["texts"], store["meta"]
+        self.count = len(self._texts)
+
+    def __len__(self):
+        return self.count
+
+    def text(self, i: int) -> str:
+        return self._texts[i]
+
+    def meta(self, i: int) -> dict:
+        return self._meta[i]
+
+    def get(self, ids):
+        return [self._texts[i] for i in ids]
+
+    def __iter__(self):
+        return iter(self._texts)
+
+    def close(self):
+        pass
+
+def open_chunk_store(path, legacy_json_path=None):
+    """Opens the binary store, falling back to the legacy JSON file; None if neither exists."""
+    if Path(path).exists():
+        return ChunkStore(path)
+    if legacy_json_path is not None and Path(legacy_json_path).exists():
+        return JsonChunkStore(legacy_json_path)
+    return None
@@ -0,0 +1,161 @@
+import os
+import re
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+from .resources import shared
+
+CONTEXT_MAX_CHARS = int(os.getenv("CONTEXT_MAX_CHARS", "600"))
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "0"))  # 0 = char budget only
+CONTEXT_MIN_SIMILARITY = float(os.getenv("CONTEXT_MIN_SIMILARITY", "0.25"))
+CONTEXT_MIN_CHUNK_SIMILARITY = float(os.getenv("CONTEXT_MIN_CHUNK_SIMILARITY", "0.15"))
+CONTEXT_DEDUP_SIMILARITY = float(os.getenv("CONTEXT_DEDUP_SIMILARITY", "0.92"))
+CONTEXT_SENTENCE_CACHE = int(os.getenv("CONTEXT_SENTENCE_CACHE", "256"))  # chunks
+
+# Weight of the sentence's own similarity vs. its chunk's FAISS similarity
+SENTENCE_WEIGHT = 0.8
+MIN_SENTENCE_CHARS = 25
+MAX_SENTENCE_WORDS = 60
+CHARS_PER_TOKEN = 4  # rough English average, used only for the token budget
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+
+def split_sentences(text):
+    """Sentence split for PDF-extracted chunks; run-on passages are cut into word windows."""
+    sentences = []
+    for sentence in SENTENCE_BOUNDARY.split(text):
+        words = sentence.split()
+        for i in range(0, len(words), MAX_SENTENCE_WORDS):
+            piece = " ".join(words[i:i + MAX_SENTENCE_WORDS])
+            if len(piece) >= MIN_SENTENCE_CHARS:
+                sentences.append(piece)
+    return sentences
+
+def distance_to_similarity(distance):
+    # IndexFlatL2 returns squared L2; for unit vectors ||a-b||^2 = 2 - 2cos
+    return 1.0 - float(distance) / 2.0
+
+class ContextCompressor:
+    """
+    Packs the retrieved chunks' most query-relevant sentences into a budget.
+
+    Each sentence is scored by cosine similarity to the turn embedding,
+    blended with its chunk's retrieval similarity (from the FAISS distance).
+    Sentences below `min_similarity`, chunks below `min_chunk_similarity` and
+    near-duplicates of already selected sentences are dropped; the rest are
+    taken greedily by score until the char/token budget is spent and
+    returned in document order. Sentence embeddings are cached per chunk.
+    """
+
+    def __init__(self, model_getter, max_chars=CONTEXT_MAX_CHARS, max_tokens=CONTEXT_MAX_TOKENS,
+                 min_similarity=CONTEXT_MIN_SIMILARITY, min_chunk_similarity=CONTEXT_MIN_CHUNK_SIMILARITY,
+                 dedup_similarity=CONTEXT_DEDUP_SIMILARITY, cache_size=CONTEXT_SENTENCE_CACHE):
+        self._model_getter = model_getter
+        self.max_chars = max_chars
+        self.max_tokens = max_tokens
+        self.min_similarity = min_similarity
+        self.min_chunk_similarity = min_chunk_similarity
+        self.dedup_similarity = dedup_similarity
+        self.cache_size = cache_size
+        self._chunks = OrderedDict()
+        self._lock = Lock()
+        self.stats = {"calls": 0, "chunks_in": 0, "chars_in": 0, "chars_out": 0,
+                      "sentences_scored": 0, "sentences_kept": 0, "chunk_cache_hits": 0}
+
+    @property
+    def budget_chars(self):
+        if self.max_tokens > 0:
+            return min(self.max_chars, self.max_tokens * CHARS_PER_TOKEN)
+        return self.max_chars
+
+    def _sentences(self, chunk_id, text):
+        """(sentences, unit embeddings) for a chunk, cached by chunk id."""
+        # Ids are reassigned by index rebuilds, so the text hash is part of the key
+        chunk_id = (chunk_id, hash(text))
+        with self._lock:
+            cached = self._chunks.get(chunk_id)
+            if cached is not None:
+                self._chunks.move_to_end(chunk_id)
+                self.stats["chunk_cache_hits"] += 1
+                return cached
+        sentences = split_sentences(text)
+        if sentences:
+            # Chunk sentences are bulk text: keep them out of the shared query cache
+            embeddings = np.asarray(self._model_getter().encode(
+                sentences, convert_to_numpy=True, normalize_embeddings=True, use_cache=False
+            ), dtype=np.float32)
+        else:
+            embeddings = np.zeros((0, 0), dtype=np.float32)
+        entry = (sentences, embeddings)
+        with self._lock:
+            self._chunks[chunk_id] = entry
+            while len(self._chunks) > self.cache_size:
+                self._chunks.popitem(last=False)
+        return entry
+
+    def compress(self, hits, query_embedding):
+        """
+        hits: retriever Hits (id, text, distance) in rank order.
+        Returns the selected sentences, in document order.
+        """
+        if not hits or query_embedding is None:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+        candidates = []  # (score, rank, position, sentence, embedding)
+        scored = 0
+        for rank, hit in enumerate(hits):
+            chunk_sim = distance_to_similarity(hit.distance)
+            if chunk_sim < self.min_chunk_similarity:
+                continue
+            sentences, embeddings = self._sentences(hit.id, hit.text)
+            if not sentences:
+                continue
+            sims = embeddings @ query
+            scored += len(sentences)
+            for pos in np.flatnonzero(sims >= self.min_similarity):
+                score = SENTENCE_WEIGHT * float(sims[pos]) + (1 - SENTENCE_WEIGHT) * chunk_sim
+                candidates.append((score, rank, int(pos), sentences[pos], embeddings[pos]))
+
+        budget = self.budget_chars
+        selected, seen, used = [], set(), 0
+        for score, rank, pos, sentence, emb in sorted(candidates, key=lambda c: -c[0]):
+            key = " ".join(sentence.lower().split())
+            if key in seen:
+                continue
+            if any(float(emb @ other[4]) >= self.dedup_similarity for other in selected):
+                continue
+            cost = len(sentence) + (1 if selected else 0)
+            if used + cost > budget:
+                continue  # a shorter, lower-ranked sentence may still fit
+            seen.add(key)
+            selected.append((score, rank, pos, sentence, emb))
+            used += cost
+
+        selected.sort(key=lambda c: (c[1], c[2]))
+        result = [c[3] for c in selected]
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["chunks_in"] += len(hits)
+            self.stats["chars_in"] += sum(len(h.text) for h in hits)
+            self.stats["chars_out"] += used
+            self.stats["sentences_scored"] += scored
+            self.stats["sentences_kept"] += len(result)
+        return result
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+            cached = len(self._chunks)
+        return {
+            **stats,
+            "compression_ratio": round(stats["chars_out"] / stats["chars_in"], 4) if stats["chars_in"] else 0.0,
+            "cached_chunks": cached,
+            "config": {"max_chars": self.max_chars, "max_tokens": self.max_tokens,
+                       "min_similarity": self.min_similarity, "dedup_similarity": self.dedup_similarity},
+        }
+
+context_compressor = ContextCompressor(lambda: shared.embedder)
@@ -1,5 +1,12 @@
 import os
+import time
+import asyncio
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, BoundedSemaphore
+
 import psycopg2
+from psycopg2 import pool as pg_pool
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 
@@ -7,7 +14,15 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL") or os.getenv("DB_CONNECTION_STRING")
 
+# Pool configuration (env overridable)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Connections idle longer than this are pinged before being handed out
+DB_HEALTHCHECK_INTERVAL = float(os.getenv("DB_HEALTHCHECK_INTERVAL", "30"))
+
 def get_db_connection():
+    """Opens a standalone connection. Only for scripts; the app uses the pool."""
     if not DATABASE_URL:
         raise ValueError("DATABASE_URL is not set")
     try:
@@ -17,11 +32,143 @@ def get_db_connection():
         print(f"Error connecting to database: {e}")
         raise
 
-def init_db():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Create tables if not exist
+class ConnectionPool:
+    """
+    Thread-safe psycopg2 pool with blocking checkout and health checks.
+
+    psycopg2's ThreadedConnectionPool raises as soon as it is exhausted, so a
+    semaphore makes callers wait (up to DB_POOL_TIMEOUT) instead. Connections
+    that have been idle for a while are pinged with SELECT 1 and replaced if
+    the server dropped them (NeonDB suspends idle compute).
+    """
+
+    def __init__(self, dsn, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE,
+                 timeout=DB_POOL_TIMEOUT, healthcheck_interval=DB_HEALTHCHECK_INTERVAL):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        self._pool = None
+        self._init_lock = Lock()
+        self._slots = BoundedSemaphore(max_size)
+        self._last_used = {}
+        self._known = set()
+        self.stats = {"checkouts": 0, "connects": 0, "discarded": 0}
+
+    def _ensure_pool(self):
+        with self._init_lock:
+            if self._pool is None:
+                if not self.dsn:
+                    raise ValueError("DATABASE_URL is not set")
+                self._pool = pg_pool.ThreadedConnectionPool(
+                    self.min_size,
+                    self.max_size,
+                    self.dsn,
+                    cursor_factory=RealDictCursor,
+                    connect_timeout=5,
+                    keepalives=1,
+                    keepalives_idle=30,
+                )
+        return self._pool
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        idle = time.monotonic() - self._last_used.get(id(conn), 0)
+        if idle < self.healthcheck_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No database connection available within {self.timeout}s")
+        try:
+            pool = self._ensure_pool()
+            while True:
+                conn = pool.getconn()
+                if id(conn) not in self._known:
+                    self._known.add(id(conn))
+                    self._last_used[id(conn)] = time.monotonic()
+                    self.stats["connects"] += 1
+                if self._is_healthy(conn):
+                    break
+                self.stats["discarded"] += 1
+                self._forget(conn)
+                pool.putconn(conn, close=True)
+            self.stats["checkouts"] += 1
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close=False):
+        try:
+            if close or conn.closed:
+                self._forget(conn)
+                self._pool.putconn(conn, close=True)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+        finally:
+            self._slots.release()
+
+    def _forget(self, conn):
+        self._known.discard(id(conn))
+        self._last_used.pop(id(conn), None)
+
+    def closeall(self):
+        with self._init_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+                self._last_used.clear()
+                self._known.clear()
+
+db_pool = ConnectionPool(DATABASE_URL)
+
+# Blocking DB work runs here so it never stalls the event loop.
+# Sized to the pool: a thread never waits on a connection another thread holds.
+_db_executor = ThreadPoolExecutor(max_workers=DB_POOL_MAX_SIZE, thread_name_prefix="db")
+
+@contextmanager
+def connection():
+    """Checks out a pooled connection; commits on success, rolls back on error."""
+    conn = db_pool.getconn()
+    broken = False
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            broken = True
+        raise
+    finally:
+        db_pool.putconn(conn, close=broken)
+
+def run_sync(fn, *args):
+    """Runs fn(cursor, *args) in a single pooled transaction and returns its result."""
+    with connection() as conn:
+        with conn.cursor() as cur:
+            return fn(cur, *args)
+
+async def run(fn, *args):
+    """Async variant of run_sync: the whole unit of work costs one checkout."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, run_sync, fn, *args)
+
+def close_pool():
+    db_pool.closeall()
+
+def _create_schema(cur):
     cur.execute("""
     CREATE TABLE IF NOT EXISTS v2_chat_history (
         id UUID PRIMARY KEY,
@@ -31,10 +178,64 @@ def init_db():
         summary TEXT
     );
     """)
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+    # Session signals/stage, so any worker can rehydrate a session (v2 multi-worker)
+    cur.execute("ALTER TABLE v2_chat_history ADD COLUMN IF NOT EXISTS state JSONB;")
+    # Append-only message log. v2_chat_history.conversation is kept only as
+    # the legacy source for the backfill below and is no longer written.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS v2_chat_messages (
+        id BIGSERIAL PRIMARY KEY,
+        session_id UUID NOT NULL REFERENCES v2_chat_history(id) ON DELETE CASCADE,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS v2_chat_messages_session_idx
+    ON v2_chat_messages (session_id, id);
+    """)
+    # Summary job status, so a poll can be answered by any worker (see summary_jobs.py)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS v2_summary_jobs (
+        id UUID PRIMARY KEY,
+        session_id UUID NOT NULL,
+        history_start INTEGER NOT NULL,
+        message_count INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        summary TEXT,
+        error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (session_id, history_start, message_count)
+    );
+    """)
+    _migrate_conversation_jsonb(cur)
+
+def _migrate_conversation_jsonb(cur):
+    """
+    One-time backfill from the old single-table schema: copies each legacy
+    conversation array into v2_chat_messages, in order. Idempotent, since
+    sessions that already have message rows are skipped.
+    """
+    cur.execute("""
+    INSERT INTO v2_chat_messages (session_id, role, content, created_at)
+    SELECT h.id, m.value->>'role', m.value->>'content', h.updated_at
+    FROM v2_chat_history h
+    CROSS JOIN LATERAL jsonb_array_elements(h.conversation) WITH ORDINALITY AS m(value, ord)
+    WHERE jsonb_typeof(h.conversation) = 'array'
+      AND jsonb_array_length(h.conversation) > 0
+      AND NOT EXISTS (SELECT 1 FROM v2_chat_messages x WHERE x.session_id = h.id)
+    ORDER BY h.id, m.ord;
+    """)
+
+def init_db():
+    run_sync(_create_schema)
+
+async def ainit_db():
+    await run(_create_schema)
 
 if __name__ == "__main__":
     init_db()
@@ -0,0 +1,74 @@
+import os
+from collections import OrderedDict
+from threading import Lock
+
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "4096"))
+EMBED_CACHE_MAX_MB = float(os.getenv("EMBED_CACHE_MAX_MB", "16"))
+
+def normalize_text(text: str) -> str:
+    # MiniLM's tokenizer is uncased and whitespace-insensitive, so this
+    # folding never changes the embedding; it only raises the hit rate.
+    return " ".join(text.lower().split())
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU cache of embeddings keyed by (model id, normalized text).
+
+    Bounded by entry count and by bytes; whichever limit is hit first evicts
+    the least recently used vectors. Cached arrays are read-only.
+    """
+
+    def __init__(self, max_entries=EMBED_CACHE_MAX_ENTRIES, max_bytes=int(EMBED_CACHE_MAX_MB * 1024 * 1024)):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def key(model_id: str, text: str):
+        return (model_id, normalize_text(text))
+
+    def get(self, key):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return vector
+
+    def put(self, key, vector):
+        if self.max_entries <= 0 or vector.nbytes > self.max_bytes:
+            return
+        vector = vector.copy()
+        vector.setflags(write=False)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[key] = vector
+            self._bytes += vector.nbytes
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
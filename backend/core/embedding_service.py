@@ -0,0 +1,211 @@
+import os
+import time
+import queue
+import logging
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from threading import Thread, Lock
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "32"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "3"))
+# Longest a caller waits for its batch (the first one also loads the model)
+EMBED_TIMEOUT_SECONDS = float(os.getenv("EMBED_TIMEOUT_SECONDS", "30"))
+
+class _Request:
+    __slots__ = ("texts", "future", "enqueued_at")
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+class EmbeddingService:
+    """
+    In-process micro-batcher in front of the shared SentenceTransformer.
+
+    Callers (turn embedding, prototype encoding, retrieval) block on encode()
+    from any thread; a single worker thread gathers whatever requests arrive
+    within `max_wait_ms` of the first one, up to `max_batch_size` texts, and
+    runs one forward pass for all of them. With a cache attached, repeated
+    texts never reach the batcher at all. encode() mirrors the subset of
+    SentenceTransformer.encode the codebase uses, so the service can be
+    passed anywhere a `model` is expected.
+
+    A caller waits at most `timeout` seconds and then gets a TimeoutError;
+    while the worker is stuck on a batch for longer than that, new requests
+    fail immediately, and a worker thread that died is restarted.
+    """
+
+    def __init__(self, model_loader, max_batch_size=EMBED_MAX_BATCH_SIZE, max_wait_ms=EMBED_MAX_WAIT_MS,
+                 cache=None, model_id="", timeout=EMBED_TIMEOUT_SECONDS):
+        self._model_loader = model_loader
+        self.timeout = timeout
+        self.cache = cache
+        self.model_id = model_id
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._batch_started = None  # perf_counter() of the batch being encoded, None when idle
+        self._start_lock = Lock()
+        self._stats_lock = Lock()
+        self.stats = {
+            "requests": 0,
+            "texts": 0,
+            "batches": 0,
+            "max_batch_size": 0,
+            "total_queue_delay_ms": 0.0,
+            "max_queue_delay_ms": 0.0,
+            "total_encode_ms": 0.0,
+            "timeouts": 0,
+            "worker_restarts": 0,
+        }
+
+    def encode(self, sentences, convert_to_numpy=True, normalize_embeddings=False, use_cache=True, **kwargs):
+        """
+        Blocking encode through the batcher. Returns (D,) for a str, (N, D) for a list.
+        use_cache=False bypasses the LRU (bulk texts that would only evict hot entries).
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        if self.cache is not None and use_cache:
+            embeddings = self._encode_cached(texts)
+        else:
+            embeddings = self._submit(texts)
+
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.maximum(norms, 1e-12)
+        return embeddings[0] if single else embeddings
+
+    def _submit(self, texts):
+        self._ensure_worker()
+        busy_since = self._batch_started
+        if busy_since is not None and time.perf_counter() - busy_since > self.timeout:
+            self._count("timeouts")
+            raise TimeoutError(f"embedding worker stuck on a batch for over {self.timeout:g}s")
+        request = _Request(texts)
+        self._queue.put(request)
+        try:
+            return request.future.result(timeout=self.timeout)
+        except FutureTimeout:
+            request.future.cancel()  # the worker skips it if it hasn't got to it yet
+            self._count("timeouts")
+            raise TimeoutError(f"embedding did not finish within {self.timeout:g}s") from None
+
+    def _encode_cached(self, texts):
+        """Serves repeated texts from the LRU cache; only misses reach the batcher."""
+        keys = [self.cache.key(self.model_id, t) for t in texts]
+        vectors = [self.cache.get(k) for k in keys]
+        missing = {}
+        for i, (k, v) in enumerate(zip(keys, vectors)):
+            if v is None:
+                missing.setdefault(k, []).append(i)
+        if missing:
+            fresh = self._submit([texts[positions[0]] for positions in missing.values()])
+            for (k, positions), vector in zip(missing.items(), fresh):
+                self.cache.put(k, vector)
+                for i in positions:
+                    vectors[i] = vector
+        return np.stack(vectors)
+
+    def _ensure_worker(self):
+        worker = self._worker
+        if worker is None or not worker.is_alive():
+            with self._start_lock:
+                if self._worker is None or not self._worker.is_alive():
+                    if self._worker is not None:
+                        logger.error("Embedding batcher thread died; restarting it")
+                        self._count("worker_restarts")
+                        self._batch_started = None
+                    self._worker = Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _next_request(self, timeout=None):
+        """Next request whose caller is still waiting (timed-out ones are dropped)."""
+        while True:
+            request = self._queue.get(timeout=timeout) if timeout is None or timeout > 0 else self._queue.get_nowait()
+            if request.future.set_running_or_notify_cancel():
+                return request
+
+    def _collect(self):
+        first = self._next_request()
+        batch = [first]
+        size = len(first.texts)
+        deadline = first.enqueued_at + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self._next_request(max(remaining, 0))
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch, size
+
+    def _run(self):
+        while True:
+            batch, size = self._collect()
+            started = self._batch_started = time.perf_counter()
+            try:
+                model = self._model_loader()
+                texts = [t for request in batch for t in request.texts]
+                embeddings = np.asarray(
+                    model.encode(texts, convert_to_numpy=True, show_progress_bar=False, batch_size=max(size, 1)),
+                    dtype=np.float32,
+                )
+            except Exception as e:
+                logger.exception("Embedding batch failed")
+                self._batch_started = None
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            self._batch_started = None
+
+            offset = 0
+            for request in batch:
+                n = len(request.texts)
+                request.future.set_result(embeddings[offset:offset + n])
+                offset += n
+            self._record(batch, size, started)
+
+    def _record(self, batch, size, started):
+        finished = time.perf_counter()
+        with self._stats_lock:
+            self.stats["requests"] += len(batch)
+            self.stats["texts"] += size
+            self.stats["batches"] += 1
+            self.stats["max_batch_size"] = max(self.stats["max_batch_size"], size)
+            self.stats["total_encode_ms"] += (finished - started) * 1000
+            for request in batch:
+                delay_ms = (started - request.enqueued_at) * 1000
+                self.stats["total_queue_delay_ms"] += delay_ms
+                self.stats["max_queue_delay_ms"] = max(self.stats["max_queue_delay_ms"], delay_ms)
+
+    def metrics(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        batches, requests = stats["batches"], stats["requests"]
+        return {
+            "requests": requests,
+            "texts": stats["texts"],
+            "batches": batches,
+            "avg_batch_size": round(stats["texts"] / batches, 2) if batches else 0.0,
+            "max_batch_size": stats["max_batch_size"],
+            "avg_queue_delay_ms": round(stats["total_queue_delay_ms"] / requests, 3) if requests else 0.0,
+            "max_queue_delay_ms": round(stats["max_queue_delay_ms"], 3),
+            "avg_encode_ms": round(stats["total_encode_ms"] / batches, 3) if batches else 0.0,
+            "queue_depth": self._queue.qsize(),
+            "config": {"max_batch_size": self.max_batch_size, "max_wait_ms": self.max_wait * 1000},
+            "cache": self.cache.metrics() if self.cache is not None else None,
+        }
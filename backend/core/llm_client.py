@@ -0,0 +1,347 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from threading import Lock
+
+import groq
+import httpx
+from langchain_groq import ChatGroq
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# Groq/OpenAI-compatible endpoint; point at a local stub (see llm_stub.py) for tests
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.25"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "2.0"))
+LLM_CALL_TIMEOUT_SECONDS = float(os.getenv("LLM_CALL_TIMEOUT_SECONDS", "20"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "3"))
+# Part of a request deadline kept back for parsing, persistence and the response itself
+LLM_DEADLINE_MARGIN_SECONDS = float(os.getenv("LLM_DEADLINE_MARGIN_SECONDS", "1.0"))
+# A retry is only started if at least this much of the deadline is left for it
+LLM_MIN_ATTEMPT_SECONDS = float(os.getenv("LLM_MIN_ATTEMPT_SECONDS", "2.0"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "10"))
+LLM_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", "30"))
+
+# Transient failures worth another attempt: network errors and timeouts
+# (APITimeoutError is an APIConnectionError), 429 and 5xx responses
+RETRYABLE_ERRORS = (groq.APIConnectionError, groq.RateLimitError, groq.InternalServerError,
+                    httpx.TransportError, TimeoutError)
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when the remaining request budget is too short for another LLM attempt."""
+
+class Deadline:
+    """Absolute point in time (monotonic) by which a request must be answered."""
+
+    __slots__ = ("expires_at",)
+
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    def shortened(self, seconds):
+        """A Deadline `seconds` earlier than this one (e.g. time kept back for a fallback call)."""
+        deadline = Deadline(0)
+        deadline.expires_at = self.expires_at - seconds
+        return deadline
+
+def _retry_after(e):
+    response = getattr(e, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class ChatModel:
+    """
+    One model + sampling configuration on top of the shared LLMClient.
+
+    Mirrors the invoke/ainvoke/astream surface of the underlying ChatGroq,
+    adding the client's retry policy and an optional `deadline`. The
+    ChatGroq is built on first use and rebuilt after the client's HTTP
+    connections are closed, so a ChatModel held by a consumer stays usable.
+    """
+
+    def __init__(self, client, model_name, temperature, max_tokens, call_timeout):
+        self.client = client
+        self.model_name = model_name
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.call_timeout = call_timeout
+        self._llm = None
+        self._generation = None
+
+    @property
+    def llm(self):
+        if self._llm is None or self._generation != self.client.generation:
+            # Retries and timeouts are handled here, not by the SDK
+            self._llm = ChatGroq(
+                temperature=self.temperature,
+                model_name=self.model_name,
+                api_key=self.client.api_key,
+                base_url=self.client.base_url,
+                max_tokens=self.max_tokens,
+                max_retries=0,
+                timeout=httpx.Timeout(self.call_timeout, connect=LLM_CONNECT_TIMEOUT_SECONDS),
+                http_client=self.client.http_client(),
+                http_async_client=self.client.http_async_client(),
+            )
+            self._generation = self.client.generation
+        return self._llm
+
+    def invoke(self, messages):
+        return self.client.call(self, lambda: self.llm.invoke(messages))
+
+    async def ainvoke(self, messages, deadline=None):
+        return await self.client.acall(self, lambda: self.llm.ainvoke(messages), deadline)
+
+    async def astream(self, messages, deadline=None):
+        async for chunk in self.client.astream(self, lambda: self.llm.astream(messages), deadline):
+            yield chunk
+
+class LLMClient:
+    """
+    Process-wide LLM access: pooled keep-alive HTTP connections, bounded retries, deadlines.
+
+    Every ChatModel shares the same httpx clients, so TLS connections to the
+    provider are opened once and reused across turns, summaries and memory
+    updates. Transient failures are retried up to `max_retries` times with
+    full-jitter exponential backoff (honouring Retry-After), and each
+    attempt is capped by the caller's Deadline minus a safety margin, so a
+    slow provider fails fast enough for /chat to return a fallback reply
+    instead of hitting the request timeout. Streams are only retried until
+    the first chunk has arrived.
+    """
+
+    def __init__(self, api_key=GROQ_API_KEY, base_url=LLM_BASE_URL, max_retries=LLM_MAX_RETRIES,
+                 backoff_base=LLM_BACKOFF_BASE_SECONDS, backoff_max=LLM_BACKOFF_MAX_SECONDS,
+                 deadline_margin=LLM_DEADLINE_MARGIN_SECONDS, min_attempt=LLM_MIN_ATTEMPT_SECONDS):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline_margin = deadline_margin
+        self.min_attempt = min_attempt
+        self._http = None
+        self._ahttp = None
+        # Bumped by aclose(): ChatModels rebuild their ChatGroq on the new HTTP clients
+        self.generation = 0
+        self._models = {}
+        self._lock = Lock()
+        self.stats = {"calls": 0, "succeeded": 0, "failed": 0, "retries": 0, "timeouts": 0,
+                      "deadline_exceeded": 0, "total_ms": 0.0}
+        self.by_model = {}
+
+    def _limits(self):
+        return httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                            keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS)
+
+    def http_client(self):
+        if self._http is None:
+            self._http = httpx.Client(limits=self._limits())
+        return self._http
+
+    def http_async_client(self):
+        if self._ahttp is None:
+            self._ahttp = httpx.AsyncClient(limits=self._limits())
+        return self._ahttp
+
+    def model(self, model_name, temperature=0.7, max_tokens=None, call_timeout=LLM_CALL_TIMEOUT_SECONDS):
+        """Cached ChatModel for this configuration (created once, reused for every call)."""
+        key = (model_name, temperature, max_tokens, call_timeout)
+        with self._lock:
+            chat_model = self._models.get(key)
+            if chat_model is None:
+                chat_model = ChatModel(self, model_name, temperature, max_tokens, call_timeout)
+                self._models[key] = chat_model
+        return chat_model
+
+    async def aclose(self):
+        if self._ahttp is not None:
+            await self._ahttp.aclose()
+        if self._http is not None:
+            self._http.close()
+        self._http = self._ahttp = None
+        self.generation += 1
+
+    def attempt_timeout(self, chat_model, deadline):
+        """Seconds the next attempt may take, or None when the deadline leaves no room."""
+        timeout = chat_model.call_timeout
+        if deadline is None:
+            return timeout
+        remaining = deadline.remaining() - self.deadline_margin
+        if remaining <= 0:
+            return None
+        return min(timeout, remaining)
+
+    def _retry_delay(self, attempt, e, chat_model, deadline):
+        """Backoff before retry `attempt` (0-based), or None when no retry should be made."""
+        if attempt >= self.max_retries or not isinstance(e, RETRYABLE_ERRORS):
+            return None
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        hinted = _retry_after(e)
+        if hinted is not None:
+            delay = max(delay, hinted)
+        if deadline is not None and deadline.remaining() - self.deadline_margin - delay < self.min_attempt:
+            return None
+        if deadline is None and delay > chat_model.call_timeout:
+            return None
+        return delay
+
+    def _record(self, chat_model, started, error=None, timed_out=False):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            model = self.by_model.setdefault(chat_model.model_name,
+                                             {"calls": 0, "failed": 0, "timeouts": 0, "total_ms": 0.0})
+            model["calls"] += 1
+            model["total_ms"] += elapsed_ms
+            self.stats["calls"] += 1
+            self.stats["total_ms"] += elapsed_ms
+            if error is None:
+                self.stats["succeeded"] += 1
+            else:
+                model["failed"] += 1
+                self.stats["failed"] += 1
+            if timed_out:
+                model["timeouts"] += 1
+                self.stats["timeouts"] += 1
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _no_time_left(self, chat_model):
+        self._count("deadline_exceeded")
+        return DeadlineExceeded(f"no time left for a {chat_model.model_name} call")
+
+    def call(self, chat_model, fn):
+        """Blocking call with retries (scripts and the sync API; per-attempt timeout via httpx)."""
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                result = fn()
+            except Exception as e:
+                self._record(chat_model, started, error=e, timed_out=isinstance(e, TimeoutError))
+                delay = self._retry_delay(attempt, e, chat_model, None)
+                if delay is None:
+                    raise
+                logger.warning("LLM %s attempt %d failed (%s); retrying in %.2fs",
+                               chat_model.model_name, attempt + 1, e, delay)
+                self._count("retries")
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self._record(chat_model, started)
+            return result
+
+    async def acall(self, chat_model, fn, deadline=None):
+        attempt = 0
+        while True:
+            timeout = self.attempt_timeout(chat_model, deadline)
+            if timeout is None:
+                raise self._no_time_left(chat_model)
+            started = time.perf_counter()
+            try:
+                async with asyncio.timeout(timeout):
+                    result = await fn()
+            except Exception as e:
+                self._record(chat_model, started, error=e, timed_out=isinstance(e, TimeoutError))
+                delay = self._retry_delay(attempt, e, chat_model, deadline)
+                if delay is None:
+                    raise
+                logger.warning("LLM %s attempt %d failed (%s); retrying in %.2fs",
+                               chat_model.model_name, attempt + 1, e, delay)
+                self._count("retries")
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self._record(chat_model, started)
+            return result
+
+    async def astream(self, chat_model, fn, deadline=None):
+        """
+        Retries until the first chunk; after that the stream is passed
+        through and any error propagates (the user has seen output already).
+        Each chunk must still arrive within the deadline.
+        """
+        attempt = 0
+        while True:
+            timeout = self.attempt_timeout(chat_model, deadline)
+            if timeout is None:
+                raise self._no_time_left(chat_model)
+            started = time.perf_counter()
+            stream = fn()
+            try:
+                async with asyncio.timeout(timeout):
+                    first = await anext(stream)
+            except StopAsyncIteration:
+                self._record(chat_model, started)
+                return
+            except Exception as e:
+                await stream.aclose()
+                self._record(chat_model, started, error=e, timed_out=isinstance(e, TimeoutError))
+                delay = self._retry_delay(attempt, e, chat_model, deadline)
+                if delay is None:
+                    raise
+                logger.warning("LLM %s stream attempt %d failed (%s); retrying in %.2fs",
+                               chat_model.model_name, attempt + 1, e, delay)
+                self._count("retries")
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            break
+
+        try:
+            yield first
+            while True:
+                # Past the first chunk there are no retries, but the deadline still holds
+                timeout = deadline.remaining() - self.deadline_margin if deadline is not None else None
+                if timeout is not None and timeout <= 0:
+                    raise self._no_time_left(chat_model)
+                try:
+                    async with asyncio.timeout(timeout):
+                        chunk = await anext(stream)
+                except StopAsyncIteration:
+                    break
+                yield chunk
+        except Exception as e:
+            self._record(chat_model, started, error=e, timed_out=isinstance(e, TimeoutError))
+            raise
+        finally:
+            await stream.aclose()
+        self._record(chat_model, started)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+            by_model = {name: dict(m) for name, m in self.by_model.items()}
+        total_ms = stats.pop("total_ms")
+        return {
+            **stats,
+            "avg_call_ms": round(total_ms / stats["calls"], 1) if stats["calls"] else 0.0,
+            "models": {
+                name: {"calls": m["calls"], "failed": m["failed"], "timeouts": m["timeouts"],
+                       "avg_call_ms": round(m["total_ms"] / m["calls"], 1) if m["calls"] else 0.0}
+                for name, m in by_model.items()
+            },
+            "pool": {"open_models": len(self._models), "max_connections": LLM_MAX_CONNECTIONS,
+                     "max_keepalive": LLM_MAX_KEEPALIVE},
+            "config": {"base_url": self.base_url or "default", "max_retries": self.max_retries,
+                       "deadline_margin_s": self.deadline_margin},
+        }
+
+llm_client = LLMClient()
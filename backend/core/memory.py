@@ -1,80 +1,310 @@
-from typing import Dict, Any, List
-import uuid
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
-from .database import get_db_connection
+import asyncio
+from psycopg2.extras import execute_values
+from . import database
+from .write_behind import WriteBehindQueue, WriteBatch
+from .session_store import InMemorySessionStore, message_bytes, SESSION_SWEEP_INTERVAL
+from .session_backend import make_session_backend, session_state, encode_state, STATE_KEYS
 
-# In-memory session store
-# Structure:
+# In-memory session store (idle TTL + LRU, bounded by count and approximate bytes)
+# Session structure:
 # {
-#   session_id: {
-#     "conversation": [{"role": "user", "content": "..."}],
-#     "signals": {},
-#     "stage": "exploration",
-#     "last_active": timestamp
-#   }
+#   "conversation": [{"role": "user", "content": "..."}],
+#   "signals": {},
+#   "stage": "exploration",
+#   "last_active": timestamp
 # }
-SESSIONS: Dict[str, Any] = {}
+SESSIONS = InMemorySessionStore()
+SESSION_BACKEND = make_session_backend()
+
+# Evicted sessions whose last messages were never persisted (e.g. a timed-out turn)
+_retiring: List[Tuple[str, List[Dict[str, str]]]] = []
+_sweeper_task = None
+
+def _new_session() -> Dict[str, Any]:
+    return {
+        "conversation": [],
+        "signals": {
+            "stress": 0,
+            "fatigue": 0,
+            "low_mood": 0,
+            "anxiety": 0,
+            "sleep_issues": 0,
+            "self_worth": 0,
+            "attention": 0
+        },
+        "stage": "opening",
+        "last_active": datetime.now()
+    }
 
 def get_session(session_id: str) -> Dict[str, Any]:
-    if session_id not in SESSIONS:
-        SESSIONS[session_id] = {
-            "conversation": [],
-            "signals": {
-                "stress": 0,
-                "fatigue": 0,
-                "low_mood": 0,
-                "anxiety": 0,
-                "sleep_issues": 0,
-                "self_worth": 0,
-                "attention": 0
-            },
-            "stage": "opening",
-            "last_active": datetime.now()
-        }
-
-    
-    # Ensure session exists in DB
+    # Pure in-memory lookup (scripts and already-loaded sessions). The request
+    # path uses load_session, which can rehydrate from the DB.
+    session = SESSIONS.get(session_id)
+    if session is None:
+        session = _new_session()
+        _retire(SESSIONS.put(session_id, session))
+
+    session["last_active"] = datetime.now()
+    return session
+
+async def load_session(session_id: str) -> Dict[str, Any]:
+    """
+    Returns the session, reconciled with v2_chat_history as the backend requires:
+    on a local miss (restart, eviction, another worker served it) signals,
+    stage and conversation are rehydrated from the DB; with the postgres
+    backend the local copy is also revalidated on every turn, except while
+    local writes are still queued (the DB would be behind us). A reset done
+    by another worker (different history_start) replaces the local copy.
+    """
+    session = SESSIONS.get(session_id)
+    if session is not None and (not SESSION_BACKEND.revalidate or session.get("pending_writes", 0)):
+        session["last_active"] = datetime.now()
+        return session
+
+    known = session.get("persisted", 0) if session is not None else 0
+    known_start = session.get("history_start", 0) if session is not None else 0
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        import json
-        cur.execute(
-            "INSERT INTO v2_chat_history (id, conversation) VALUES (%s, %s) ON CONFLICT (id) DO NOTHING", 
-            (session_id, json.dumps([]))
-        )
-        conn.commit()
-        cur.close()
-        conn.close()
+        snapshot = await SESSION_BACKEND.snapshot(session_id, known, known_start)
     except Exception as e:
-        print(f"DB Error ensuring session: {e}")
+        print(f"DB Error loading session: {e}")
+        snapshot = None
+
+    session = get_session(session_id)
+    if snapshot and snapshot["state"].get("history_start", 0) != session.get("history_start", 0):
+        # Reset on another worker: our copy belongs to the old history, adopt the DB's wholesale
+        _replace_session(session, snapshot)
+        _retire(SESSIONS.resize(session_id))
+    elif snapshot:
+        session.update(snapshot["state"])
+        if snapshot["conversation"] is not None:
+            # The DB is ahead of us: adopt its history, keep any local unsaved tail
+            unsaved = _unsaved_messages(session)
+            session["conversation"] = snapshot["conversation"] + unsaved
+            session["persisted"] = session["queued"] = len(snapshot["conversation"])
+            _retire(SESSIONS.resize(session_id))
+    return session
 
-    SESSIONS[session_id]["last_active"] = datetime.now()
-    return SESSIONS[session_id]
+def _replace_session(session: Dict[str, Any], snapshot: Dict[str, Any]):
+    fresh = _new_session()
+    for key in STATE_KEYS:
+        if key in snapshot["state"]:
+            session[key] = snapshot["state"][key]
+        elif key in fresh:
+            session[key] = fresh[key]
+        else:
+            session.pop(key, None)
+    session.pop("memory_retry_at", None)
+    session["conversation"] = snapshot["conversation"] or []
+    session["persisted"] = session["queued"] = len(session["conversation"])
 
-def update_session(session_id: str, data: Dict[str, Any]):
-    if session_id in SESSIONS:
-        SESSIONS[session_id].update(data)
-        SESSIONS[session_id]["last_active"] = datetime.now()
+async def clear_session(session_id: str):
+    """
+    Resets the session to a fresh state. DB history is kept, but the reset
+    is recorded (history_start) so rehydration doesn't bring it back.
+    """
+    session = await load_session(session_id)
+    start = session.get("history_start", 0) + len(session["conversation"])
+    SESSIONS.pop(session_id)
+    _retire([(session_id, session)])
+    await _flush_retired()
 
-def clear_session(session_id: str):
-    if session_id in SESSIONS:
-        del SESSIONS[session_id]
+    fresh = get_session(session_id)
+    fresh["history_start"] = start
+    await _save_state(session_id, fresh)
 
-def add_message(session_id: str, role: str, content: str):
+def append_message(session_id: str, role: str, content: str):
+    """Appends to the in-memory conversation only; call save_conversation to persist."""
     session = get_session(session_id)
     session["conversation"].append({"role": role, "content": content})
-    
-    # Save to DB (Update JSONB column)
-    import json
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(
-            "UPDATE v2_chat_history SET conversation = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
-            (json.dumps(session["conversation"]), session_id)
+    _retire(SESSIONS.grow(session_id, message_bytes(content)))
+
+def _retire(evicted):
+    for session_id, session in evicted:
+        pending = _unsaved_messages(session)
+        if pending:
+            _retiring.append((session_id, list(pending)))
+            _mark_queued(session, len(pending))
+
+async def _flush_retired():
+    while _retiring:
+        session_id, messages = _retiring.pop(0)
+        try:
+            if not await history_writer.enqueue_messages(session_id, messages):
+                await database.run(_append_messages, session_id, messages)
+        except Exception as e:
+            print(f"DB Error saving evicted session: {e}")
+
+async def _sweep_sessions(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            _retire(SESSIONS.sweep())
+            await _flush_retired()
+        except Exception as e:
+            print(f"Session sweep failed: {e}")
+
+def start_session_sweeper(interval: float = SESSION_SWEEP_INTERVAL):
+    global _sweeper_task
+    if _sweeper_task is None:
+        _sweeper_task = asyncio.create_task(_sweep_sessions(interval))
+
+async def stop_session_sweeper():
+    global _sweeper_task
+    if _sweeper_task is not None:
+        _sweeper_task.cancel()
+        try:
+            await _sweeper_task
+        except asyncio.CancelledError:
+            pass
+        _sweeper_task = None
+    await _flush_retired()
+
+def _unsaved_messages(session: Dict[str, Any]) -> List[Dict[str, str]]:
+    # "queued" counts the leading messages already handed to the writer;
+    # "persisted" those confirmed in v2_chat_messages (queued >= persisted)
+    return session["conversation"][session.get("queued", 0):]
+
+def _append_messages(cur, session_id: str, messages: List[Dict[str, str]], state: Optional[Dict[str, Any]] = None):
+    # Upsert so the first write of a session also creates its row
+    cur.execute(
+        """
+        INSERT INTO v2_chat_history (id, state) VALUES (%s, %s::jsonb)
+        ON CONFLICT (id) DO UPDATE
+        SET updated_at = CURRENT_TIMESTAMP, state = COALESCE(EXCLUDED.state, v2_chat_history.state)
+        """,
+        (session_id, encode_state(state))
+    )
+    # Append only the new messages; existing history is never rewritten
+    if messages:
+        execute_values(
+            cur,
+            "INSERT INTO v2_chat_messages (session_id, role, content) VALUES %s",
+            [(session_id, m["role"], m["content"]) for m in messages]
         )
-        conn.commit()
-        cur.close()
-        conn.close()
+
+def _mark_queued(session: Dict[str, Any], count: int):
+    session["queued"] = session.get("queued", 0) + count
+
+def _track_write(session: Dict[str, Any], then=None):
+    """
+    Counts a write of this session as pending until it reports back
+    (load_session skips DB revalidation meanwhile); returns its on_done(ok)
+    hook, which runs `then(ok)` first.
+    """
+    session["pending_writes"] = session.get("pending_writes", 0) + 1
+    def on_done(ok: bool):
+        if then is not None:
+            then(ok)
+        session["pending_writes"] -= 1
+    return on_done
+
+def _on_messages_written(session: Dict[str, Any], count: int):
+    """on_done hook for `count` queued messages: counts them as persisted once written."""
+    def on_done(ok: bool):
+        if ok:
+            session["persisted"] = session.get("persisted", 0) + count
+        elif session.get("queued", 0) == session.get("persisted", 0) + count:
+            # Nothing newer is in flight: hand the lost messages to the next save, in order
+            session["queued"] = session.get("persisted", 0)
+    return on_done
+
+def _write_batch(cur, batch: WriteBatch):
+    """Flushes a coalesced write-behind batch (many sessions) in one transaction."""
+    session_ids = batch.session_ids()
+    execute_values(
+        cur,
+        """
+        INSERT INTO v2_chat_history (id, state) VALUES %s
+        ON CONFLICT (id) DO UPDATE
+        SET updated_at = CURRENT_TIMESTAMP, state = COALESCE(EXCLUDED.state, v2_chat_history.state)
+        """,
+        [(sid, encode_state(batch.states.get(sid))) for sid in session_ids],
+        template="(%s, %s::jsonb)"
+    )
+    rows = [
+        (sid, m["role"], m["content"])
+        for sid, messages in batch.messages.items()
+        for m in messages
+    ]
+    if rows:
+        execute_values(cur, "INSERT INTO v2_chat_messages (session_id, role, content) VALUES %s", rows)
+    if batch.summaries:
+        execute_values(
+            cur,
+            "UPDATE v2_chat_history AS h SET summary = v.summary FROM (VALUES %s) AS v(id, summary) WHERE h.id = v.id::uuid",
+            list(batch.summaries.items())
+        )
+
+history_writer = WriteBehindQueue(_write_batch)
+
+async def _save_state(session_id: str, session: Dict[str, Any]):
+    state = session_state(session)
+    on_done = _track_write(session)
+    try:
+        if not await history_writer.enqueue_state(session_id, state, on_done):
+            await database.run(_append_messages, session_id, [], state)
+            on_done(True)
+    except BaseException as e:
+        on_done(False)
+        if not isinstance(e, Exception):
+            raise
+        print(f"DB Error saving session state: {e}")
+
+async def save_session_state(session_id: str, session: Dict[str, Any]) -> bool:
+    """
+    Persists state computed in the background for `session`; skipped if the
+    session was reset or evicted in the meantime, so stale state never
+    overwrites a fresh one.
+    """
+    if SESSIONS.get(session_id) is not session:
+        return False
+    await _save_state(session_id, session)
+    return True
+
+async def save_conversation(session_id: str):
+    """
+    Persists the session's not-yet-saved messages and its signal state:
+    queued for the next write-behind flush when the writer is running,
+    otherwise written directly.
+    """
+    session = get_session(session_id)
+    pending = _unsaved_messages(session)
+    if pending:
+        # Evicted history for this id (if any) must land before the new messages
+        await _flush_retired()
+        # Claim the messages before awaiting so an overlapping turn doesn't resend them;
+        # they count as persisted only once the write has succeeded
+        _mark_queued(session, len(pending))
+        on_done = _track_write(session, _on_messages_written(session, len(pending)))
+        try:
+            if not await history_writer.enqueue_messages(session_id, pending, on_done):
+                await database.run(_append_messages, session_id, pending)
+                on_done(True)
+        except BaseException as e:
+            on_done(False)
+            if not isinstance(e, Exception):
+                raise
+            print(f"DB Error saving conversation: {e}")
+    await _save_state(session_id, session)
+
+def add_message(session_id: str, role: str, content: str):
+    """Synchronous append + persist, for scripts outside the event loop."""
+    append_message(session_id, role, content)
+    session = get_session(session_id)
+    pending = _unsaved_messages(session)
+    try:
+        database.run_sync(_append_messages, session_id, pending)
+        _mark_queued(session, len(pending))
+        _on_messages_written(session, len(pending))(True)
     except Exception as e:
         print(f"DB Error saving message: {e}")
+
+def _save_summary(cur, session_id: str, summary: str):
+    # Update summary in the single table
+    cur.execute("UPDATE v2_chat_history SET summary = %s WHERE id = %s", (summary, session_id))
+
+async def save_summary(session_id: str, summary: str):
+    if not await history_writer.enqueue_summary(session_id, summary):
+        await database.run(_save_summary, session_id, summary)
@@ -0,0 +1,256 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from threading import Lock
+
+from .llm_client import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", "50"))
+# Samples older than this are ignored, so a model that was slow or failing gets traffic again
+ROUTER_WINDOW_SECONDS = float(os.getenv("ROUTER_WINDOW_SECONDS", "300"))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "5"))
+ROUTER_LATENCY_PERCENTILE = float(os.getenv("ROUTER_LATENCY_PERCENTILE", "0.9"))
+ROUTER_MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5"))
+# Time kept back for a fallback model with no latency samples yet
+ROUTER_FALLBACK_RESERVE_SECONDS = float(os.getenv("ROUTER_FALLBACK_RESERVE_SECONDS", "4.0"))
+# Start the fallback model alongside a primary call still running after this long (0 = no hedging)
+ROUTER_HEDGE_DELAY_SECONDS = float(os.getenv("ROUTER_HEDGE_DELAY_SECONDS", "0"))
+
+class ModelHealth:
+    """Rolling latency and error samples for one model (last `window` calls within `window_seconds`)."""
+
+    def __init__(self, window=ROUTER_WINDOW, window_seconds=ROUTER_WINDOW_SECONDS, min_samples=ROUTER_MIN_SAMPLES):
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)  # (timestamp, seconds, ok)
+
+    def record(self, seconds, ok):
+        self._samples.append((time.monotonic(), seconds, ok))
+
+    def _recent(self):
+        cutoff = time.monotonic() - self.window_seconds
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return list(self._samples)
+
+    def expected_latency(self):
+        """Latency percentile over recent calls (failed ones count with their elapsed time), or None."""
+        samples = self._recent()
+        if len(samples) < self.min_samples:
+            return None
+        latencies = sorted(seconds for _, seconds, _ in samples)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * ROUTER_LATENCY_PERCENTILE))]
+
+    def error_rate(self):
+        samples = self._recent()
+        if len(samples) < self.min_samples:
+            return 0.0
+        return sum(1 for _, _, ok in samples if not ok) / len(samples)
+
+    def snapshot(self):
+        samples = self._recent()
+        expected = self.expected_latency()
+        return {
+            "samples": len(samples),
+            f"p{round(ROUTER_LATENCY_PERCENTILE * 100)}_ms": round(expected * 1000, 1) if expected is not None else None,
+            "error_rate": round(self.error_rate(), 3),
+        }
+
+class ModelRouter:
+    """
+    Latency-aware choice between chat models, with fallback and optional hedging.
+
+    `models` are ChatModels in order of preference (the first is the
+    primary). Each turn goes to the first model that is healthy (error rate
+    under `max_error_rate`) and whose recent p90 latency, plus the time kept
+    back for the next model, fits the request's remaining Deadline; when
+    nothing fits, the fastest healthy model is used. A model's call is given
+    the deadline minus that reserve, so if it fails or runs out of time the
+    next model can still answer before the /chat timeout. With
+    `hedge_delay` > 0, non-streaming calls also start the next model when
+    the first has not answered after that many seconds and take whichever
+    finishes first. Streams fall back only before their first chunk.
+    """
+
+    def __init__(self, models, hedge_delay=ROUTER_HEDGE_DELAY_SECONDS, max_error_rate=ROUTER_MAX_ERROR_RATE,
+                 fallback_reserve=ROUTER_FALLBACK_RESERVE_SECONDS):
+        self.models = list(models)
+        self.hedge_delay = hedge_delay
+        self.max_error_rate = max_error_rate
+        self.fallback_reserve = fallback_reserve
+        self.margin = self.models[0].client.deadline_margin
+        self.health = {m.model_name: ModelHealth() for m in self.models}
+        self._lock = Lock()
+        self.stats = {"requests": 0, "fallbacks": 0, "hedged": 0, "hedge_wins": 0, "failed": 0}
+        self.decisions = {}
+        self.routed = {m.model_name: 0 for m in self.models}
+
+    def _reserve(self, model):
+        expected = self.health[model.model_name].expected_latency()
+        return expected if expected is not None else self.fallback_reserve
+
+    def route(self, deadline=None):
+        """Returns (candidates in call order, reason)."""
+        healthy = [m for m in self.models if self.health[m.model_name].error_rate() <= self.max_error_rate]
+        if not healthy:
+            healthy = list(self.models)
+        remaining = deadline.remaining() - self.margin if deadline is not None else None
+        for i, model in enumerate(healthy):
+            rest = healthy[i + 1:]
+            expected = self.health[model.model_name].expected_latency() or 0.0
+            reserve = self._reserve(rest[0]) if rest else 0.0
+            if remaining is None or expected + reserve <= remaining:
+                if model is self.models[0]:
+                    reason = "primary"
+                elif self.models[0] not in healthy:
+                    reason = "errors"
+                else:
+                    reason = "deadline"
+                return [model] + rest, reason
+        fastest = min(healthy, key=lambda m: self.health[m.model_name].expected_latency() or 0.0)
+        return [fastest], "fastest"
+
+    def _decide(self, candidates, reason):
+        with self._lock:
+            self.stats["requests"] += 1
+            self.decisions[reason] = self.decisions.get(reason, 0) + 1
+        if reason != "primary":
+            logger.info("router: %s -> %s", reason, candidates[0].model_name)
+
+    def _count(self, key, model=None):
+        with self._lock:
+            if key is not None:
+                self.stats[key] += 1
+            if model is not None:
+                self.routed[model.model_name] += 1
+
+    def _sub_deadline(self, candidates, i, deadline):
+        """Deadline for candidate i: keeps back time for the next candidate, if any."""
+        if deadline is None or i + 1 >= len(candidates):
+            return deadline
+        return deadline.shortened(self._reserve(candidates[i + 1]))
+
+    async def _call(self, model, messages, deadline):
+        started = time.perf_counter()
+        try:
+            result = await model.ainvoke(messages, deadline=deadline)
+        except (asyncio.CancelledError, DeadlineExceeded):
+            raise  # not the model's fault: nothing to record
+        except Exception:
+            self.health[model.model_name].record(time.perf_counter() - started, False)
+            raise
+        self.health[model.model_name].record(time.perf_counter() - started, True)
+        self._count(None, model)
+        return result
+
+    async def ainvoke(self, messages, deadline=None):
+        candidates, reason = self.route(deadline)
+        self._decide(candidates, reason)
+        if self.hedge_delay > 0 and len(candidates) > 1:
+            return await self._hedged(candidates[0], candidates[1], messages, deadline)
+
+        for i, model in enumerate(candidates):
+            try:
+                return await self._call(model, messages, self._sub_deadline(candidates, i, deadline))
+            except Exception as e:
+                if i + 1 >= len(candidates):
+                    self._count("failed")
+                    raise
+                logger.warning("router: %s failed (%r), falling back to %s",
+                               model.model_name, e, candidates[i + 1].model_name)
+                self._count("fallbacks")
+
+    async def _hedged(self, primary, backup, messages, deadline):
+        first = asyncio.create_task(self._call(primary, messages, deadline))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait({first}, timeout=self.hedge_delay)
+            if done:
+                if first.exception() is None:
+                    return first.result()
+                logger.warning("router: %s failed (%r), falling back to %s",
+                               primary.model_name, first.exception(), backup.model_name)
+                self._count("fallbacks")
+                try:
+                    return await self._call(backup, messages, deadline)
+                except Exception:
+                    self._count("failed")
+                    raise
+
+            self._count("hedged")
+            second = asyncio.create_task(self._call(backup, messages, deadline))
+            tasks.append(second)
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            self._count("failed")
+            raise error
+        finally:
+            # Also reached when the caller is cancelled during the hedge delay
+            unfinished = [task for task in tasks if not task.done()]
+            for task in unfinished:
+                task.cancel()
+            await asyncio.gather(*unfinished, return_exceptions=True)
+
+    async def astream(self, messages, deadline=None):
+        candidates, reason = self.route(deadline)
+        self._decide(candidates, reason)
+
+        for i, model in enumerate(candidates):
+            started = time.perf_counter()
+            stream = model.astream(messages, deadline=self._sub_deadline(candidates, i, deadline))
+            try:
+                first = await anext(stream)
+            except StopAsyncIteration:
+                self.health[model.model_name].record(time.perf_counter() - started, True)
+                self._count(None, model)
+                return
+            except Exception as e:
+                await stream.aclose()
+                if not isinstance(e, DeadlineExceeded):
+                    self.health[model.model_name].record(time.perf_counter() - started, False)
+                if i + 1 >= len(candidates):
+                    self._count("failed")
+                    raise
+                logger.warning("router: %s stream failed (%r), falling back to %s",
+                               model.model_name, e, candidates[i + 1].model_name)
+                self._count("fallbacks")
+                continue
+            break
+
+        try:
+            yield first
+            async for chunk in stream:
+                yield chunk
+        except Exception:
+            self.health[model.model_name].record(time.perf_counter() - started, False)
+            raise
+        finally:
+            await stream.aclose()
+        self.health[model.model_name].record(time.perf_counter() - started, True)
+        self._count(None, model)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+            decisions = dict(self.decisions)
+            routed = dict(self.routed)
+        return {
+            **stats,
+            "decisions": decisions,
+            "answered_by": routed,
+            "models": {name: health.snapshot() for name, health in self.health.items()},
+            "config": {"order": [m.model_name for m in self.models], "hedge_delay_s": self.hedge_delay,
+                       "max_error_rate": self.max_error_rate},
+        }
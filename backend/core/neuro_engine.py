@@ -1,16 +1,29 @@
 import os
 import re
-from langchain_groq import ChatGroq
 from langchain_core.messages import SystemMessage, HumanMessage
 from dotenv import load_dotenv
 from sentence_transformers import SentenceTransformer
 
 from . import signals
 from . import turn_controller
+from .turn_context import build_turn_context
+from .streaming import ExpressionTagFilter
+from .context_compression import CONTEXT_MAX_CHARS
+from .prompt_builder import PromptBuilder, Section, compact_history
+from .rolling_memory import memory_lines
+from .report_summary import ReportSummarizer
+from .llm_client import llm_client
+from .model_router import ModelRouter
 
 load_dotenv()
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+CHAT_MODEL = os.getenv("CHAT_MODEL", "llama-3.3-70b-versatile")
+# Faster model the router uses when the primary is slow, failing, or the deadline is short ("" disables)
+CHAT_FALLBACK_MODEL = os.getenv("CHAT_FALLBACK_MODEL", "llama-3.1-8b-instant")
+SUMMARY_MAP_MODEL = os.getenv("SUMMARY_MAP_MODEL", "llama-3.3-70b-versatile")
+# Report calls run in the background and can take longer than a chat turn
+SUMMARY_CALL_TIMEOUT_SECONDS = float(os.getenv("SUMMARY_CALL_TIMEOUT_SECONDS", "60"))
 
 SYSTEM_PROMPT = """You are a warm, emotionally intelligent mental health companion.
 
@@ -111,29 +124,63 @@ At the very end of every response, output exactly:
 [EXPRESSION: ONE_EXPRESSION]
 """
 
+# Rules that used to be re-sent as separate per-turn messages; appended to
+# SYSTEM_PROMPT so the whole prefix is identical on every request.
+STATIC_PREFIX = SYSTEM_PROMPT + """
+Reminder: Avoid generic empathy phrases. Do not start responses with 'It sounds like', 'That can be', or 'It's understandable'.
+If the user names a new emotion, respond in a new way.
+"""
+
+REPORT_SYSTEM_PROMPT = """You are an expert clinical summarizer.
+Your goal is to analyze the conversation history and generate a structured clinical report.
+
+You MUST include the following sections. If information is missing for a section, write "Not discussed".
+
+1. Key Summary
+2. Medical History
+3. Psychiatric History
+4. Family & Social Background
+5. Strengths
+6. Diagnosis (Professional Impression)
+7. Assessments (Mention any clear symptoms/signals observed)
+8. Core Issues Summary
+9. Goals
+10. Wider Recommendation (Therapeutic suggestions)
+11. Risk Assessment (Self-harm/Suicide indications)
+12. Review (Next steps)
+
+Format the output clearly with Markdown headers.
+Be objective, professional, and empathetic."""
+
 from threading import Lock
 
-from .resources import shared
+from .resources import shared, run_cpu
 
 class NeuroEngine:
     def __init__(self):
         if not GROQ_API_KEY:
             raise ValueError("GROQ_API_KEY is not set")
         
-        self.llm = ChatGroq(
-            temperature=0.85,
-            model_name="llama-3.3-70b-versatile",
-            api_key=GROQ_API_KEY,
-            max_tokens=350
-        )
+        # Shared pooled client: keep-alive connections, retries, per-call deadlines
+        self.llm = llm_client.model(CHAT_MODEL, temperature=0.85, max_tokens=350)
+        chat_models = [self.llm]
+        if CHAT_FALLBACK_MODEL and CHAT_FALLBACK_MODEL != CHAT_MODEL:
+            chat_models.append(llm_client.model(CHAT_FALLBACK_MODEL, temperature=0.85, max_tokens=350))
+        # Picks the model per turn from rolling latency/error stats and the remaining deadline
+        self.router = ModelRouter(chat_models)
+        
+        # Embedding model is now accessed via shared.embedder (micro-batched)
+        self.prompt_builder = PromptBuilder(STATIC_PREFIX)
         
-        # Embedding model is now accessed via shared.embedding_model
+        self.report_summarizer = ReportSummarizer(self._notes_llm, self._summary_llm, REPORT_SYSTEM_PROMPT)
 
     @property
     def embedding_model(self):
-        return shared.embedding_model
+        return shared.embedder
 
-    def _compress_context(self, chunks, max_chars=600):
+    def _compress_context(self, chunks, max_chars=CONTEXT_MAX_CHARS):
+        # chunks are normally already sentence-packed by ContextCompressor;
+        # the cut only bounds raw chunks passed by scripts
         joined = " ".join(chunks)
         return joined[:max_chars]
     
@@ -149,205 +196,240 @@ class NeuroEngine:
         else:
             memory["stage"] = "opening"
 
-    def generate_response(self, message: str, context: list, session_state: dict):
-        try:
-            # 1. Extract Signals
-            signals.extract_signals(message, session_state, model=self.embedding_model)
-            
-            # 2. Hard Turn Control
-            if turn_controller.user_asked_question(message):
-                session_state["turn_state"] = turn_controller.USER_LEADS
-            else:
-                session_state["turn_state"] = turn_controller.BOT_LEADS
-                
-            # 3. Response Mode Detection
-            mode = signals.detect_response_mode(message, self.embedding_model)
-            if session_state.get("lock_stage"):
-                mode = "safety"
-            session_state["response_mode"] = mode
-            
-            # 4. Update Stage
-            self._calculate_stage(session_state)
-            
-            # 5. Safety Override
-            if session_state.get("signals", {}).get("violence_intent", 0) > 0.5:
-                session_state["stage"] = "safety"
-                
-            recent = session_state.get("conversation", [])[-6:]
+    def _build_messages(self, message: str, context: list, session_state: dict, turn=None):
+        """Signal/mode/stage updates plus prompt assembly: everything before the LLM call."""
+        # 0. Per-turn context: one embedding shared by every stage below
+        if turn is None:
+            turn = build_turn_context(message, self.embedding_model)
+
+        # 1. Extract Signals
+        signals.extract_signals(message, session_state, model=self.embedding_model, turn=turn)
+        
+        # 2. Hard Turn Control
+        if turn_controller.user_asked_question(message):
+            session_state["turn_state"] = turn_controller.USER_LEADS
+        else:
+            session_state["turn_state"] = turn_controller.BOT_LEADS
             
-            # 6. Expression Logic
-            preferred_expression = None
-            stage = session_state.get("stage", "opening")
-            sig_vals = session_state.get("signals", {})
+        # 3. Response Mode Detection
+        mode = signals.detect_response_mode(message, self.embedding_model, turn=turn)
+        if session_state.get("lock_stage"):
+            mode = "safety"
+        session_state["response_mode"] = mode
+        
+        # 4. Update Stage
+        self._calculate_stage(session_state)
+        
+        # 5. Safety Override
+        if session_state.get("signals", {}).get("violence_intent", 0) > 0.5:
+            session_state["stage"] = "safety"
             
-            if stage == "safety":
-                preferred_expression = "SAFETY"
-            elif any(word in message.lower() for word in ["safe", "okay", "here", "thank you", "glad"]):
-                preferred_expression = "WARM"
-            elif sig_vals.get("vulnerability", 0) > 0.5 and not (sig_vals.get("stress", 0) > 0 or sig_vals.get("anxiety", 0) > 0):
-                preferred_expression = "COMFORTING"
-            elif stage == "exploration" and not sig_vals.get("distress"): # Note: distress key not in signals dict, maybe aggregate? assumed logic from main.py check
+        conversation = session_state.get("conversation", [])
+        
+        # 6. Expression Logic
+        preferred_expression = None
+        stage = session_state.get("stage", "opening")
+        sig_vals = session_state.get("signals", {})
+        
+        if stage == "safety":
+            preferred_expression = "SAFETY"
+        elif any(word in turn.text_lower for word in ["safe", "okay", "here", "thank you", "glad"]):
+            preferred_expression = "WARM"
+        elif sig_vals.get("vulnerability", 0) > 0.5 and not (sig_vals.get("stress", 0) > 0 or sig_vals.get("anxiety", 0) > 0):
+            preferred_expression = "COMFORTING"
+        elif stage == "exploration" and not sig_vals.get("distress"): # Note: distress key not in signals dict, maybe aggregate? assumed logic from main.py check
+            preferred_expression = "COMFORTING"
+        
+        if not preferred_expression:
+            if mode == "answer":
                 preferred_expression = "COMFORTING"
-            
-            if not preferred_expression:
-                if mode == "answer":
-                    preferred_expression = "COMFORTING"
-                elif mode == "vent":
-                    preferred_expression = "EMPATHETIC"
-                elif mode == "explore":
-                    preferred_expression = "REFLECTIVE"
-                    
-            # 7. Build Messages
-            langchain_messages = [
-                SystemMessage(content=SYSTEM_PROMPT),
-                SystemMessage(content=f"Conversation stage: {stage}"),
-                SystemMessage(content=f"Recent conversation: {recent}"),
-            ]
-            
-            # Context
-            if context and len(message.split()) > 3:
-                compressed_context = self._compress_context(context)
-                langchain_messages.append(SystemMessage(
-                    content=(
-                        "Internal reference material (DO NOT quote, summarize, or explain directly).\n"
-                        "Use only to guide tone, emotional pacing, and choice of questions.\n\n"
-                        + compressed_context
-                    )
-                ))
-                
-            if preferred_expression:
-                langchain_messages.append(SystemMessage(
-                    content=f"If appropriate, prefer the expression: {preferred_expression}"
-                ))
+            elif mode == "vent":
+                preferred_expression = "EMPATHETIC"
+            elif mode == "explore":
+                preferred_expression = "REFLECTIVE"
                 
-            # Safety Message
-            if stage == "safety":
-                langchain_messages.append(SystemMessage(
-                    content=(
-                        "CRITICAL SAFETY OVERRIDE:\n"
-                        "The user has expressed intent to harm others ('intent').\n"
-                        "- Do NOT validate the desire.\n"
-                        "- Do NOT explore consequences hypothetically.\n"
-                        "- Shift immediately to de-escalation and grounding.\n"
-                        "- Example text: 'I can't support harm to anyone. What I can do is help you slow this moment down...'"
-                    )
-                ))
+        # 7. Build Messages: static prefix + prioritized per-turn sections (see PromptBuilder)
+        reference_lines = []
+        if context and len(turn.tokens) > 3:
+            # Compressor output is already sentence-packed; raw chunks get the hard cut
+            if sum(len(c) for c in context) <= CONTEXT_MAX_CHARS:
+                reference_lines = list(context)
             else:
-                # Response Mode Handling
-                if mode == "answer":
-                    langchain_messages.append(SystemMessage( 
-                        content="The user is asking a direct question. You must answer clearly and directly. Do NOT ask any questions in this response. Do NOT suggest sitting with feelings."
-                    ))
-                elif mode == "vent":
-                    langchain_messages.append(SystemMessage(
-                        content="The user wants to be heard. Do NOT offer advice or solutions. Validate emotions only."
-                    ))
-                    
-            langchain_messages.append(SystemMessage(
-                content=(
-                    "Reminder: Avoid generic empathy phrases. "
-                    "Do not start responses with 'It sounds like', 'That can be', or 'It's understandable'."
-                )
-            ))
-            
-            # Enforcement Layer
-            if session_state.get("turn_state") == turn_controller.USER_LEADS:
-                langchain_messages.append(SystemMessage(
-                    content=(
-                        "The user asked a question. "
-                        "You must answer it directly. "
-                        "Do NOT ask any questions in this response."
-                    )
-                ))
-            
-            # Repetition Control
-            if len(session_state.get("conversation", [])) > 2:
-                last_bot = session_state["conversation"][-2]["content"]
-                langchain_messages.append(SystemMessage(
-                    content=f"PREVIOUS REPLY: '{last_bot}'.\nCONSTRAINT: You must NOT repeat this exact phrase. You must phrase your response differently."
-                ))
-                
-            langchain_messages.append(SystemMessage(
-                content="If the user names a new emotion, respond in a new way."
-            ))
-            
-            if stage == 'opening' and len(session_state.get("conversation", [])) <= 1:
-                langchain_messages.append(SystemMessage(
-                    content="This is the start. Vary your greeting. Do NOT simply say 'It's nice to meet you'."
-                ))
-                
-            # User Input
-            langchain_messages.append(HumanMessage(content=message))
+                reference_lines = [self._compress_context(context)]
+
+        instructions = []
+        # Safety Message
+        if stage == "safety":
+            instructions.append(
+                "CRITICAL SAFETY OVERRIDE:\n"
+                "The user has expressed intent to harm others ('intent').\n"
+                "- Do NOT validate the desire.\n"
+                "- Do NOT explore consequences hypothetically.\n"
+                "- Shift immediately to de-escalation and grounding.\n"
+                "- Example text: 'I can't support harm to anyone. What I can do is help you slow this moment down...'"
+            )
+        else:
+            # Response Mode Handling
+            if mode == "answer":
+                instructions.append("The user is asking a direct question. You must answer clearly and directly. Do NOT ask any questions in this response. Do NOT suggest sitting with feelings.")
+            elif mode == "vent":
+                instructions.append("The user wants to be heard. Do NOT offer advice or solutions. Validate emotions only.")
+
+        # Enforcement Layer
+        if session_state.get("turn_state") == turn_controller.USER_LEADS:
+            instructions.append(
+                "The user asked a question. "
+                "You must answer it directly. "
+                "Do NOT ask any questions in this response."
+            )
+
+        # Repetition Control: the previous reply is the last "You:" line of the history
+        if len(conversation) > 2:
+            instructions.append("CONSTRAINT: You must NOT repeat the phrasing of your previous reply (the last 'You:' line above). You must phrase your response differently.")
+
+        if stage == 'opening' and len(conversation) <= 1:
+            instructions.append("This is the start. Vary your greeting. Do NOT simply say 'It's nice to meet you'.")
+
+        sections = [
+            Section("stage", [f"Conversation stage: {stage}"]),
+            # Long-range context at a bounded size, maintained by RollingMemory
+            Section("memory", memory_lines(session_state), priority=1,
+                    header="Your private notes on earlier parts of this conversation (do not mention them):"),
+            Section("history", compact_history(conversation, message), priority=2,
+                    header="Recent conversation:", trim_from="start", min_lines=2),
+            Section("reference", reference_lines, priority=4, header=(
+                "Internal reference material (DO NOT quote, summarize, or explain directly).\n"
+                "Use only to guide tone, emotional pacing, and choice of questions."
+            )),
+            Section("expression", [f"If appropriate, prefer the expression: {preferred_expression}"] if preferred_expression else [],
+                    priority=3),
+            Section("instructions", instructions),
+        ]
+        langchain_messages, _ = self.prompt_builder.build(sections, message)
+        return langchain_messages
+
+    def _parse_response(self, response_text: str):
+        # Parse Tag
+        reply = response_text
+        expression = "NEUTRAL"
+        
+        match = re.search(r"\[(?:EXPRESSION:\s*)?([A-Z]+)\]", response_text)
+        if match:
+            expression = match.group(1)
+            reply = re.sub(r"\[(?:EXPRESSION:\s*)?([A-Z]+)\]", "", response_text).strip()
+        
+        return {
+            "reply": reply,
+            "expression": expression
+        }
+
+    def _fallback_response(self, e: Exception):
+        print(f"Error in NeuroEngine: {e}")
+        import traceback
+        traceback.print_exc()
+        return {
+            "reply": "I'm having a little trouble thinking right now, but I'm here for you.",
+            "expression": "NEUTRAL"
+        }
+
+    def generate_response(self, message: str, context: list, session_state: dict, turn=None):
+        try:
+            langchain_messages = self._build_messages(message, context, session_state, turn)
             
             # Invoke
             llm_response = self.llm.invoke(langchain_messages)
-            response_text = llm_response.content.strip()
-            
-            # Parse Tag
-            reply = response_text
-            expression = "NEUTRAL"
+            return self._parse_response(llm_response.content.strip())
             
-            match = re.search(r"\[(?:EXPRESSION:\s*)?([A-Z]+)\]", response_text)
-            if match:
-                expression = match.group(1)
-                reply = re.sub(r"\[(?:EXPRESSION:\s*)?([A-Z]+)\]", "", response_text).strip()
+        except Exception as e:
+            return self._fallback_response(e)
+
+    async def agenerate_response(self, message: str, context: list, session_state: dict, turn=None, deadline=None):
+        """
+        Async variant for the request path: prompt preparation runs on the model
+        executor and the LLM call is awaited, so the event loop stays free and
+        cancellation (e.g. the /chat timeout) actually stops the request.
+        `deadline` (llm_client.Deadline) bounds the LLM attempts and retries
+        and lets the router fall back to a faster model in time.
+        """
+        try:
+            langchain_messages = await run_cpu(self._build_messages, message, context, session_state, turn)
             
-            return {
-                "reply": reply,
-                "expression": expression
-            }
+            # Invoke
+            llm_response = await self.router.ainvoke(langchain_messages, deadline=deadline)
+            return self._parse_response(llm_response.content.strip())
             
         except Exception as e:
-            print(f"Error in NeuroEngine: {e}")
-            import traceback
-            traceback.print_exc()
-            return {
-                "reply": "I'm having a little trouble thinking right now, but I'm here for you.",
-                "expression": "NEUTRAL"
-            }
+            return self._fallback_response(e)
             
-    def generate_summary(self, conversation: list):
-        REPORT_SYSTEM_PROMPT = """You are an expert clinical summarizer.
-Your goal is to analyze the conversation history and generate a structured clinical report.
 
-You MUST include the following sections. If information is missing for a section, write "Not discussed".
+    async def astream_response(self, message: str, context: list, session_state: dict, turn=None, deadline=None):
+        """
+        Streaming variant of agenerate_response. Yields ("token", text) as the
+        LLM produces it, with expression tags stripped, then a final
+        ("done", {"reply", "expression"}) carrying the full reply.
+        """
+        tag_filter = ExpressionTagFilter()
+        try:
+            langchain_messages = await run_cpu(self._build_messages, message, context, session_state, turn)
+            
+            async for chunk in self.router.astream(langchain_messages, deadline=deadline):
+                text = tag_filter.feed(chunk.content or "")
+                if text:
+                    yield "token", text
+            text = tag_filter.finish()
+            if text:
+                yield "token", text
+                
+        except Exception as e:
+            if tag_filter.reply:
+                # Keep what the user has already seen
+                print(f"Error in NeuroEngine stream: {e}")
+            else:
+                fallback = self._fallback_response(e)
+                yield "token", fallback["reply"]
+                yield "done", fallback
+                return
+                
+        yield "done", {
+            "reply": tag_filter.reply,
+            "expression": tag_filter.expression or "NEUTRAL"
+        }
 
-1. Key Summary
-2. Medical History
-3. Psychiatric History
-4. Family & Social Background
-5. Strengths
-6. Diagnosis (Professional Impression)
-7. Assessments (Mention any clear symptoms/signals observed)
-8. Core Issues Summary
-9. Goals
-10. Wider Recommendation (Therapeutic suggestions)
-11. Risk Assessment (Self-harm/Suicide indications)
-12. Review (Next steps)
+    def _summary_messages(self, conversation: list):
+        conversation_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in conversation])
+        
+        return [
+            SystemMessage(content=REPORT_SYSTEM_PROMPT),
+            HumanMessage(content=f"Conversation Log:\n{conversation_text}\n\nPlease generate the comprehensive report based ONLY on the conversation above. If information is missing, state 'Not discussed'.")
+        ]
 
-Format the output clearly with Markdown headers.
-Be objective, professional, and empathetic."""
+    def _summary_llm(self):
+        # Use lower temperature for factual extraction; cached by the shared client
+        return llm_client.model(CHAT_MODEL, temperature=0.3, call_timeout=SUMMARY_CALL_TIMEOUT_SECONDS)
+
+    def _notes_llm(self):
+        # Per-segment note extraction for long conversations (see ReportSummarizer)
+        return llm_client.model(SUMMARY_MAP_MODEL, temperature=0.2, max_tokens=700,
+                                call_timeout=SUMMARY_CALL_TIMEOUT_SECONDS)
 
+    def generate_summary(self, conversation: list):
         try:
-            conversation_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in conversation])
-            
-            messages = [
-                SystemMessage(content=REPORT_SYSTEM_PROMPT),
-                HumanMessage(content=f"Conversation Log:\n{conversation_text}\n\nPlease generate the comprehensive report based ONLY on the conversation above. If information is missing, state 'Not discussed'.")
-            ]
-            
-            # Use lower temperature for factual extraction
-            llm_summary = ChatGroq(
-                temperature=0.3, # Lower temperature for factual extraction
-                model_name="llama-3.3-70b-versatile",
-                api_key=GROQ_API_KEY
-            )
-            
-            response = llm_summary.invoke(messages)
+            response = self._summary_llm().invoke(self._summary_messages(conversation))
             return response.content
             
         except Exception as e:
             print(f"Error generating summary: {e}")
             return f"Error generating report: {e}"
 
+    async def agenerate_summary(self, conversation: list, raise_errors: bool = False):
+        try:
+            # Map-reduce over conversation segments; short sessions stay a single call
+            return await self.report_summarizer.summarize(conversation, self._summary_messages)
+            
+        except Exception as e:
+            if raise_errors:
+                raise
+            print(f"Error generating summary: {e}")
+            return f"Error generating report: {e}"
+
 neuro_engine = NeuroEngine()
\ No newline at end of file
@@ -0,0 +1,119 @@
+import os
+from fnmatch import fnmatch
+
+import faiss
+import numpy as np
+
+from .vector_index import search_params
+
+RETRIEVER_PARTITIONS = os.getenv("RETRIEVER_PARTITIONS", "true").lower() == "true"
+# A session signal must reach this (decayed) score to steer retrieval
+ROUTE_MIN_SIGNAL = float(os.getenv("ROUTE_MIN_SIGNAL", "1.0"))
+ROUTE_MAX_SIGNALS = int(os.getenv("ROUTE_MAX_SIGNALS", "2"))
+# Selections covering more of the corpus than this search the whole index unfiltered
+ROUTE_MAX_FRACTION = float(os.getenv("ROUTE_MAX_FRACTION", "0.5"))
+# Distinct source selections whose search parameters are kept
+SELECTOR_CACHE_SIZE = 64
+
+# Domain -> meta.source patterns (lowercased fnmatch). A source may sit in several domains.
+DOMAINS = {
+    "anxiety": ["checkit_series_gad7*", "anxiety_stress.txt", "types_of_stress.txt"],
+    "stress": ["anxiety_stress.txt", "types_of_stress.txt", "coping*.txt"],
+    "coping": ["coping*.txt", "safety_protocol.txt"],
+    "autism": ["2001_bcetal_aq*", "neurodiversity*.txt"],
+    "adhd": ["sodbp_vanderbilt*", "neurodiversity*.txt"],
+    "clinical": ["dsm*", "jgi_*"],
+}
+
+# Dominant session signal -> domains worth searching
+SIGNAL_DOMAINS = {
+    "anxiety": ["anxiety", "coping"],
+    "stress": ["stress", "coping"],
+    "fatigue": ["stress", "coping"],
+    "sleep_issues": ["stress", "coping"],
+    "low_mood": ["coping"],
+    "self_worth": ["coping"],
+    "attention": ["adhd"],
+    "vulnerability": ["coping"],
+}
+
+# Explicit topics in the question win over the session's signals
+QUERY_DOMAINS = {
+    "adhd": ["adhd"], "attention deficit": ["adhd"], "hyperactiv": ["adhd"],
+    "autism": ["autism"], "autistic": ["autism"], "asperger": ["autism"], "neurodiver": ["autism", "adhd"],
+    "anxiety": ["anxiety"], "gad-7": ["anxiety"], "gad7": ["anxiety"], "panic": ["anxiety"],
+    "stress": ["stress"], "cope": ["coping"], "coping": ["coping"],
+    "dsm": ["clinical"], "diagnos": ["clinical"], "disorder": ["clinical"], "depress": ["clinical"],
+}
+
+def sources_for_domains(domains, sources):
+    """Known source names that belong to any of `domains`."""
+    patterns = [p for d in domains for p in DOMAINS.get(d, [])]
+    return {s for s in sources if any(fnmatch(s.lower(), p) for p in patterns)}
+
+def route(text_lower, session_signals=None, min_signal=ROUTE_MIN_SIGNAL, max_signals=ROUTE_MAX_SIGNALS):
+    """
+    Domains to search for a turn, or None for the whole index.
+
+    Topic words in the query decide first; otherwise the session's strongest
+    signals (at least `min_signal`, at most `max_signals` of them) do.
+    """
+    domains = []
+    for term, mapped in QUERY_DOMAINS.items():
+        if term in text_lower:
+            domains.extend(d for d in mapped if d not in domains)
+    if domains:
+        return domains
+
+    ranked = sorted((session_signals or {}).items(), key=lambda kv: -kv[1])
+    for signal, score in ranked[:max_signals]:
+        if score < min_signal:
+            break
+        domains.extend(d for d in SIGNAL_DOMAINS.get(signal, []) if d not in domains)
+    return domains or None
+
+class SourcePartitions:
+    """
+    Chunk ids of each knowledge-base source, for source-filtered searches.
+
+    Only int64 id arrays built from the chunk metadata are held, no vectors:
+    a filtered search runs the main index with an IDSelectorBatch over the
+    selected sources' ids, so it keeps the index's compression (IVF/PQ) and
+    adds no second copy of the corpus per worker. Ids stay global chunk ids.
+    """
+
+    def __init__(self, chunks):
+        by_source = {}
+        for i in range(len(chunks)):
+            by_source.setdefault(chunks.meta(i)["source"], []).append(i)
+        self.ids = {source: np.asarray(ids, dtype=np.int64) for source, ids in by_source.items()}
+        self.total = len(chunks)
+        self._params = {}
+
+    @property
+    def sources(self):
+        return list(self.ids)
+
+    def size(self, sources):
+        return sum(len(self.ids[s]) for s in sources if s in self.ids)
+
+    def narrows(self, sources):
+        """Whether filtering to `sources` is worth it (they hold at most ROUTE_MAX_FRACTION of the chunks)."""
+        return self.size(sources) <= ROUTE_MAX_FRACTION * self.total
+
+    def _search_params(self, index, sources):
+        params = self._params.get(sources)
+        if params is None:
+            ids = np.concatenate([self.ids[s] for s in sources if s in self.ids])
+            # The selector copies the ids; params only points at it, so both are kept
+            selector = faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+            params = (selector, search_params(index, selector))
+            if len(self._params) >= SELECTOR_CACHE_SIZE:
+                self._params.clear()
+            self._params[sources] = params
+        return params[1]
+
+    def search(self, index, q_emb, top_k, sources):
+        """[(distance, id)] of the best `top_k` chunks of `sources` in `index`."""
+        distances, ids = index.search(q_emb, top_k, params=self._search_params(index, sources))
+        return [(float(d), int(i)) for d, i in zip(distances[0], ids[0]) if i != -1]
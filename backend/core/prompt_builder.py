@@ -0,0 +1,154 @@
+import os
+import re
+import logging
+from dataclasses import dataclass, field
+from threading import Lock
+
+from langchain_core.messages import SystemMessage, HumanMessage
+
+logger = logging.getLogger(__name__)
+
+PROMPT_MAX_INPUT_TOKENS = int(os.getenv("PROMPT_MAX_INPUT_TOKENS", "2200"))
+PROMPT_HISTORY_MESSAGES = int(os.getenv("PROMPT_HISTORY_MESSAGES", "6"))
+PROMPT_HISTORY_MAX_CHARS = int(os.getenv("PROMPT_HISTORY_MAX_CHARS", "400"))  # per message
+# Chat-format framing per message (role header + separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # optional: fall back to the heuristic below
+    _ENCODING = None
+
+_PIECE = re.compile(r"\w+|[^\w\s]")
+
+def count_tokens(text: str) -> int:
+    """Token count for budgeting: exact BPE when tiktoken is installed, else a close estimate."""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    # Llama-3-style BPE: ~1 token per word or symbol, plus one per extra ~8 chars of long words
+    return sum(1 + len(p) // 8 for p in _PIECE.findall(text))
+
+@dataclass
+class Section:
+    """
+    One block of the per-turn system message.
+
+    priority 0 is never trimmed; otherwise higher priorities are trimmed
+    first. Trimming removes one line at a time (oldest first for
+    trim_from="start", e.g. history) down to `min_lines`; with min_lines=0
+    the section can disappear entirely.
+    """
+    name: str
+    lines: list
+    priority: int = 0
+    header: str = ""
+    trim_from: str = "end"
+    min_lines: int = 0
+    trimmed: int = field(default=0, init=False)
+
+    def render(self):
+        if not self.lines:
+            return ""
+        body = "\n".join(self.lines)
+        return f"{self.header}\n{body}" if self.header else body
+
+def compact_history(conversation, current_message=None, limit=PROMPT_HISTORY_MESSAGES,
+                    max_chars=PROMPT_HISTORY_MAX_CHARS):
+    """Last `limit` messages as 'User:'/'You:' lines, excluding the message being answered."""
+    messages = list(conversation)
+    if current_message is not None and messages and messages[-1]["role"] == "user" \
+            and messages[-1]["content"] == current_message:
+        messages = messages[:-1]
+    lines = []
+    for m in messages[-limit:] if limit else []:
+        speaker = "You" if m["role"] == "assistant" else "User"
+        text = " ".join(m["content"].split())
+        if len(text) > max_chars:
+            text = text[:max_chars].rstrip() + "…"
+        lines.append(f"{speaker}: {text}")
+    return lines
+
+class PromptBuilder:
+    """
+    Assembles [static prefix, per-turn system message, user message] under a token budget.
+
+    The static prefix is the same string object every turn, so the request
+    starts with byte-identical tokens and provider-side prompt caching can
+    apply. Everything that varies per turn goes into a single system message
+    after it, built from prioritized sections that are trimmed until the
+    whole prompt fits `max_tokens`.
+    """
+
+    def __init__(self, static_prefix, max_tokens=PROMPT_MAX_INPUT_TOKENS):
+        self.static_prefix = static_prefix
+        self.prefix_tokens = count_tokens(static_prefix) + MESSAGE_OVERHEAD_TOKENS
+        self.max_tokens = max_tokens
+        self._lock = Lock()
+        self.stats = {"turns": 0, "total_tokens": 0, "max_tokens_seen": 0, "over_budget": 0,
+                      "trimmed_turns": 0, "trimmed_lines": 0}
+
+    def build(self, sections, user_message):
+        user_tokens = count_tokens(user_message) + MESSAGE_OVERHEAD_TOKENS
+        sections = [s for s in sections if s.lines]
+        costs = {id(s): count_tokens(s.render()) for s in sections}
+        # "\n\n" joins between sections, plus the message framing
+        fixed = self.prefix_tokens + user_tokens + MESSAGE_OVERHEAD_TOKENS + 2 * max(len(sections) - 1, 0)
+        total = fixed + sum(costs.values())
+
+        trimmed_lines = 0
+        for section in sorted((s for s in sections if s.priority > 0), key=lambda s: -s.priority):
+            while total > self.max_tokens and len(section.lines) > section.min_lines:
+                section.lines.pop(0 if section.trim_from == "start" else -1)
+                section.trimmed += 1
+                trimmed_lines += 1
+                cost = count_tokens(section.render()) if section.lines else 0
+                total += cost - costs[id(section)]
+                costs[id(section)] = cost
+            if total <= self.max_tokens:
+                break
+
+        dynamic = "\n\n".join(s.render() for s in sections if s.lines)
+        messages = [SystemMessage(content=self.static_prefix)]
+        if dynamic:
+            messages.append(SystemMessage(content=dynamic))
+        messages.append(HumanMessage(content=user_message))
+
+        report = {
+            "prompt_tokens": total,
+            "prefix_tokens": self.prefix_tokens,
+            "user_tokens": user_tokens,
+            "sections": {s.name: costs[id(s)] for s in sections},
+            "trimmed": {s.name: s.trimmed for s in sections if s.trimmed},
+        }
+        self._record(report, trimmed_lines)
+        return messages, report
+
+    def _record(self, report, trimmed_lines):
+        total = report["prompt_tokens"]
+        over = total > self.max_tokens
+        with self._lock:
+            self.stats["turns"] += 1
+            self.stats["total_tokens"] += total
+            self.stats["max_tokens_seen"] = max(self.stats["max_tokens_seen"], total)
+            self.stats["over_budget"] += int(over)
+            self.stats["trimmed_turns"] += int(trimmed_lines > 0)
+            self.stats["trimmed_lines"] += trimmed_lines
+        logger.info(
+            "prompt tokens=%d (prefix=%d user=%d %s)%s%s", total, report["prefix_tokens"], report["user_tokens"],
+            " ".join(f"{k}={v}" for k, v in report["sections"].items()),
+            f" trimmed={report['trimmed']}" if report["trimmed"] else "",
+            " OVER BUDGET" if over else "",
+        )
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+        turns = stats["turns"]
+        return {
+            **stats,
+            "avg_prompt_tokens": round(stats["total_tokens"] / turns, 1) if turns else 0.0,
+            "prefix_tokens": self.prefix_tokens,
+            "max_input_tokens": self.max_tokens,
+            "tokenizer": "tiktoken:cl100k_base" if _ENCODING is not None else "estimate",
+        }
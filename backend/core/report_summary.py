@@ -0,0 +1,181 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+
+from langchain_core.messages import SystemMessage, HumanMessage
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SEGMENT_MESSAGES = int(os.getenv("SUMMARY_SEGMENT_MESSAGES", "24"))
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "4"))
+SUMMARY_SEGMENT_CACHE = int(os.getenv("SUMMARY_SEGMENT_CACHE", "512"))
+# Reduce inputs above this many characters of notes are merged in rounds first
+SUMMARY_REDUCE_MAX_CHARS = int(os.getenv("SUMMARY_REDUCE_MAX_CHARS", "24000"))
+SUMMARY_REDUCE_FAN_IN = 6
+
+REPORT_SECTIONS = (
+    "Key Summary",
+    "Medical History",
+    "Psychiatric History",
+    "Family & Social Background",
+    "Strengths",
+    "Diagnosis (Professional Impression)",
+    "Assessments",
+    "Core Issues Summary",
+    "Goals",
+    "Wider Recommendation",
+    "Risk Assessment",
+    "Review",
+)
+
+_SECTION_LIST = "\n".join(f"{i}. {name}" for i, name in enumerate(REPORT_SECTIONS, 1))
+
+# Bump when the prompts change so cached notes are not reused
+NOTES_PROMPT_VERSION = "1"
+SEGMENT_NOTES_PROMPT = f"""You are an expert clinical note-taker.
+You see ONE excerpt of a longer conversation between a user and a support companion.
+Extract factual notes from this excerpt only, grouped under these report sections:
+
+{_SECTION_LIST}
+
+For each section write short bullet points with what the USER said or clearly showed
+(symptoms, history, relationships, strengths, goals, any self-harm or harm-to-others indications).
+Write "-" under a section when the excerpt has nothing for it. Do not speculate or diagnose.
+Use the section names above as "### " headers."""
+
+MERGE_NOTES_PROMPT = f"""You merge clinical notes taken from consecutive excerpts of one conversation.
+Combine them into a single set of notes under the same section headers:
+
+{_SECTION_LIST}
+
+Keep every distinct fact, remove duplicates, keep later information when notes conflict.
+Write "-" under a section when no notes have anything for it. Use "### " headers."""
+
+REDUCE_INSTRUCTION = (
+    "Notes extracted from the conversation, in chronological order:\n\n{notes}\n\n"
+    "Please generate the comprehensive report based ONLY on these notes. "
+    "If information is missing, state 'Not discussed'."
+)
+
+def _transcript(messages):
+    return "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+
+class ReportSummarizer:
+    """
+    Map-reduce clinical report for long conversations.
+
+    The conversation is cut into fixed, index-aligned segments of
+    `segment_messages` messages. Each segment is mapped to notes under the 12
+    report sections (at most `max_concurrency` LLM calls at once), and one
+    reduce call writes the report from the notes. Notes are cached by segment
+    content, so re-summarizing a grown conversation only maps the segments
+    that changed (normally just the last one). Conversations that fit in one
+    segment keep the original single-call path.
+    """
+
+    def __init__(self, map_llm, reduce_llm, report_prompt, segment_messages=SUMMARY_SEGMENT_MESSAGES,
+                 max_concurrency=SUMMARY_MAX_CONCURRENCY, cache_size=SUMMARY_SEGMENT_CACHE,
+                 reduce_max_chars=SUMMARY_REDUCE_MAX_CHARS):
+        self._map_llm = map_llm
+        self._reduce_llm = reduce_llm
+        self.report_prompt = report_prompt
+        self.segment_messages = max(2, segment_messages)
+        self.max_concurrency = max_concurrency
+        self.cache_size = cache_size
+        self.reduce_max_chars = reduce_max_chars
+        self._cache = OrderedDict()
+        self._semaphore = None
+        self.stats = {"reports": 0, "single_call": 0, "segments": 0, "segments_cached": 0,
+                      "map_calls": 0, "merge_calls": 0, "reduce_calls": 0, "total_ms": 0.0}
+
+    def segments(self, conversation):
+        n = self.segment_messages
+        return [conversation[i:i + n] for i in range(0, len(conversation), n)]
+
+    def _key(self, kind, text):
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return (kind, NOTES_PROMPT_VERSION, digest)
+
+    def _cached(self, key):
+        notes = self._cache.get(key)
+        if notes is not None:
+            self._cache.move_to_end(key)
+        return notes
+
+    def _store(self, key, notes):
+        self._cache[key] = notes
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _call(self, llm, system_prompt, content):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            response = await llm().ainvoke([SystemMessage(content=system_prompt), HumanMessage(content=content)])
+        return response.content.strip()
+
+    async def _segment_notes(self, segment):
+        text = _transcript(segment)
+        key = self._key("map", text)
+        notes = self._cached(key)
+        if notes is not None:
+            self.stats["segments_cached"] += 1
+            return notes
+        self.stats["map_calls"] += 1
+        notes = await self._call(self._map_llm, SEGMENT_NOTES_PROMPT, f"Conversation excerpt:\n{text}")
+        self._store(key, notes)
+        return notes
+
+    async def _merge(self, notes):
+        """Merges notes in groups until they fit one reduce prompt."""
+        while len(notes) > 1 and sum(len(n) for n in notes) > self.reduce_max_chars:
+            groups = [notes[i:i + SUMMARY_REDUCE_FAN_IN] for i in range(0, len(notes), SUMMARY_REDUCE_FAN_IN)]
+            notes = await asyncio.gather(*(self._merge_group(g) for g in groups))
+        return notes
+
+    async def _merge_group(self, group):
+        if len(group) == 1:
+            return group[0]
+        text = "\n\n".join(f"## Excerpt {i}\n{n}" for i, n in enumerate(group, 1))
+        key = self._key("merge", text)
+        merged = self._cached(key)
+        if merged is None:
+            self.stats["merge_calls"] += 1
+            merged = await self._call(self._map_llm, MERGE_NOTES_PROMPT, text)
+            self._store(key, merged)
+        return merged
+
+    async def summarize(self, conversation, single_call_messages):
+        """Report markdown. `single_call_messages(conversation)` builds the one-shot prompt for short sessions."""
+        started = time.perf_counter()
+        segments = self.segments(conversation)
+        try:
+            if len(segments) <= 1:
+                self.stats["single_call"] += 1
+                response = await self._reduce_llm().ainvoke(single_call_messages(conversation))
+                return response.content
+
+            self.stats["segments"] += len(segments)
+            notes = await asyncio.gather(*(self._segment_notes(s) for s in segments))
+            notes = await self._merge(list(notes))
+            joined = "\n\n".join(f"## Part {i}\n{n}" for i, n in enumerate(notes, 1))
+            self.stats["reduce_calls"] += 1
+            return await self._call(self._reduce_llm, self.report_prompt, REDUCE_INSTRUCTION.format(notes=joined))
+        finally:
+            self.stats["reports"] += 1
+            self.stats["total_ms"] += (time.perf_counter() - started) * 1000
+            logger.info("summary: %d messages, %d segments in %.0f ms",
+                        len(conversation), len(segments), (time.perf_counter() - started) * 1000)
+
+    def metrics(self):
+        reports = self.stats["reports"]
+        return {
+            **{k: v for k, v in self.stats.items() if k != "total_ms"},
+            "avg_report_ms": round(self.stats["total_ms"] / reports, 1) if reports else 0.0,
+            "cached_notes": len(self._cache),
+            "config": {"segment_messages": self.segment_messages, "max_concurrency": self.max_concurrency},
+        }
@@ -1,9 +1,37 @@
 from sentence_transformers import SentenceTransformer
+from concurrent.futures import ThreadPoolExecutor
 from threading import Lock
+import asyncio
 import logging
+import os
+
+from .embedding_service import EmbeddingService
+from .embedding_cache import EmbeddingCache
 
 logger = logging.getLogger(__name__)
 
+# Bounded pool for CPU-bound model work (MiniLM encode, FAISS search, prompt prep).
+# Encodes from these threads are coalesced by the EmbeddingService, so the pool
+# bounds how many turns can share one micro-batch rather than raw CPU use.
+MODEL_EXECUTOR_WORKERS = int(os.getenv("MODEL_EXECUTOR_WORKERS", "8"))
+
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+# Inference backend for the embedding model: "fp32" (stock) or "int8"
+# (dynamic quantization of the Linear layers; smaller and faster on CPU).
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "fp32").lower()
+EMBEDDING_BACKENDS = ("fp32", "int8")
+
+def load_embedding_model(backend: str = EMBEDDING_BACKEND, model_name: str = EMBEDDING_MODEL_NAME):
+    """Builds the CPU embedding model for the given backend."""
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}', expected one of {EMBEDDING_BACKENDS}")
+    model = SentenceTransformer(model_name, device="cpu")
+    if backend == "int8":
+        import torch
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    model.eval()
+    return model
+
 class SharedResources:
     _instance = None
     _lock = Lock()
@@ -11,6 +39,12 @@ class SharedResources:
     def __init__(self):
         self._embedding_model = None
         self._model_lock = Lock()
+        # Micro-batching front door with an LRU cache; the model itself is still loaded lazily
+        self.embedder = EmbeddingService(
+            lambda: self.embedding_model,
+            cache=EmbeddingCache(),
+            model_id=self.embedding_model_id,
+        )
 
     @classmethod
     def get_instance(cls):
@@ -24,11 +58,22 @@ class SharedResources:
         """Lazy-loaded, thread-safe embedding model."""
         with self._model_lock:
             if self._embedding_model is None:
-                logger.info("Initializing Shared Embedding Model (Lazy, CPU)...")
-                # Using the exact same model definition as before
-                self._embedding_model = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
+                logger.info(f"Initializing Shared Embedding Model (Lazy, CPU, {EMBEDDING_BACKEND})...")
+                self._embedding_model = load_embedding_model(EMBEDDING_BACKEND)
                 logger.info("Shared Embedding Model Ready.")
         return self._embedding_model
 
+    @property
+    def embedding_model_id(self):
+        """Identifies the vectors the model produces (name + backend), e.g. for cache keys."""
+        return f"{EMBEDDING_MODEL_NAME}:{EMBEDDING_BACKEND}"
+
 # Global singleton access
 shared = SharedResources.get_instance()
+
+_model_executor = ThreadPoolExecutor(max_workers=MODEL_EXECUTOR_WORKERS, thread_name_prefix="model")
+
+async def run_cpu(fn, *args):
+    """Runs blocking CPU work on the model executor so the event loop stays responsive."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_model_executor, fn, *args)
@@ -0,0 +1,113 @@
+import os
+import time
+from threading import Lock
+
+import numpy as np
+
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "512"))
+RETRIEVAL_CACHE_MAX_DISTANCE = float(os.getenv("RETRIEVAL_CACHE_MAX_DISTANCE", "0.05"))  # cosine distance
+
+class SemanticRetrievalCache:
+    """
+    Bounded cache of retrieval results keyed by query embedding.
+
+    A lookup is a hit when a cached query with the same search parameters
+    lies within `max_distance` cosine distance of the new one. Embeddings live
+    in one preallocated matrix so a lookup is a single matrix-vector product;
+    the least recently used slot is overwritten once the cache is full.
+    Entries are tagged with the index version and dropped wholesale by
+    clear() when the index is rebuilt.
+    """
+
+    def __init__(self, max_entries=RETRIEVAL_CACHE_MAX_ENTRIES, max_distance=RETRIEVAL_CACHE_MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._matrix = None
+        self._keys = [None] * max_entries
+        self._values = [None] * max_entries
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._size = 0
+        self._lock = Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0,
+                      "miss_search_ms": 0.0, "lookup_ms": 0.0, "saved_ms": 0.0}
+
+    @staticmethod
+    def _unit(embedding):
+        q = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        return q / max(float(np.linalg.norm(q)), 1e-12)
+
+    def get(self, embedding, key):
+        """Cached value for a query near `embedding` searched with `key`, else None."""
+        if self.max_entries <= 0:
+            return None
+        started = time.perf_counter()
+        q = self._unit(embedding)
+        with self._lock:
+            value = None
+            if self._size:
+                sims = self._matrix[:self._size] @ q
+                # Nearest first; parameters must match exactly
+                for slot in np.argsort(-sims):
+                    if 1.0 - float(sims[slot]) > self.max_distance:
+                        break
+                    if self._keys[slot] == key:
+                        value = self._values[slot]
+                        self._last_used[slot] = time.monotonic()
+                        break
+            self.stats["lookup_ms"] += (time.perf_counter() - started) * 1000
+            if value is None:
+                self.stats["misses"] += 1
+            else:
+                self.stats["hits"] += 1
+                self.stats["saved_ms"] += self._avg_miss_ms()
+            return value
+
+    def put(self, embedding, key, value, search_ms=0.0):
+        """Stores a result; `search_ms` is what the miss cost, used to estimate savings."""
+        if self.max_entries <= 0:
+            return
+        q = self._unit(embedding)
+        with self._lock:
+            self.stats["miss_search_ms"] += search_ms
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, q.shape[0]), dtype=np.float32)
+            if self._size < self.max_entries:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.argmin(self._last_used))
+                self.stats["evictions"] += 1
+            self._matrix[slot] = q
+            self._keys[slot] = key
+            self._values[slot] = value
+            self._last_used[slot] = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._keys = [None] * self.max_entries
+            self._values = [None] * self.max_entries
+            self._last_used[:] = 0
+            self._size = 0
+            self.stats["invalidations"] += 1
+
+    def _avg_miss_ms(self):
+        misses = self.stats["misses"]
+        return self.stats["miss_search_ms"] / misses if misses else 0.0
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+            size = self._size
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "hit_rate": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": size,
+            "evictions": stats["evictions"],
+            "invalidations": stats["invalidations"],
+            "avg_lookup_ms": round(stats["lookup_ms"] / lookups, 4) if lookups else 0.0,
+            "avg_miss_search_ms": round(stats["miss_search_ms"] / stats["misses"], 4) if stats["misses"] else 0.0,
+            "saved_ms": round(stats["saved_ms"], 2),
+            "config": {"max_entries": self.max_entries, "max_distance": self.max_distance},
+        }
@@ -1,49 +1,157 @@
 import faiss
-import json
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from pathlib import Path
 import os
+import time
+from collections import namedtuple
+from threading import Lock
 
 # Adjust path assuming this runs from backend/
-INDEX_PATH = Path("vector_store/mental_health.index")
-STORE_PATH = Path("vector_store/mental_health.json")
+VECTOR_DIR = Path("vector_store")
+
+# How often (seconds) to check whether ingest.py has swapped in a new index
+RETRIEVER_RELOAD_INTERVAL = float(os.getenv("RETRIEVER_RELOAD_INTERVAL", "30"))
 
 # 1. Disable parallelism/progress bars as per performance fix
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 from .resources import shared
+from .chunk_store import open_chunk_store
+from .vector_index import configure_search, describe, active_build_dir, INDEX_FILE, CHUNKS_FILE, STORE_FILE
+from .retrieval_cache import SemanticRetrievalCache
+from .partitions import RETRIEVER_PARTITIONS, SourcePartitions, sources_for_domains
+
+# One retrieved chunk; distance is the raw FAISS (squared L2) distance
+Hit = namedtuple("Hit", ["id", "text", "distance"])
+
+def _index_version(build_dir):
+    try:
+        st = os.stat(build_dir / INDEX_FILE)
+    except FileNotFoundError:
+        return None
+    return (str(build_dir), st.st_mtime_ns, st.st_size, st.st_ino)
 
 class PDFRetriever:
     def __init__(self):
         self.index = None
-        self.store = None
-        # Model is accessed via shared.embedding_model
-        
-        if INDEX_PATH.exists() and STORE_PATH.exists():
+        self.chunks = None
+        self.index_info = None
+        self.version = None
+        self.partitions = None
+        self._active = (None, None, None, None)
+        self._stats_lock = Lock()
+        self.stats = {"searches_full": 0, "searches_partitioned": 0, "vectors_scanned": 0}
+        # Queries are embedded via shared.embedder
+        self.cache = SemanticRetrievalCache()
+        self._reload_lock = Lock()
+        self._checked_at = time.monotonic()
+        self._load()
+
+    def _load(self):
+        # Every artifact is read from the same build directory
+        build_dir = active_build_dir(VECTOR_DIR)
+        index_path = build_dir / INDEX_FILE
+        chunks_path, store_path = build_dir / CHUNKS_FILE, build_dir / STORE_FILE
+        if index_path.exists() and (chunks_path.exists() or store_path.exists()):
             print("Loading PDF Vector Store (Index only)...")
-            self.index = faiss.read_index(str(INDEX_PATH))
-            with open(STORE_PATH, "r") as f:
-                self.store = json.load(f)
+            version = _index_version(build_dir)
+            index = faiss.read_index(str(index_path))
+            # nprobe / efSearch from IVF_NPROBE / HNSW_EF_SEARCH
+            configure_search(index)
+            # Memory-mapped; chunk texts are only decoded when retrieved
+            chunks = open_chunk_store(chunks_path, store_path)
+            if index.ntotal != len(chunks):
+                print(f"Warning: index has {index.ntotal} vectors but store has {len(chunks)} chunks; rebuild with ingest.py")
+            partitions = None
+            if RETRIEVER_PARTITIONS and index.ntotal == len(chunks):
+                # Id lists per source; filtered searches run on the main index
+                partitions = SourcePartitions(chunks)
+            # The old chunk store is left to the GC: in-flight searches may still read it
+            self._active = (index, chunks, version, partitions)  # swapped as one reference for searches
+            self.index, self.chunks, self.version, self.partitions = index, chunks, version, partitions
+            self.index_info = describe(index)
         else:
-            print(f"Warning: PDF Vector Store not found at {INDEX_PATH.absolute()}.")
+            print(f"Warning: PDF Vector Store not found at {index_path.absolute()}.")
+
+    def _maybe_reload(self):
+        """Picks up an index rebuilt by ingest.py and invalidates cached results."""
+        now = time.monotonic()
+        if now - self._checked_at < RETRIEVER_RELOAD_INTERVAL:
+            return
+        with self._reload_lock:
+            if now - self._checked_at < RETRIEVER_RELOAD_INTERVAL:
+                return
+            self._checked_at = now
+            if _index_version(active_build_dir(VECTOR_DIR)) in (None, self.version):
+                return
+            try:
+                self._load()
+            except Exception as e:
+                print(f"Retriever reload Error: {e}")
+                return
+            self.cache.clear()
 
-    def retrieve(self, query: str, top_k: int = 2): # Reduced top_k default
+    def retrieve(self, query: str, top_k: int = 2, embedding=None, sources=None, domains=None): # Reduced top_k default
+        """
+        Top-k chunk texts for a query. `sources` (meta.source names) and/or
+        `domains` (see partitions.DOMAINS) restrict the search to those
+        partitions; with neither, or none matching, the whole index is searched.
+        """
+        hits = self.search(query, top_k=top_k, embedding=embedding, sources=sources, domains=domains)
+        return [hit.text for hit in hits]
+
+    def search(self, query: str, top_k: int = 2, embedding=None, sources=None, domains=None):
+        """Like retrieve(), but returns Hits carrying chunk ids and distances."""
+        self._maybe_reload()
         if not self.index:
             return []
 
-        model = shared.embedding_model
-        # 3. Only embed user query, no progress bar
-        q_emb = np.array(model.encode([query], show_progress_bar=False), dtype="float32")
-        distances, indices = self.index.search(q_emb, top_k)
+        if embedding is not None:
+            # Reuse the turn embedding instead of encoding the query again
+            q_emb = np.asarray(embedding, dtype="float32").reshape(1, -1)
+        else:
+            # 3. Only embed user query (batched with concurrent requests)
+            q_emb = np.array(shared.embedder.encode([query]), dtype="float32")
+        index, chunks, version, partitions = self._active
+
+        selected = None
+        if partitions is not None and (sources or domains):
+            selected = set(sources or ()) & set(partitions.sources)
+            if domains:
+                selected |= sources_for_domains(domains, partitions.sources)
+            # Filtering only pays off when the sources are a small part of the corpus
+            selected = frozenset(selected) if selected and partitions.narrows(selected) else None
+
+        # Near-duplicate queries reuse an earlier search's (id, distance) pairs;
+        # the version in the key keeps a search racing a reload from caching stale ids
+        key = (version, top_k, selected)
+        found = self.cache.get(q_emb[0], key)
+        if found is None:
+            started = time.perf_counter()
+            if selected is not None:
+                found = [(idx, distance) for distance, idx in partitions.search(index, q_emb, top_k, selected)]
+                scanned = partitions.size(selected)
+            else:
+                distances, indices = index.search(q_emb, top_k)
+                found = [(int(idx), float(distance)) for distance, idx in zip(distances[0], indices[0])
+                         if idx != -1 and idx < len(chunks)]
+                scanned = index.ntotal
+            self.cache.put(q_emb[0], key, found, search_ms=(time.perf_counter() - started) * 1000)
+            with self._stats_lock:
+                self.stats["searches_partitioned" if selected is not None else "searches_full"] += 1
+                self.stats["vectors_scanned"] += scanned
 
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx != -1 and idx < len(self.store["texts"]):
-                # Optional: Filter by distance if needed
-                results.append(self.store["texts"][idx])
+        return [Hit(idx, chunks.text(idx), distance) for idx, distance in found]
 
-        return results
+    def metrics(self):
+        return {
+            "index": self.index_info,
+            "chunks": len(self.chunks) if self.chunks is not None else 0,
+            "cache": self.cache.metrics(),
+            "partitions": {s: len(ids) for s, ids in self.partitions.ids.items()} if self.partitions else None,
+            **self.stats,
+        }
 
 # Singleton instance
 retriever = PDFRetriever()
@@ -0,0 +1,149 @@
+import os
+import re
+import json
+import asyncio
+import logging
+import time
+
+from langchain_core.messages import SystemMessage, HumanMessage
+
+from .memory import save_session_state
+from .llm_client import llm_client
+
+logger = logging.getLogger(__name__)
+
+ROLLING_MEMORY_EVERY_TURNS = int(os.getenv("ROLLING_MEMORY_EVERY_TURNS", "4"))
+ROLLING_MEMORY_MODEL = os.getenv("ROLLING_MEMORY_MODEL", "llama-3.1-8b-instant")
+ROLLING_MEMORY_CONCURRENCY = int(os.getenv("ROLLING_MEMORY_CONCURRENCY", "2"))
+ROLLING_MEMORY_MAX_FACTS = int(os.getenv("ROLLING_MEMORY_MAX_FACTS", "8"))
+ROLLING_MEMORY_SUMMARY_WORDS = int(os.getenv("ROLLING_MEMORY_SUMMARY_WORDS", "80"))
+FACT_MAX_CHARS = 120
+
+MEMORY_SYSTEM_PROMPT = f"""You maintain private notes about an ongoing supportive conversation.
+You are given the current notes and the newest messages. Return updated notes as JSON:
+{{"summary": "<at most {ROLLING_MEMORY_SUMMARY_WORDS} words: what the user is going through and how the conversation has developed>",
+ "facts": ["<short durable fact about the user: names, relationships, events, preferences, goals>", ...]}}
+Keep at most {ROLLING_MEMORY_MAX_FACTS} facts, most important first; drop facts the newest messages contradict.
+Only use what the user actually said. Output the JSON object and nothing else."""
+
+JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+def memory_lines(session):
+    """Prompt lines for a session's rolling memory (empty until the first update)."""
+    memory = session.get("memory") or {}
+    lines = []
+    if memory.get("summary"):
+        lines.append(memory["summary"])
+    lines.extend(f"- {fact}" for fact in memory.get("facts", []))
+    return lines
+
+def _parse_notes(text):
+    match = JSON_OBJECT.search(text)
+    if not match:
+        raise ValueError("no JSON object in memory update")
+    data = json.loads(match.group(0))
+    summary = " ".join(str(data.get("summary", "")).split())
+    words = summary.split()
+    if len(words) > ROLLING_MEMORY_SUMMARY_WORDS:
+        summary = " ".join(words[:ROLLING_MEMORY_SUMMARY_WORDS]) + "…"
+    facts = [" ".join(str(f).split())[:FACT_MAX_CHARS] for f in data.get("facts", []) if str(f).strip()]
+    return summary, facts[:ROLLING_MEMORY_MAX_FACTS]
+
+class RollingMemory:
+    """
+    Per-session rolling summary + key facts, refreshed off the request path.
+
+    After a turn is saved, schedule() starts a background update once
+    `every_turns` user/assistant exchanges have accumulated since the last
+    one. The update folds only those new messages into the previous notes
+    (one small-model call), stores them in session["memory"] and persists
+    them with the session state in v2_chat_history. The chat prompt renders
+    the notes at a bounded size, however long the session gets.
+    """
+
+    def __init__(self, persist, every_turns=ROLLING_MEMORY_EVERY_TURNS, model_name=ROLLING_MEMORY_MODEL,
+                 concurrency=ROLLING_MEMORY_CONCURRENCY):
+        self._persist = persist
+        self.every_messages = max(1, every_turns) * 2
+        self.model_name = model_name
+        self.concurrency = concurrency
+        self._semaphore = None
+        self._tasks = {}
+        self.stats = {"scheduled": 0, "updated": 0, "failed": 0, "skipped_stale": 0, "total_update_ms": 0.0}
+
+    def llm(self):
+        return llm_client.model(self.model_name, temperature=0.2, max_tokens=400)
+
+    def _due(self, session):
+        covered = (session.get("memory") or {}).get("upto", 0)
+        size = len(session.get("conversation", []))
+        if size < covered:
+            covered = 0  # conversation was replaced (reset / rehydration)
+        # The backoff lives in the session, so it goes away with a reset or eviction
+        return size - covered >= self.every_messages and size >= session.get("memory_retry_at", 0)
+
+    def schedule(self, session_id, session):
+        """Starts a background update if one is due; returns immediately."""
+        if session_id in self._tasks or not self._due(session):
+            return False
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.stats["scheduled"] += 1
+        task = asyncio.create_task(self._update(session_id, session))
+        self._tasks[session_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(session_id, None))
+        return True
+
+    async def _update(self, session_id, session):
+        async with self._semaphore:
+            started = time.perf_counter()
+            memory = session.get("memory") or {}
+            conversation = session.get("conversation", [])
+            covered = memory.get("upto", 0) if memory.get("upto", 0) <= len(conversation) else 0
+            upto = len(conversation)
+            new_messages = conversation[covered:upto]
+
+            notes = json.dumps({"summary": memory.get("summary", ""), "facts": memory.get("facts", [])})
+            transcript = "\n".join(f"{m['role']}: {m['content']}" for m in new_messages)
+            try:
+                response = await self.llm().ainvoke([
+                    SystemMessage(content=MEMORY_SYSTEM_PROMPT),
+                    HumanMessage(content=f"Current notes:\n{notes}\n\nNewest messages:\n{transcript}"),
+                ])
+                summary, facts = _parse_notes(response.content)
+            except Exception as e:
+                self.stats["failed"] += 1
+                # Don't hammer a failing model: wait for another batch of turns
+                session["memory_retry_at"] = upto + self.every_messages
+                logger.warning("Rolling memory update failed for %s: %s", session_id, e)
+                return
+
+            session.pop("memory_retry_at", None)
+            if session.get("conversation") is not conversation or len(conversation) < upto:
+                # Rehydrated while we were summarizing
+                self.stats["skipped_stale"] += 1
+                return
+            session["memory"] = {"summary": summary, "facts": facts, "upto": upto}
+            self.stats["total_update_ms"] += (time.perf_counter() - started) * 1000
+            if await self._persist(session_id, session):
+                self.stats["updated"] += 1
+            else:
+                self.stats["skipped_stale"] += 1  # reset or evicted meanwhile
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def metrics(self):
+        updated = self.stats["updated"]
+        return {
+            **{k: v for k, v in self.stats.items() if k != "total_update_ms"},
+            "in_flight": len(self._tasks),
+            "avg_update_ms": round(self.stats["total_update_ms"] / updated, 1) if updated else 0.0,
+            "config": {"every_turns": self.every_messages // 2, "model": self.model_name,
+                       "concurrency": self.concurrency},
+        }
+
+rolling_memory = RollingMemory(save_session_state)
@@ -0,0 +1,72 @@
+import os
+import json
+
+from . import database
+
+# "memory": one worker; the in-process store is authoritative and the DB is
+#           only read on a cache miss (e.g. after a restart).
+# "postgres": many workers/instances; v2_chat_history is authoritative and
+#           local copies are revalidated against it on every turn.
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+
+# Session fields persisted alongside the conversation (v2_chat_history.state)
+STATE_KEYS = ("signals", "stage", "lock_stage", "history_start", "memory")
+
+def session_state(session):
+    return {k: session[k] for k in STATE_KEYS if k in session}
+
+def encode_state(state):
+    return json.dumps(state) if state is not None else None
+
+def _load_snapshot(cur, session_id, known_messages, known_start=0):
+    cur.execute(
+        """
+        SELECT h.state,
+               (SELECT count(*) FROM v2_chat_messages m WHERE m.session_id = h.id) AS message_count
+        FROM v2_chat_history h
+        WHERE h.id = %s
+        """,
+        (session_id,)
+    )
+    row = cur.fetchone()
+    if row is None:
+        return None
+    state = row["state"] or {}
+    if isinstance(state, str):
+        state = json.loads(state)
+    start = state.get("history_start", 0)
+
+    # Only pull messages when the DB holds more than the caller already has,
+    # or the history was reset elsewhere (the caller's copy is of another history)
+    conversation = None
+    if start != known_start or row["message_count"] - start > known_messages:
+        cur.execute(
+            "SELECT role, content FROM v2_chat_messages WHERE session_id = %s ORDER BY id OFFSET %s",
+            (session_id, start)
+        )
+        conversation = [{"role": r["role"], "content": r["content"]} for r in cur.fetchall()]
+    return {"state": state, "message_count": row["message_count"], "conversation": conversation}
+
+class SessionBackend:
+    """Decides when the local session copy must be reconciled with v2_chat_history."""
+
+    name = "base"
+    revalidate = False
+
+    async def snapshot(self, session_id, known_messages=0, known_start=0):
+        """Persisted state and, if newer than `known_messages` from `known_start`, the conversation."""
+        return await database.run(_load_snapshot, session_id, known_messages, known_start)
+
+class InProcessSessionBackend(SessionBackend):
+    name = "memory"
+    revalidate = False
+
+class PostgresSessionBackend(SessionBackend):
+    name = "postgres"
+    revalidate = True
+
+def make_session_backend(name=SESSION_BACKEND):
+    backends = {b.name: b for b in (InProcessSessionBackend, PostgresSessionBackend)}
+    if name not in backends:
+        raise ValueError(f"Unknown SESSION_BACKEND '{name}', expected one of {sorted(backends)}")
+    return backends[name]()
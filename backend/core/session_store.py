@@ -0,0 +1,142 @@
+import os
+import time
+from collections import OrderedDict
+from threading import RLock
+
+SESSION_IDLE_TTL_SECONDS = float(os.getenv("SESSION_IDLE_TTL_SECONDS", "3600"))
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "5000"))
+SESSION_MAX_MB = float(os.getenv("SESSION_MAX_MB", "64"))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+
+# Rough CPython costs: the session dict with its signals, and one message dict
+SESSION_OVERHEAD_BYTES = 2048
+MESSAGE_OVERHEAD_BYTES = 300
+
+def message_bytes(content: str) -> int:
+    return MESSAGE_OVERHEAD_BYTES + len(content)
+
+class InMemorySessionStore:
+    """
+    Process-local session store with idle TTL and LRU eviction.
+
+    Sessions are evicted when idle longer than `idle_ttl`, or least recently
+    used first once the store holds more than `max_sessions` sessions or more
+    than `max_bytes` of (approximate) session memory. Evicted sessions are
+    returned to the caller so unsaved history can still be persisted.
+    """
+
+    def __init__(self, idle_ttl=SESSION_IDLE_TTL_SECONDS, max_sessions=SESSION_MAX_COUNT,
+                 max_bytes=int(SESSION_MAX_MB * 1024 * 1024)):
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()
+        self._touched = {}
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = RLock()
+        self.stats = {"created": 0, "expired": 0, "evicted_lru": 0, "cleared": 0}
+
+    def get(self, session_id):
+        """Returns the session (marking it recently used) or None."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                self._touched[session_id] = time.monotonic()
+            return session
+
+    def put(self, session_id, session):
+        """Inserts a session; returns [(id, session)] evicted to stay within the caps."""
+        with self._lock:
+            self._discard(session_id)
+            self._sessions[session_id] = session
+            self._touched[session_id] = time.monotonic()
+            size = self._measure(session)
+            self._sizes[session_id] = size
+            self._bytes += size
+            self.stats["created"] += 1
+            return self._enforce_caps(keep=session_id)
+
+    def grow(self, session_id, nbytes):
+        """Accounts for data appended to a session; returns any LRU evictions."""
+        with self._lock:
+            if session_id not in self._sessions:
+                return []
+            self._sizes[session_id] += nbytes
+            self._bytes += nbytes
+            return self._enforce_caps(keep=session_id)
+
+    def resize(self, session_id):
+        """Recomputes a session's size after its conversation was replaced."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return []
+            size = self._measure(session)
+            self._bytes += size - self._sizes[session_id]
+            self._sizes[session_id] = size
+            return self._enforce_caps(keep=session_id)
+
+    def pop(self, session_id):
+        with self._lock:
+            session = self._discard(session_id)
+            if session is not None:
+                self.stats["cleared"] += 1
+            return session
+
+    def sweep(self):
+        """Expires idle sessions and re-applies the caps. Returns the evicted sessions."""
+        cutoff = time.monotonic() - self.idle_ttl
+        evicted = []
+        with self._lock:
+            # OrderedDict is in LRU order, so idle sessions are at the front
+            for session_id in list(self._sessions):
+                if self._touched[session_id] > cutoff:
+                    break
+                evicted.append((session_id, self._discard(session_id)))
+                self.stats["expired"] += 1
+            evicted.extend(self._enforce_caps())
+        return evicted
+
+    @staticmethod
+    def _measure(session):
+        return SESSION_OVERHEAD_BYTES + sum(message_bytes(m["content"]) for m in session.get("conversation", []))
+
+    def _enforce_caps(self, keep=None):
+        evicted = []
+        while len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes:
+            session_id = next(iter(self._sessions))
+            if session_id == keep:
+                if len(self._sessions) == 1:
+                    break
+                # Never evict the session being served; take the next LRU one
+                session_id = list(self._sessions)[1]
+            evicted.append((session_id, self._discard(session_id)))
+            self.stats["evicted_lru"] += 1
+        return evicted
+
+    def _discard(self, session_id):
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._touched.pop(session_id, None)
+            self._bytes -= self._sizes.pop(session_id, 0)
+        return session
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._sessions
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                **self.stats,
+                "sessions": len(self._sessions),
+                "approx_bytes": self._bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "idle_ttl_seconds": self.idle_ttl,
+            }
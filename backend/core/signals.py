@@ -1,5 +1,8 @@
 import re
-from sentence_transformers import util
+from collections import namedtuple
+from threading import Lock
+
+import numpy as np
 
 # Keyword-based signals (Legacy/Explicit)
 SIGNALS = {
@@ -58,8 +61,57 @@ THRESHOLDS = {
 
 NEGATIONS = ["not", "don't", "never", "wouldn't", "won't", "cant", "can't"]
 
-PROTOTYPE_EMBEDDINGS = {}
-RESPONSE_MODE_EMBEDDINGS = {}
+PrototypeScores = namedtuple("PrototypeScores", ["signal_scores", "signal_hits", "mode_scores"])
+
+def _normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+class PrototypeBank:
+    """
+    Signal and response-mode prototypes held as a single pre-normalized
+    matrix, so one matrix product scores every prototype for a message (or a
+    batch of messages) and THRESHOLDS are applied in the same vectorized step.
+    """
+
+    def __init__(self, signal_prototypes, mode_prototypes, thresholds, default_threshold=0.45):
+        self.signal_names = list(signal_prototypes)
+        self.mode_names = list(mode_prototypes)
+        self._descriptions = list(signal_prototypes.values()) + list(mode_prototypes.values())
+        self.signal_thresholds = np.array(
+            [thresholds.get(name, default_threshold) for name in self.signal_names], dtype=np.float32
+        )
+        self.matrix = None
+        self._lock = Lock()
+
+    def ensure(self, model):
+        """Lazily encodes all prototypes in one batch."""
+        if self.matrix is None:
+            with self._lock:
+                if self.matrix is None:
+                    embeddings = model.encode(self._descriptions, convert_to_numpy=True, show_progress_bar=False)
+                    self.matrix = _normalize(embeddings)
+        return self.matrix
+
+    def classify(self, embeddings, model):
+        """Scores a (D,) or (B, D) batch of message embeddings against every prototype."""
+        matrix = self.ensure(model)
+        scores = _normalize(embeddings) @ matrix.T
+        n_signals = len(self.signal_names)
+        signal_scores = scores[:, :n_signals]
+        return PrototypeScores(
+            signal_scores=signal_scores,
+            signal_hits=signal_scores > self.signal_thresholds,
+            mode_scores=scores[:, n_signals:],
+        )
+
+    def best_modes(self, scores, min_confidence=0.55):
+        best = scores.mode_scores.argmax(axis=1)
+        confident = scores.mode_scores[np.arange(len(best)), best] >= min_confidence
+        return [self.mode_names[b] if ok else "explore" for b, ok in zip(best, confident)]
+
+PROTOTYPES = PrototypeBank(SIGNAL_PROTOTYPES, RESPONSE_MODE_PROTOTYPES, THRESHOLDS)
 
 def decay_signals(memory, decay=0.85):
     """Reduces signal intensity to represent emotional momentum."""
@@ -84,8 +136,56 @@ def is_negated(text, keyword, window=3):
             return True
     return False
 
-def extract_signals(text, memory, model=None):
-    text_lower = text.lower()
+class KeywordMatcher:
+    """
+    Keyword + negation matcher compiled once from SIGNALS and NEGATIONS.
+
+    One alternation regex finds every keyword in a single pass, and one walk
+    over the tokens collects those within `window` tokens after a negation.
+    Semantics match the per-keyword re.search + is_negated loop exactly: a
+    keyword counts once per message and is dropped if any token containing
+    it is negated.
+    """
+
+    def __init__(self, signals, negations, window=3):
+        self.window = window
+        self.negations = frozenset(negations)
+        self.signals_for = {}
+        for signal, keywords in signals.items():
+            for kw in keywords:
+                self.signals_for.setdefault(kw, []).append(signal)
+        # Longest first so overlapping keywords prefer the more specific one
+        alternation = "|".join(re.escape(kw) for kw in sorted(self.signals_for, key=len, reverse=True))
+        self.pattern = re.compile(rf"\b(?:{alternation})\b") if alternation else None
+
+    def match(self, text_lower, tokens=None):
+        """Returns {keyword: negated} for every keyword present in the text."""
+        if self.pattern is None:
+            return {}
+        found = {m.group(0) for m in self.pattern.finditer(text_lower)}
+        if not found:
+            return {}
+        if tokens is None:
+            tokens = text_lower.split()
+
+        negated_tokens = []
+        last_negation = -self.window - 1
+        for i, token in enumerate(tokens):
+            if i - last_negation <= self.window:
+                negated_tokens.append(token)
+            if token in self.negations:
+                last_negation = i
+
+        return {kw: any(kw in t for t in negated_tokens) for kw in found}
+
+KEYWORD_MATCHER = KeywordMatcher(
+    {sig: kws for sig, kws in SIGNALS.items() if sig != "violence_intent"},  # violence relies on regex/embedding
+    NEGATIONS,
+)
+
+def extract_signals(text, memory, model=None, turn=None):
+    # A TurnContext carries the lowered text and embedding computed once per turn
+    text_lower = turn.text_lower if turn is not None else text.lower()
     
     # Ensure memory structure
     if "signals" not in memory:
@@ -103,36 +203,24 @@ def extract_signals(text, memory, model=None):
             memory["lock_stage"] = True
             return # Exit immediately to preventing softening
             
-    # 2. Keyword Extraction (Explicit) with Negation
-    for signal, keywords in SIGNALS.items():
-        if signal == "violence_intent": continue # Skip keyword list for violence, rely on regex/embedding
-        
-        for kw in keywords:
-            if re.search(rf"\b{kw}\b", text_lower):
-                if not is_negated(text_lower, kw):
-                    # Ensure the signal key exists
-                    if signal not in memory["signals"]: memory["signals"][signal] = 0.0
-                    memory["signals"][signal] += 1
+    # 2. Keyword Extraction (Explicit) with Negation - single scan over the message
+    tokens = turn.tokens if turn is not None else None
+    for kw, negated in KEYWORD_MATCHER.match(text_lower, tokens).items():
+        if negated:
+            continue
+        for signal in KEYWORD_MATCHER.signals_for[kw]:
+            # Ensure the signal key exists
+            if signal not in memory["signals"]: memory["signals"][signal] = 0.0
+            memory["signals"][signal] += 1
                 
     # 3. Embedding Extraction (Implicit)
     if model and SIGNAL_PROTOTYPES:
-        # Lazy load prototype embeddings
-        if not PROTOTYPE_EMBEDDINGS:
-            for sig, desc in SIGNAL_PROTOTYPES.items():
-                PROTOTYPE_EMBEDDINGS[sig] = model.encode(desc, convert_to_tensor=True, show_progress_bar=False)
-        
-        # Encode user text
         try:
-            # OPTIMIZATION: Use pre-computed embedding if available (not passed yet, but good for future)
-            # For now, just disable progress bar
-            user_emb = model.encode(text, convert_to_tensor=True, show_progress_bar=False)
-            
-            # Compare
-            for sig, proto_emb in PROTOTYPE_EMBEDDINGS.items():
-                threshold = THRESHOLDS.get(sig, 0.45) # Default 0.45
-                score = util.cos_sim(user_emb, proto_emb).item()
-                
-                if score > threshold:
+            scores = turn_prototype_scores(text, model, turn)
+
+            # Thresholds were applied in the vectorized step; walk hits in prototype order
+            for sig, hit in zip(PROTOTYPES.signal_names, scores.signal_hits[0]):
+                if hit:
                     # Special Safety Check for Violence Embedding
                     if sig == "violence_intent":
                          # Extra high threshold was processed.
@@ -151,24 +239,41 @@ def extract_signals(text, memory, model=None):
         except Exception as e:
             print(f"Embedding extraction failed: {e}")
 
-def detect_response_mode(text, model, min_confidence=0.55):
+def detect_response_mode(text, model, min_confidence=0.55, embedding=None, turn=None):
     if not model:
         return "explore"
         
     try:
-        if not RESPONSE_MODE_EMBEDDINGS:
-                for mode, desc in RESPONSE_MODE_PROTOTYPES.items():
-                    RESPONSE_MODE_EMBEDDINGS[mode] = model.encode(desc, convert_to_tensor=True, show_progress_bar=False)
-        
-        user_emb = model.encode(text, convert_to_tensor=True, show_progress_bar=False)
-        scores = {}
-        for mode, proto_emb in RESPONSE_MODE_EMBEDDINGS.items():
-            scores[mode] = util.cos_sim(user_emb, proto_emb).item()
-        
-        best_mode = max(scores, key=scores.get)
-        if scores[best_mode] < min_confidence:
-            return "explore"
-            
-        return best_mode
+        if turn is None and embedding is not None:
+            scores = PROTOTYPES.classify(embedding, model)
+        else:
+            scores = turn_prototype_scores(text, model, turn)
+        return PROTOTYPES.best_modes(scores, min_confidence)[0]
     except Exception:
         return "explore"
+
+def turn_prototype_scores(text, model, turn=None):
+    """Prototype scores for one message, computed once and cached on the TurnContext."""
+    if turn is not None and turn.prototype_scores is not None:
+        return turn.prototype_scores
+    embedding = turn.embedding if turn is not None else None
+    if embedding is None:
+        embedding = model.encode(text, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False)
+    scores = PROTOTYPES.classify(embedding, model)
+    if turn is not None:
+        turn.prototype_scores = scores
+    return scores
+
+def score_messages(texts, model, min_confidence=0.55):
+    """
+    Batch scoring: one encode call and one matrix product for many messages.
+    Returns a (signal hits, response mode) pair per message.
+    """
+    embeddings = model.encode(list(texts), convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False)
+    scores = PROTOTYPES.classify(embeddings, model)
+    modes = PROTOTYPES.best_modes(scores, min_confidence)
+    results = []
+    for row, mode in zip(scores.signal_hits, modes):
+        hits = [name for name, hit in zip(PROTOTYPES.signal_names, row) if hit]
+        results.append((hits, mode))
+    return results
@@ -0,0 +1,91 @@
+import re
+import json
+
+EXPRESSION_TAG = re.compile(r"\[(?:EXPRESSION:\s*)?([A-Z]+)\]")
+
+class ExpressionTagFilter:
+    """
+    Strips [EXPRESSION: X] tags from a token stream as it arrives.
+
+    Text is passed through as soon as it cannot be part of a tag; anything
+    from an unclosed "[" onward is held back until it either closes (and is
+    dropped if it is a tag) or grows past MAX_TAG_LEN. Leading and trailing
+    whitespace is trimmed, matching the .strip() of the non-streaming path.
+    The first tag seen wins, as with re.search on the full reply.
+    """
+
+    MAX_TAG_LEN = 40
+
+    def __init__(self):
+        self.expression = None
+        self._buffer = ""
+        self._pending_ws = ""
+        self._started = False
+        self._parts = []
+
+    @property
+    def reply(self):
+        return "".join(self._parts)
+
+    def feed(self, chunk: str) -> str:
+        """Consumes a raw chunk and returns the text that is safe to show now."""
+        self._buffer += chunk
+        out = []
+        while self._buffer:
+            start = self._buffer.find("[")
+            if start == -1:
+                out.append(self._buffer)
+                self._buffer = ""
+                break
+            out.append(self._buffer[:start])
+            self._buffer = self._buffer[start:]
+
+            # A later "[" means the first one can no longer open a tag
+            nested = self._buffer.find("[", 1)
+            end = self._buffer.find("]")
+            if nested != -1 and (end == -1 or nested < end):
+                out.append(self._buffer[:nested])
+                self._buffer = self._buffer[nested:]
+                continue
+            if end == -1:
+                if len(self._buffer) > self.MAX_TAG_LEN:
+                    out.append(self._buffer[0])
+                    self._buffer = self._buffer[1:]
+                    continue
+                break  # wait for more tokens
+
+            candidate = self._buffer[:end + 1]
+            match = EXPRESSION_TAG.fullmatch(candidate)
+            if match:
+                if self.expression is None:
+                    self.expression = match.group(1)
+            else:
+                out.append(candidate)
+            self._buffer = self._buffer[end + 1:]
+        return self._emit("".join(out))
+
+    def finish(self) -> str:
+        """Flushes held-back text at end of stream (trailing whitespace is dropped)."""
+        tail, self._buffer = self._buffer, ""
+        text = self._emit(tail)
+        self._pending_ws = ""
+        return text
+
+    def _emit(self, text: str) -> str:
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        stripped = text.rstrip()
+        if not stripped:
+            self._pending_ws += text
+            return ""
+        out = self._pending_ws + stripped
+        self._pending_ws = text[len(stripped):]
+        self._parts.append(out)
+        return out
+
+def sse_event(event: str, data) -> str:
+    """Formats one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
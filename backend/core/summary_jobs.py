@@ -0,0 +1,322 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+
+from . import database
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "2"))
+SUMMARY_JOB_TTL_SECONDS = float(os.getenv("SUMMARY_JOB_TTL_SECONDS", "3600"))
+SUMMARY_MAX_PENDING = int(os.getenv("SUMMARY_MAX_PENDING", "100"))
+# A queued/running job not updated for this long is presumed lost (its worker died) and may be re-run
+SUMMARY_JOB_STALE_SECONDS = float(os.getenv("SUMMARY_JOB_STALE_SECONDS", "600"))
+# How often a request waiting on another worker's job re-reads it from the store
+SUMMARY_POLL_INTERVAL = float(os.getenv("SUMMARY_POLL_INTERVAL", "1.0"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+class SummaryJob:
+    __slots__ = ("id", "session_id", "version", "conversation", "status", "summary", "error",
+                 "created_at", "started_at", "finished_at", "done")
+
+    def __init__(self, session_id, version, conversation, job_id=None):
+        self.id = job_id or str(uuid.uuid4())
+        self.session_id = session_id
+        self.version = version
+        self.conversation = conversation
+        self.status = QUEUED
+        self.summary = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = asyncio.Event()
+
+    @classmethod
+    def from_row(cls, row):
+        job = cls(str(row["session_id"]), (row["history_start"], row["message_count"]), None, job_id=str(row["id"]))
+        job.refresh(row)
+        return job
+
+    def refresh(self, row):
+        """Takes over the stored status of this job (run by another worker)."""
+        self.status, self.summary, self.error = row["status"], row["summary"], row["error"]
+        self.created_at = _epoch(row["created_at"])
+        self.started_at = _epoch(row["started_at"])
+        self.finished_at = _epoch(row["finished_at"])
+        if self.status in (DONE, FAILED):
+            self.done.set()
+
+    def to_dict(self):
+        data = {"job_id": self.id, "session_id": self.session_id, "status": self.status}
+        if self.status == DONE:
+            data["summary"] = self.summary
+        elif self.status == FAILED:
+            data["error"] = self.error
+        if self.finished_at and self.started_at:
+            data["duration_ms"] = round((self.finished_at - self.started_at) * 1000)
+        return data
+
+def _epoch(value):
+    return float(value) if value is not None else None
+
+_SELECT_JOB = """
+SELECT id, session_id, history_start, message_count, status, summary, error,
+       EXTRACT(EPOCH FROM created_at) AS created_at,
+       EXTRACT(EPOCH FROM started_at) AS started_at,
+       EXTRACT(EPOCH FROM finished_at) AS finished_at
+FROM v2_summary_jobs
+"""
+
+def _claim_job(cur, job, stale_seconds, ttl):
+    history_start, message_count = job.version
+    cur.execute(
+        "DELETE FROM v2_summary_jobs WHERE finished_at < CURRENT_TIMESTAMP - make_interval(secs => %s)",
+        (ttl,)
+    )
+    # Insert, or take over a failed / abandoned job for the same conversation version
+    cur.execute(
+        """
+        INSERT INTO v2_summary_jobs (id, session_id, history_start, message_count, status)
+        VALUES (%s, %s, %s, %s, 'queued')
+        ON CONFLICT (session_id, history_start, message_count) DO UPDATE
+        SET id = EXCLUDED.id, status = 'queued', summary = NULL, error = NULL,
+            created_at = CURRENT_TIMESTAMP, started_at = NULL, finished_at = NULL,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE v2_summary_jobs.status = 'failed'
+           OR (v2_summary_jobs.status IN ('queued', 'running')
+               AND v2_summary_jobs.updated_at < CURRENT_TIMESTAMP - make_interval(secs => %s))
+        RETURNING id
+        """,
+        (job.id, job.session_id, history_start, message_count, stale_seconds)
+    )
+    if cur.fetchone() is not None:
+        return None
+    cur.execute(_SELECT_JOB + " WHERE session_id = %s AND history_start = %s AND message_count = %s",
+                (job.session_id, history_start, message_count))
+    return cur.fetchone()
+
+def _update_job(cur, job):
+    cur.execute(
+        """
+        UPDATE v2_summary_jobs
+        SET status = %s, summary = %s, error = %s,
+            started_at = CASE WHEN %s = 'running' THEN CURRENT_TIMESTAMP ELSE started_at END,
+            finished_at = CASE WHEN %s IN ('done', 'failed') THEN CURRENT_TIMESTAMP ELSE finished_at END,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = %s
+        """,
+        (job.status, job.summary, job.error, job.status, job.status, job.id)
+    )
+
+def _load_job(cur, job_id):
+    cur.execute(_SELECT_JOB + " WHERE id = %s", (job_id,))
+    return cur.fetchone()
+
+class SummaryJobStore:
+    """
+    Job status in v2_summary_jobs, shared by every worker.
+
+    One row per (session, conversation version): the first worker to
+    insert it runs the job, others get the existing row back, and any
+    worker can answer a status poll from it.
+    """
+
+    async def claim(self, job, stale_seconds=SUMMARY_JOB_STALE_SECONDS, ttl=SUMMARY_JOB_TTL_SECONDS):
+        """None if this worker now owns `job`, else the existing row for its version."""
+        return await database.run(_claim_job, job, stale_seconds, ttl)
+
+    async def update(self, job):
+        await database.run(_update_job, job)
+
+    async def load(self, job_id):
+        return await database.run(_load_job, job_id)
+
+class SummaryJobQueue:
+    """
+    Background /summary generation with per-version dedup.
+
+    submit() returns immediately with a job; `workers` tasks run queued jobs
+    through `runner(session_id, conversation)`. Requests for the same
+    session and conversation version (history_start, message count) share
+    one job while it is queued, running, or done, so double-clicks never
+    start a second LLM call and a finished report is served until the
+    conversation changes. Finished jobs are kept for `ttl` seconds.
+
+    With a `store` (SummaryJobStore), job status is also kept in Postgres:
+    dedup then holds across workers, and a poll that lands on a worker
+    that doesn't run the job is answered from the stored row. Jobs are
+    still run by the worker that accepted them; if the store is
+    unreachable they stay local to it.
+    """
+
+    def __init__(self, runner, workers=SUMMARY_WORKERS, ttl=SUMMARY_JOB_TTL_SECONDS, max_pending=SUMMARY_MAX_PENDING,
+                 store=None, stale_seconds=SUMMARY_JOB_STALE_SECONDS, poll_interval=SUMMARY_POLL_INTERVAL):
+        self._runner = runner
+        self.store = store
+        self.stale_seconds = stale_seconds
+        self.poll_interval = poll_interval
+        self.workers = max(1, workers)
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self._jobs = {}
+        self._by_version = {}
+        self._queue = None
+        self._tasks = []
+        self.stats = {"submitted": 0, "deduplicated": 0, "completed": 0, "failed": 0, "rejected": 0,
+                      "remote_lookups": 0, "store_errors": 0, "total_wait_ms": 0.0, "total_run_ms": 0.0}
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Jobs this worker will never run: let the next request for them start over
+        for job in self._jobs.values():
+            if job.status == QUEUED or job.error == "cancelled":
+                job.status, job.error = FAILED, "cancelled"
+                await self._persist(job)
+
+    async def submit(self, session_id, version, conversation):
+        """Returns (job, created). Raises RuntimeError when the queue is full or not running."""
+        self._prune()
+        key = (session_id, version)
+        job = self._jobs.get(self._by_version.get(key))
+        if job is not None and job.status != FAILED:
+            self.stats["deduplicated"] += 1
+            return job, False
+        if self._queue is None:
+            raise RuntimeError("summary workers are not running")
+        if self._queue.qsize() >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise RuntimeError("too many pending summary jobs")
+
+        job = SummaryJob(session_id, version, list(conversation))
+        if self.store is not None:
+            try:
+                existing = await self.store.claim(job, self.stale_seconds, self.ttl)
+            except Exception as e:
+                self.stats["store_errors"] += 1
+                logger.warning("Summary job store unavailable, job %s stays local: %s", job.id, e)
+                existing = None
+            if existing is not None:
+                # Queued, running or done on some worker already
+                self.stats["deduplicated"] += 1
+                return self._jobs.get(str(existing["id"])) or SummaryJob.from_row(existing), False
+        self._jobs[job.id] = job
+        self._by_version[key] = job.id
+        self._queue.put_nowait(job)
+        self.stats["submitted"] += 1
+        return job, True
+
+    async def get(self, job_id):
+        """This worker's job, or another worker's read from the store; None if unknown."""
+        job = self._jobs.get(job_id)
+        if job is not None or self.store is None:
+            return job
+        self.stats["remote_lookups"] += 1
+        try:
+            row = await self.store.load(job_id)
+        except Exception as e:
+            self.stats["store_errors"] += 1
+            logger.warning("Summary job lookup failed for %s: %s", job_id, e)
+            return None
+        return SummaryJob.from_row(row) if row is not None else None
+
+    async def wait(self, job, timeout=None):
+        if job.id in self._jobs or self.store is None:
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return job
+
+        # Run by another worker: re-read the stored row until it finishes
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+        while not job.done.is_set():
+            delay = self.poll_interval if deadline is None else min(self.poll_interval, deadline - loop.time())
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+            try:
+                row = await self.store.load(job.id)
+            except Exception as e:
+                self.stats["store_errors"] += 1
+                logger.warning("Summary job poll failed for %s: %s", job.id, e)
+                continue
+            if row is None:
+                # Expired, or re-run under a new id after failing
+                job.status, job.error = FAILED, "job no longer exists"
+                job.done.set()
+                break
+            job.refresh(row)
+        return job
+
+    async def _persist(self, job):
+        if self.store is None:
+            return
+        try:
+            await self.store.update(job)
+        except Exception as e:
+            self.stats["store_errors"] += 1
+            logger.warning("Could not store status of summary job %s: %s", job.id, e)
+
+    async def _worker(self, n):
+        while True:
+            job = await self._queue.get()
+            job.status = RUNNING
+            job.started_at = time.time()
+            await self._persist(job)
+            try:
+                job.summary = await self._runner(job.session_id, job.conversation)
+                job.status = DONE
+                self.stats["completed"] += 1
+            except asyncio.CancelledError:
+                job.status, job.error = FAILED, "cancelled"
+                raise
+            except Exception as e:
+                logger.exception("Summary job %s failed", job.id)
+                job.status, job.error = FAILED, str(e)
+                self.stats["failed"] += 1
+            finally:
+                job.finished_at = time.time()
+                job.conversation = None  # the transcript is not needed once the job has run
+                self.stats["total_wait_ms"] += (job.started_at - job.created_at) * 1000
+                self.stats["total_run_ms"] += (job.finished_at - job.started_at) * 1000
+                job.done.set()
+                self._queue.task_done()
+            await self._persist(job)
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and job.finished_at < cutoff:
+                del self._jobs[job_id]
+                key = (job.session_id, job.version)
+                if self._by_version.get(key) == job_id:
+                    del self._by_version[key]
+
+    def metrics(self):
+        finished = self.stats["completed"] + self.stats["failed"]
+        by_status = {}
+        for job in self._jobs.values():
+            by_status[job.status] = by_status.get(job.status, 0) + 1
+        return {
+            **{k: v for k, v in self.stats.items() if not k.startswith("total_")},
+            "jobs": by_status,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "avg_wait_ms": round(self.stats["total_wait_ms"] / finished, 1) if finished else 0.0,
+            "avg_run_ms": round(self.stats["total_run_ms"] / finished, 1) if finished else 0.0,
+            "workers": self.workers,
+            "store": "postgres" if self.store is not None else "memory",
+        }
@@ -0,0 +1,33 @@
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+@dataclass
+class TurnContext:
+    """
+    Per-turn view of the user message, computed once and shared by signal
+    extraction, response-mode detection, retrieval and expression selection.
+    """
+    message: str
+    text_lower: str
+    tokens: List[str]
+    embedding: Optional[Any] = None
+    # Filled lazily by signals.turn_prototype_scores
+    prototype_scores: Optional[Any] = None
+
+def build_turn_context(message: str, model=None) -> TurnContext:
+    text_lower = message.lower()
+    embedding = None
+    if model is not None:
+        try:
+            # The only MiniLM forward pass for the user message in a turn
+            embedding = model.encode(
+                message, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False
+            )
+        except Exception as e:
+            print(f"Turn embedding failed: {e}")
+    return TurnContext(
+        message=message,
+        text_lower=text_lower,
+        tokens=text_lower.split(),
+        embedding=embedding,
+    )
@@ -0,0 +1,121 @@
+import os
+import math
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+# Index family built by ingest.py (--index overrides). The retriever loads
+# whatever is on disk; only the search-time knobs below apply at runtime.
+RETRIEVER_INDEX = os.getenv("RETRIEVER_INDEX", "flat").lower()
+INDEX_TYPES = ("flat", "ivf", "hnsw", "pq")
+
+# Build parameters (0 = derive from corpus size)
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "80"))
+PQ_M = int(os.getenv("PQ_M", "48"))  # sub-quantizers; must divide the dimension (384)
+PQ_NBITS = int(os.getenv("PQ_NBITS", "8"))
+
+# Search parameters
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+# Published layout: ingest.py writes each build to vector_store/builds/<id>/
+# and then points vector_store/CURRENT at it with a single rename, so a
+# reader never pairs one build's index with another build's chunk store.
+# Without CURRENT, the files directly under vector_store/ are used.
+BUILDS_DIR = "builds"
+CURRENT_POINTER = "CURRENT"
+INDEX_FILE = "mental_health.index"
+CHUNKS_FILE = "mental_health.chunks"
+STORE_FILE = "mental_health.json"  # legacy JSON store, read if no .chunks file exists
+VECTORS_FILE = "mental_health.vectors.npy"
+MANIFEST_FILE = "manifest.json"
+
+def active_build_dir(vector_dir):
+    """Directory of the published build (resolve once and read every artifact from it)."""
+    vector_dir = Path(vector_dir)
+    try:
+        build_id = (vector_dir / CURRENT_POINTER).read_text().strip()
+    except FileNotFoundError:
+        return vector_dir
+    return vector_dir / BUILDS_DIR / build_id
+
+# faiss k-means wants ~39 training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+
+def default_nlist(n):
+    return max(1, min(int(4 * math.sqrt(n)), n // MIN_POINTS_PER_CENTROID))
+
+def build_index(vectors, kind=RETRIEVER_INDEX, nlist=IVF_NLIST, hnsw_m=HNSW_M,
+                ef_construction=HNSW_EF_CONSTRUCTION, pq_m=PQ_M, pq_nbits=PQ_NBITS):
+    """Builds and fills an L2 index of the given family over `vectors` (N, D) float32."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+    if kind == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+    elif kind in ("ivf", "pq"):
+        nlist = nlist or default_nlist(n)
+        quantizer = faiss.IndexFlatL2(dim)
+        if kind == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            if dim % pq_m:
+                raise ValueError(f"PQ_M={pq_m} must divide the embedding dimension {dim}")
+            # Small corpora cannot train 2^8 codewords per sub-quantizer
+            nbits = min(pq_nbits, max(1, int(math.log2(max(2, n // MIN_POINTS_PER_CENTROID)))))
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, nbits)
+        index.train(vectors)
+    else:
+        raise ValueError(f"Unknown index type '{kind}', expected one of {INDEX_TYPES}")
+    index.add(vectors)
+    return index
+
+def index_kind(index):
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+def configure_search(index, nprobe=IVF_NPROBE, ef_search=HNSW_EF_SEARCH):
+    """Applies runtime recall/latency knobs; a no-op for exact indexes."""
+    kind = index_kind(index)
+    if kind in ("ivf", "pq"):
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    elif kind == "hnsw":
+        index.hnsw.efSearch = ef_search
+    return kind
+
+def search_params(index, selector):
+    """
+    SearchParameters restricting a search of `index` to `selector`'s ids.
+
+    IVF and HNSW indexes only accept their own parameter types, which also
+    carry nprobe / efSearch, so the values set by configure_search are copied.
+    """
+    kind = index_kind(index)
+    if kind in ("ivf", "pq"):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=faiss.extract_index_ivf(index).nprobe)
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+def index_bytes(index):
+    return int(faiss.serialize_index(index).nbytes)
+
+def describe(index):
+    kind = index_kind(index)
+    info = {"type": kind, "ntotal": int(index.ntotal), "bytes": index_bytes(index)}
+    if kind in ("ivf", "pq"):
+        ivf = faiss.extract_index_ivf(index)
+        info.update(nlist=int(ivf.nlist), nprobe=int(ivf.nprobe))
+    elif kind == "hnsw":
+        info.update(ef_search=int(index.hnsw.efSearch))
+    return info
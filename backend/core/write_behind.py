@@ -0,0 +1,238 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+import psycopg2
+
+from . import database
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "1000"))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "50"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.5"))
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", "3"))
+
+_STOP = object()
+
+# Worth retrying the same write: the connection or server failed, not the data
+TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, TimeoutError)
+
+class WriteBatch:
+    """
+    Writes coalesced for one flush: messages keep per-session order,
+    summaries and states are last-wins. `callbacks` are the on_done(ok)
+    hooks of the queued writes, called once the batch is written or dropped.
+    """
+
+    def __init__(self):
+        self.messages = OrderedDict()
+        self.summaries = {}
+        self.states = {}
+        self.callbacks = {}
+
+    def add(self, item):
+        kind, session_id, payload, on_done = item
+        if kind == "messages":
+            self.messages.setdefault(session_id, []).extend(payload)
+        elif kind == "summary":
+            self.summaries[session_id] = payload
+        elif kind == "state":
+            self.states[session_id] = payload
+        if on_done is not None:
+            self.callbacks.setdefault(session_id, []).append(on_done)
+
+    def session_ids(self):
+        return list(dict.fromkeys(list(self.messages) + list(self.summaries) + list(self.states)))
+
+    def split(self):
+        """One batch per session, so a session whose rows fail can't take the others down with it."""
+        batches = []
+        for session_id in self.session_ids():
+            batch = WriteBatch()
+            if session_id in self.messages:
+                batch.messages[session_id] = self.messages[session_id]
+            if session_id in self.summaries:
+                batch.summaries[session_id] = self.summaries[session_id]
+            if session_id in self.states:
+                batch.states[session_id] = self.states[session_id]
+            if session_id in self.callbacks:
+                batch.callbacks[session_id] = self.callbacks[session_id]
+            batches.append(batch)
+        return batches
+
+    def done(self, ok):
+        for callbacks in self.callbacks.values():
+            for on_done in callbacks:
+                try:
+                    on_done(ok)
+                except Exception:
+                    logger.exception("Write-behind callback failed")
+
+    def __len__(self):
+        return sum(len(m) for m in self.messages.values()) + len(self.summaries) + len(self.states)
+
+class WriteBehindQueue:
+    """
+    Bounded write-behind stage for chat history.
+
+    Requests enqueue writes and return immediately; a single background task
+    flushes them through `writer(cursor, batch)` in one transaction once
+    `batch_size` items are waiting or `flush_interval` seconds have passed
+    since the oldest one arrived. When the queue is full, enqueue waits
+    (backpressure) instead of dropping. Until start() is called, enqueue
+    reports False so callers can fall back to a direct write.
+
+    Connection failures are retried with backoff. If the database rejects
+    a batch, it is split and each session is written in its own
+    transaction, so only the sessions whose rows are bad are dropped. Each write's
+    on_done(ok) callback reports whether it reached the database.
+    """
+
+    def __init__(self, writer, max_size=WRITE_BEHIND_MAX_QUEUE, batch_size=WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval=WRITE_BEHIND_FLUSH_INTERVAL, max_retries=WRITE_BEHIND_MAX_RETRIES):
+        self.writer = writer
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._queue = None
+        self._batch_ready = None
+        self._closing = False
+        self._task = None
+        self.stats = {
+            "enqueued": 0,
+            "backpressure_waits": 0,
+            "flushes": 0,
+            "flushed_items": 0,
+            "failed_flushes": 0,
+            "split_flushes": 0,
+            "dropped_items": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._batch_ready = asyncio.Event()
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flushes everything still queued, then stops the background task."""
+        if not self.running:
+            return
+        self._closing = True
+        await self._queue.put(_STOP)
+        self._batch_ready.set()
+        await self._task
+        self._task = None
+
+    async def enqueue_messages(self, session_id, messages, on_done=None):
+        return await self._enqueue(("messages", session_id, list(messages), on_done))
+
+    async def enqueue_summary(self, session_id, summary, on_done=None):
+        return await self._enqueue(("summary", session_id, summary, on_done))
+
+    async def enqueue_state(self, session_id, state, on_done=None):
+        return await self._enqueue(("state", session_id, state, on_done))
+
+    async def _enqueue(self, item):
+        if not self.running:
+            return False
+        if self._queue.full():
+            self.stats["backpressure_waits"] += 1
+        await self._queue.put(item)
+        self.stats["enqueued"] += 1
+        if self._queue.qsize() >= self.batch_size:
+            self._batch_ready.set()
+        return True
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is _STOP:
+                break
+            # Give the batch time to fill, unless it already has (a backlog
+            # of full batches is flushed back to back) or we are stopping
+            if self._queue.qsize() + 1 < self.batch_size and not self._closing:
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._batch_ready.clear()
+
+            batch = WriteBatch()
+            batch.add(first)
+            taken = 1
+            while not self._queue.empty() and (taken < self.batch_size or stopping):
+                item = self._queue.get_nowait()
+                if item is _STOP:
+                    # Drain whatever is left into this final flush
+                    stopping = True
+                    continue
+                batch.add(item)
+                taken += 1
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        error = await self._write(batch)
+        if error is None:
+            return
+        session_ids = batch.session_ids()
+        # A rejected row fails the whole transaction; an outage would fail every session too
+        if len(session_ids) > 1 and not isinstance(error, TRANSIENT_ERRORS):
+            self.stats["split_flushes"] += 1
+            logger.warning(f"Write-behind batch failed; retrying {len(session_ids)} sessions separately")
+            for sub in batch.split():
+                if await self._write(sub) is not None:
+                    self._drop(sub)
+        else:
+            self._drop(batch)
+
+    async def _write(self, batch):
+        """Writes the batch, retrying transient failures; returns the last error, or None once written."""
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                await database.run(self.writer, batch)
+            except Exception as e:
+                self.stats["failed_flushes"] += 1
+                logger.warning(f"Write-behind flush failed (attempt {attempt + 1}): {e}")
+                if not isinstance(e, TRANSIENT_ERRORS) or attempt == self.max_retries:
+                    return e
+                await asyncio.sleep(min(2 ** attempt * 0.1, 2.0))
+                continue
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.stats["flushes"] += 1
+            self.stats["flushed_items"] += len(batch)
+            self.stats["last_flush_ms"] = round(elapsed_ms, 2)
+            self.stats["max_flush_ms"] = round(max(self.stats["max_flush_ms"], elapsed_ms), 2)
+            self.stats["total_flush_ms"] += elapsed_ms
+            batch.done(True)
+            return None
+
+    def _drop(self, batch):
+        self.stats["dropped_items"] += len(batch)
+        logger.error(f"Write-behind dropped {len(batch)} items for sessions {batch.session_ids()}")
+        batch.done(False)
+
+    def metrics(self):
+        flushes = self.stats["flushes"]
+        return {
+            **self.stats,
+            "total_flush_ms": round(self.stats["total_flush_ms"], 2),
+            "avg_flush_ms": round(self.stats["total_flush_ms"] / flushes, 2) if flushes else 0.0,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_capacity": self.max_size,
+        }
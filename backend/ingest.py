@@ -0,0 +1,316 @@
+"""
+Incremental knowledge-base ingestion: builds vector_store/ from knowledge_base/.
+
+    python ingest.py                    # re-embed only new/changed files
+    python ingest.py --full             # re-embed everything
+    python ingest.py --workers 4        # parse files and embed on 4 processes
+    python ingest.py --dry-run          # show the plan without writing
+
+Every source file is content-hashed into vector_store/manifest.json together
+with the chunking parameters and embedding model, so unchanged files reuse
+their vectors (from mental_health.vectors.npy) and only new or modified
+files are chunked and embedded. Chunks from sources that have no file in
+knowledge_base/ (the original PDF build) are carried over as "legacy" unless
+--drop-legacy is given; if the previous vectors cannot be recovered, carried
+over chunks are re-embedded from their stored texts. Chunk texts go to the
+memory-mapped mental_health.chunks store (see core/chunk_store.py).
+
+Each build is written to its own vector_store/builds/<id>/ directory and
+published by renaming vector_store/CURRENT over the old pointer, so the
+index, chunk store, vectors and manifest always change together.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+BASE_DIR = Path(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(str(BASE_DIR))
+
+import numpy as np
+
+from core.chunk_store import ChunkStore, open_chunk_store
+from core.vector_index import (INDEX_TYPES, RETRIEVER_INDEX, BUILDS_DIR, CURRENT_POINTER, INDEX_FILE, CHUNKS_FILE,
+                               STORE_FILE, VECTORS_FILE, MANIFEST_FILE, active_build_dir)
+
+KB_DIR = BASE_DIR / "knowledge_base"
+VECTOR_DIR = BASE_DIR / "vector_store"
+# Published builds kept on disk (the current one plus the one before it,
+# which workers that have not reloaded yet may still be reading)
+KEEP_BUILDS = 2
+
+# Matches the original build: 400-word chunks, whitespace-normalized, no overlap
+CHUNK_WORDS = 400
+CHUNK_OVERLAP = 0
+SUPPORTED_SUFFIXES = {".txt", ".md", ".pdf"}
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def read_text(path: Path) -> str:
+    if path.suffix.lower() == ".pdf":
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise RuntimeError("pypdf is required to ingest PDFs (pip install pypdf)")
+        reader = PdfReader(str(path))
+        return "\n".join(page.extract_text() or "" for page in reader.pages)
+    return path.read_text(encoding="utf-8", errors="ignore")
+
+def chunk_text(text: str, words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    tokens = text.split()
+    step = max(1, words - overlap)
+    return [" ".join(tokens[i:i + words]) for i in range(0, len(tokens), step) if tokens[i:i + words]]
+
+def parse_file(args):
+    """Worker: read + chunk one file. Runs in a separate process."""
+    path, words, overlap = args
+    return chunk_text(read_text(Path(path)), words, overlap)
+
+def pdf_support() -> bool:
+    try:
+        import pypdf  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def scan_knowledge_base(kb_dir: Path):
+    files = sorted(p for p in kb_dir.rglob("*") if p.is_file() and p.suffix.lower() in SUPPORTED_SUFFIXES)
+    if not pdf_support():
+        skipped = [p for p in files if p.suffix.lower() == ".pdf"]
+        for p in skipped:
+            print(f"Warning: skipping {p.relative_to(kb_dir)} (install pypdf to ingest PDFs)")
+        files = [p for p in files if p.suffix.lower() != ".pdf"]
+    with ThreadPoolExecutor() as pool:
+        hashes = list(pool.map(file_sha256, files))
+    return {p.relative_to(kb_dir).as_posix(): (p, sha) for p, sha in zip(files, hashes)}
+
+def load_previous_build():
+    """Returns (manifest, texts, meta, vectors) of the current build, bootstrapping a manifest if needed."""
+    build_dir = active_build_dir(VECTOR_DIR)
+    store = open_chunk_store(build_dir / CHUNKS_FILE, build_dir / STORE_FILE)
+    if store is None:
+        return None, [], [], None
+    texts = list(store)
+    meta = [store.meta(i) for i in range(len(store))]
+    store.close()
+
+    vectors = None
+    if (build_dir / VECTORS_FILE).exists():
+        vectors = np.load(build_dir / VECTORS_FILE)
+    elif (build_dir / INDEX_FILE).exists():
+        import faiss
+        index = faiss.read_index(str(build_dir / INDEX_FILE))
+        try:
+            vectors = index.reconstruct_n(0, index.ntotal)
+        except RuntimeError:
+            vectors = None  # e.g. IVF without a direct map; kept chunks are re-embedded from their texts
+    if vectors is not None and len(vectors) != len(texts):
+        print(f"Warning: {len(vectors)} vectors for {len(texts)} chunks; re-embedding kept chunks from their texts")
+        vectors = None
+
+    if (build_dir / MANIFEST_FILE).exists():
+        with open(build_dir / MANIFEST_FILE, "r") as f:
+            manifest = json.load(f)
+    else:
+        # First incremental run over the committed artifacts: group the
+        # existing chunks by meta.source as legacy sources (no file hash)
+        sources = []
+        for i, m in enumerate(meta):
+            if sources and sources[-1]["source"] == m["source"] and sources[-1]["offset"] + sources[-1]["count"] == i:
+                sources[-1]["count"] += 1
+            else:
+                sources.append({"key": f"legacy:{m['source']}", "source": m["source"], "sha256": None,
+                                "offset": i, "count": 1})
+        manifest = {"model": None, "chunk_words": None, "chunk_overlap": None, "sources": sources}
+    return manifest, texts, meta, vectors
+
+def plan_build(manifest, files, model_id, full=False, drop_legacy=False):
+    """Splits sources into reuse / embed / drop."""
+    previous = {s["key"]: s for s in (manifest or {}).get("sources", [])}
+    params_changed = manifest is None or (
+        manifest.get("model"), manifest.get("chunk_words"), manifest.get("chunk_overlap")
+    ) != (model_id, CHUNK_WORDS, CHUNK_OVERLAP)
+    file_basenames = {Path(k).name for k in files}
+
+    reuse, embed, dropped = [], [], []
+    for key, src in previous.items():
+        if key.startswith("legacy:"):
+            if drop_legacy or src["source"] in file_basenames:
+                dropped.append(key)  # superseded by a real file, or explicitly dropped
+            else:
+                reuse.append(src)
+        elif key not in files:
+            dropped.append(key)
+    for key, (path, sha) in files.items():
+        src = previous.get(key)
+        if src and not full and not params_changed and src["sha256"] == sha:
+            reuse.append(src)
+        else:
+            embed.append(key)
+    return reuse, embed, dropped
+
+def embed_chunks(chunks, batch_size, workers):
+    from core.resources import load_embedding_model
+    model = load_embedding_model("fp32")
+    if not chunks:
+        return np.zeros((0, model.get_sentence_embedding_dimension()), dtype="float32")
+    if workers > 1:
+        pool = model.start_multi_process_pool(["cpu"] * workers)
+        try:
+            vectors = model.encode_multi_process(chunks, pool, batch_size=batch_size)
+        finally:
+            model.stop_multi_process_pool(pool)
+    else:
+        vectors = model.encode(chunks, batch_size=batch_size, show_progress_bar=False, convert_to_numpy=True)
+    return np.asarray(vectors, dtype="float32")
+
+def _save_npy(path, vectors):
+    # np.save() appends ".npy" to bare paths, so hand it an open file
+    with open(path, "wb") as f:
+        np.save(f, vectors)
+
+def _fsync(path: Path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def publish(texts, meta, vectors, manifest, index_type):
+    """
+    Writes every artifact into a new build directory, then points CURRENT
+    at it with one rename; readers see either the old build or the new one.
+    """
+    import faiss
+    from core.vector_index import build_index
+
+    index = build_index(vectors, index_type)
+
+    build_id = f"{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{uuid.uuid4().hex[:8]}"
+    builds = VECTOR_DIR / BUILDS_DIR
+    build_dir = builds / build_id
+    build_dir.mkdir(parents=True)
+    _save_npy(build_dir / VECTORS_FILE, vectors)
+    ChunkStore.write(build_dir / CHUNKS_FILE, texts, meta)
+    faiss.write_index(index, str(build_dir / INDEX_FILE))
+    (build_dir / MANIFEST_FILE).write_text(json.dumps({**manifest, "build_id": build_id}, indent=2))
+    for name in (VECTORS_FILE, INDEX_FILE, MANIFEST_FILE):
+        _fsync(build_dir / name)
+    _fsync(build_dir)
+
+    pointer = VECTOR_DIR / CURRENT_POINTER
+    tmp = pointer.with_name(pointer.name + ".tmp")
+    with open(tmp, "w") as f:
+        f.write(build_id + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, pointer)
+    _fsync(VECTOR_DIR)
+
+    # Build ids sort by time; drop all but the newest KEEP_BUILDS
+    for old in sorted(p.name for p in builds.iterdir() if p.is_dir())[:-KEEP_BUILDS]:
+        if old != build_id:
+            shutil.rmtree(builds / old, ignore_errors=True)
+    return build_id
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--full", action="store_true", help="re-embed every file")
+    parser.add_argument("--drop-legacy", action="store_true", help="drop chunks whose source file is not in knowledge_base/")
+    parser.add_argument("--workers", type=int, default=1, help="processes for parsing and embedding")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--index", choices=INDEX_TYPES, default=RETRIEVER_INDEX,
+                        help="ANN index family to build (default: RETRIEVER_INDEX)")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    from core.resources import EMBEDDING_MODEL_NAME
+    model_id = f"{EMBEDDING_MODEL_NAME}:fp32"
+    started = time.perf_counter()
+
+    manifest, old_texts, old_meta, old_vectors = load_previous_build()
+    files = scan_knowledge_base(KB_DIR)
+    reuse, embed, dropped = plan_build(manifest, files, model_id, args.full, args.drop_legacy)
+    # Without the previous vectors, kept sources (legacy ones included) are re-embedded from their texts
+    reembed = old_vectors is None and bool(reuse)
+
+    print(f"sources: {len(reuse)} unchanged, {len(embed)} to embed, {len(dropped)} dropped")
+    if reembed:
+        print(f"  previous vectors unavailable: re-embedding {sum(s['count'] for s in reuse)} kept chunks from their texts")
+    for key in embed:
+        print(f"  + {key}")
+    for key in dropped:
+        print(f"  - {key}")
+    if args.dry_run:
+        return
+    if (not embed and not dropped and manifest is not None and manifest.get("model") == model_id
+            and manifest.get("index", "flat") == args.index):
+        print("Index is up to date.")
+        return
+
+    # Parse + chunk changed files in parallel
+    parse_start = time.perf_counter()
+    jobs = [(str(files[key][0]), CHUNK_WORDS, CHUNK_OVERLAP) for key in embed]
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        parsed = list(pool.map(parse_file, jobs))
+    parse_s = time.perf_counter() - parse_start
+
+    new_chunks = [c for chunks in parsed for c in chunks]
+    kept_chunks = [t for src in reuse for t in old_texts[src["offset"]:src["offset"] + src["count"]]] if reembed else []
+    embed_start = time.perf_counter()
+    all_vectors = embed_chunks(kept_chunks + new_chunks, args.batch_size, args.workers)
+    kept_vectors, new_vectors = all_vectors[:len(kept_chunks)], all_vectors[len(kept_chunks):]
+    embed_s = time.perf_counter() - embed_start
+
+    # Assemble: unchanged sources first (previous order), then the new ones
+    texts, meta, parts, sources = [], [], [], []
+    for src in reuse:
+        lo, hi = src["offset"], src["offset"] + src["count"]
+        sources.append({**src, "offset": len(texts)})
+        if reembed:
+            parts.append(kept_vectors[len(texts):len(texts) + src["count"]])
+        else:
+            parts.append(old_vectors[lo:hi])
+        texts.extend(old_texts[lo:hi])
+        meta.extend(old_meta[lo:hi])
+    cursor = 0
+    for key, chunks in zip(embed, parsed):
+        path, sha = files[key]
+        sources.append({"key": key, "source": path.name, "sha256": sha, "offset": len(texts), "count": len(chunks)})
+        texts.extend(chunks)
+        meta.extend({"source": path.name, "path": key} for _ in chunks)
+        parts.append(new_vectors[cursor:cursor + len(chunks)])
+        cursor += len(chunks)
+
+    dim = all_vectors.shape[1]
+    vectors = np.concatenate([p for p in parts if len(p)] or [np.zeros((0, dim), dtype="float32")]).astype("float32")
+    new_manifest = {
+        "model": model_id,
+        "chunk_words": CHUNK_WORDS,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "total_chunks": len(texts),
+        "index": args.index,
+        "sources": sources,
+    }
+    build_id = publish(texts, meta, vectors, new_manifest, args.index)
+
+    total_s = time.perf_counter() - started
+    embedded = len(kept_chunks) + len(new_chunks)
+    rate = embedded / embed_s if embed_s > 0 else 0.0
+    print(f"parsed {len(embed)} files in {parse_s:.2f}s; embedded {embedded} chunks in {embed_s:.2f}s ({rate:.1f} chunks/s)")
+    print(f"index ({args.index}): {len(texts)} chunks total, build {build_id}; build time {total_s:.2f}s")
+
+if __name__ == "__main__":
+    main()
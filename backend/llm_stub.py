@@ -0,0 +1,158 @@
+"""
+Local Groq/OpenAI-compatible chat completions stub for exercising the LLM client.
+
+    python llm_stub.py --port 8001 --latency 0.3 --fail-rate 0.2
+    python llm_stub.py --latency llama-3.3-70b-versatile=6 --latency llama-3.1-8b-instant=0.4
+
+Then start the backend with LLM_BASE_URL=http://127.0.0.1:8001 (any
+GROQ_API_KEY works). Serves POST /openai/v1/chat/completions (the Groq SDK
+path) and /v1/chat/completions, streaming or not, with HTTP/1.1 keep-alive.
+Latency can be set globally or per model; --fail-rate answers that fraction
+of requests with a 503 and --rate-limit-every N answers every Nth with a 429
+(Retry-After: 0), so retries and fallbacks can be observed in /metrics.
+GET /stats returns request counts and the number of TCP connections opened.
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+REPLY = "I'm right here with you. What has been weighing on you the most today? [EXPRESSION: EMPATHETIC]"
+
+class StubState:
+    def __init__(self, latency, model_latency, fail_rate, rate_limit_every, reply):
+        self.latency = latency
+        self.model_latency = model_latency
+        self.fail_rate = fail_rate
+        self.rate_limit_every = rate_limit_every
+        self.reply = reply
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "connections": 0, "failed": 0, "rate_limited": 0, "by_model": {}}
+
+    def count(self, key, model=None):
+        with self.lock:
+            self.stats[key] += 1
+            if model is not None:
+                self.stats["by_model"][model] = self.stats["by_model"].get(model, 0) + 1
+            return self.stats[key]
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is visible in /stats
+    state = None
+
+    def setup(self):
+        super().setup()
+        self.state.count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.state.lock:
+                self._json(200, self.state.stats)
+        else:
+            self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._json(404, {"error": {"message": "not found"}})
+            return
+
+        model = request.get("model", "stub")
+        n = self.state.count("requests", model)
+        time.sleep(self.state.model_latency.get(model, self.state.latency))
+        if self.state.rate_limit_every and n % self.state.rate_limit_every == 0:
+            self.state.count("rate_limited")
+            self._json(429, {"error": {"message": "rate limited", "type": "rate_limit"}}, {"Retry-After": "0"})
+            return
+        if random.random() < self.state.fail_rate:
+            self.state.count("failed")
+            self._json(503, {"error": {"message": "stub overloaded", "type": "server_error"}})
+            return
+
+        completion_id = f"chatcmpl-stub-{n}"
+        created = int(time.time())
+        if request.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for word in self.state.reply.split(" "):
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+                self._chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            final = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            self._chunk(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+            self._chunk(b"data: [DONE]\n\n")
+            self._chunk(b"")
+            return
+
+        words = len(self.state.reply.split())
+        self._json(200, {
+            "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": self.state.reply},
+                         "finish_reason": "stop", "logprobs": None}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": words, "total_tokens": words},
+        })
+
+def parse_latency(values):
+    """['0.3', 'model=6'] -> (0.3, {'model': 6.0})"""
+    default, per_model = 0.0, {}
+    for value in values or []:
+        if "=" in value:
+            model, seconds = value.rsplit("=", 1)
+            per_model[model] = float(seconds)
+        else:
+            default = float(value)
+    return default, per_model
+
+def make_server(host="127.0.0.1", port=8001, latency=None, fail_rate=0.0, rate_limit_every=0, reply=REPLY):
+    default, per_model = parse_latency(latency)
+    handler = type("Handler", (StubHandler,), {
+        "state": StubState(default, per_model, fail_rate, rate_limit_every, reply)
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", action="append",
+                        help="seconds before answering; MODEL=SECONDS for one model (repeatable)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="answer every Nth request with 429")
+    parser.add_argument("--reply", default=REPLY)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.fail_rate, args.rate_limit_every, args.reply)
+    print(f"LLM stub listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
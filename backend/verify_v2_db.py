@@ -12,8 +12,8 @@ def test_v2_db():
     session_id = str(uuid.uuid4())
     print(f"Testing with Session ID: {session_id}")
     
-    # 1. Test Session Creation (Implicit in get_session)
-    print("Getting session (should create in DB)...")
+    # 1. Test Session Creation (get_session is in-memory; first write creates the row)
+    print("Getting session (should NOT touch DB)...")
     get_session(session_id)
     
     # Verify in DB
@@ -21,28 +21,24 @@ def test_v2_db():
     cur = conn.cursor()
     cur.execute("SELECT conversation FROM v2_chat_history WHERE id = %s", (session_id,))
     row = cur.fetchone()
-    if row:
-        conversation = row['conversation']
-        if isinstance(conversation, str): conversation = json.loads(conversation)
-        print(f"✅ Session found in v2_chat_history.")
-        if conversation == []:
-             print("✅ Initial conversation is empty list")
+    if not row:
+        print("✅ No row before first message")
     else:
-        print("❌ Session NOT found in v2_chat_history")
+        print("❌ Row created before any message was written")
+    conn.rollback()
         
     # 2. Test Message Addition
     print("Adding message 'Hello V2 Single Table'...")
     add_message(session_id, "user", "Hello V2 Single Table")
     
     # Verify in DB
-    cur.execute("SELECT conversation FROM v2_chat_history WHERE id = %s", (session_id,))
-    row = cur.fetchone()
-    if row:
-        conversation = row['conversation']
-        if isinstance(conversation, str): conversation = json.loads(conversation)
+    cur.execute("SELECT role, content FROM v2_chat_messages WHERE session_id = %s ORDER BY id", (session_id,))
+    rows = cur.fetchall()
+    if rows:
+        conversation = [dict(r) for r in rows]
         # Should be list with 1 item
         if len(conversation) > 0 and conversation[-1]['content'] == "Hello V2 Single Table":
-             print("✅ Message found in conversation JSON")
+             print("✅ Message found in v2_chat_messages")
         else:
              print(f"❌ Message NOT found or mismatch: {conversation}")
     
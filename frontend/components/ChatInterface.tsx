@@ -4,7 +4,7 @@ import React, { useState, useEffect, useRef } from 'react';
 import { v4 as uuidv4 } from 'uuid';
 import { motion, AnimatePresence } from 'framer-motion';
 import { Send, RotateCcw, FileText, Sparkles } from 'lucide-react';
-import { sendChatMessage, generateSummary, resetSession } from '@/lib/api';
+import { streamChatMessage, generateSummary, resetSession } from '@/lib/api';
 import { cn } from '@/lib/utils';
 import Image from 'next/image';
 
@@ -67,17 +67,27 @@ export default function ChatInterface() {
         setIsLoading(true);
 
         try {
-            // Optimistic update - keep current expression while thinking
-            const response = await sendChatMessage(sessionId, userMsg.content);
+            // Optimistic update - keep current expression while thinking.
+            // The bot message appears on the first streamed token and grows in place.
+            const botId = uuidv4();
+            let started = false;
+            const response = await streamChatMessage(sessionId, userMsg.content, (text) => {
+                if (!started) {
+                    started = true;
+                    setMessages(prev => [...prev, { id: botId, role: 'assistant', content: text }]);
+                } else {
+                    setMessages(prev => prev.map(m => m.id === botId ? { ...m, content: m.content + text } : m));
+                }
+            });
 
             const botMsg: Message = {
-                id: uuidv4(),
+                id: botId,
                 role: 'assistant',
                 content: response.reply,
                 expression: response.expression
             };
 
-            setMessages(prev => [...prev, botMsg]);
+            setMessages(prev => started ? prev.map(m => m.id === botId ? botMsg : m) : [...prev, botMsg]);
             setCurrentExpression(response.expression || 'NEUTRAL');
 
         } catch (error) {
@@ -23,7 +23,15 @@ export const sendChatMessage = async (sessionId: string, message: string): Promi
     return res.json();
 };
 
-export const generateSummary = async (sessionId: string): Promise<SummaryResponse> => {
+interface SummaryJob {
+    job_id: string;
+    status: 'queued' | 'running' | 'done' | 'failed';
+    summary?: string;
+    error?: string;
+}
+
+// POST /summary queues a background job; poll its status (long-polling) until it finishes
+export const generateSummary = async (sessionId: string, timeoutMs = 180000): Promise<SummaryResponse> => {
     const res = await fetch(`${API_URL}/summary`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
@@ -32,7 +40,18 @@ export const generateSummary = async (sessionId: string): Promise<SummaryRespons
         }),
     });
     if (!res.ok) throw new Error('Failed to generate summary');
-    return res.json();
+    let job = await res.json();
+    if (!job.job_id) return { status: job.status, summary: '' };
+
+    const deadline = Date.now() + timeoutMs;
+    while (job.status === 'queued' || job.status === 'running') {
+        if (Date.now() > deadline) throw new Error('Summary timed out');
+        const poll = await fetch(`${API_URL}/summary/${job.job_id}?wait=20`);
+        if (!poll.ok) throw new Error('Failed to fetch summary status');
+        job = (await poll.json()) as SummaryJob;
+    }
+    if (job.status !== 'done') throw new Error(job.error || 'Summary failed');
+    return { status: 'success', summary: job.summary || '' };
 };
 
 export const resetSession = async (sessionId: string) => {
@@ -46,3 +65,57 @@ export const resetSession = async (sessionId: string) => {
     if (!res.ok) throw new Error('Failed to reset session');
     return res.json();
 };
+
+// Streams a reply from /chat/stream (Server-Sent Events). onToken receives text
+// as it arrives; the promise resolves with the full reply and parsed expression.
+export const streamChatMessage = async (
+    sessionId: string,
+    message: string,
+    onToken: (text: string) => void,
+): Promise<ChatResponse> => {
+    const res = await fetch(`${API_URL}/chat/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+            session_id: sessionId,
+            message: message,
+        }),
+    });
+    if (!res.ok || !res.body) throw new Error('Failed to send message');
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let reply = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const raw = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            for (const line of raw.split('\n')) {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            if (!data) continue;
+            const payload = JSON.parse(data);
+
+            if (event === 'token') {
+                reply += payload.text;
+                onToken(payload.text);
+            } else if (event === 'expression') {
+                return { reply: payload.reply ?? reply, expression: payload.expression };
+            } else if (event === 'error') {
+                throw new Error(payload.error);
+            }
+        }
+    }
+    return { reply, expression: 'NEUTRAL' };
+};